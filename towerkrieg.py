@@ -1,8 +1,377 @@
+import math
+import random
+import warnings
+
+if __name__ == "__main__":
+    # python -m towerkrieg: runs the entry point of the module imported as towerkrieg, so the engine the commands
+    # import is loaded once rather than again as __main__
+    import towerkrieg
+    towerkrieg.main()
+    raise SystemExit
+
+
+# Unit directions of movement [row, col]
+DIRECTIONS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+# Squares (relative to the new center) that a piece enters when it takes one step in each direction
+LEADING_EDGE = {d: [(r, c) for r in range(-1, 2) for c in range(-1, 2)
+                    if abs(r + d[0]) > 1 or abs(c + d[1]) > 1] for d in DIRECTIONS}
+
+# Squares (relative to the center) that form the perimeter of a ring
+RING_PERIMETER = [(r, c) for r in range(-1, 2) for c in range(-1, 2) if (r, c) != (0, 0)]
+
+
+def _footprint_tables():
+    """
+    Tabulates the 512 occupancy patterns of a 3 x 3 footprint
+    Bit 3 * (r + 1) + (c + 1) of a pattern is set for a stone at offset (r, c) from the center
+
+    :return: moves   (per pattern, tuple of (direction, leading edge) for every direction permitted by the pattern)
+             stones  (per pattern, tuple of stone offsets in row-major order)
+    """
+
+    # Bits in increasing order are the offsets in row-major order, and those other than the center are the
+    # directions in the order of DIRECTIONS. A pattern extends the pattern without its lowest bit
+    offsets = [(r, c) for r in range(-1, 2) for c in range(-1, 2)]
+    moves, stones = [()], [()]
+    for pattern in range(1, 512):
+        rest = pattern & (pattern - 1)
+        offset = offsets[(pattern ^ rest).bit_length() - 1]
+        stones.append((offset,) + stones[rest])
+        moves.append(((offset, tuple(LEADING_EDGE[offset])),) + moves[rest] if offset != (0, 0) else moves[rest])
+    return tuple(moves), tuple(stones)
+
+
+# Maximum distances per pattern depend on the move limit and are tabulated by BoardConfig (limits)
+FOOTPRINT_MOVES, FOOTPRINT_STONES = _footprint_tables()
+
+
+def _zobrist_keys(seed=20, size=20):
+    """
+    Draws the Zobrist keys used to hash positions. A fixed seed keeps hashes stable across processes
+
+    :param seed: seed of the random number generator
+    :param size: number of rows and columns of the board
+    :return:     keys  (one 64-bit key per player and square, keys[player][row][col])
+                 turn  (64-bit key toggled when White is to move)
+    """
+
+    rng = random.Random(seed)
+    keys = {player: [[rng.getrandbits(64) for _ in range(size)] for _ in range(size)] for player in ('x', 'o')}
+    return keys, rng.getrandbits(64)
+
+
+# Zobrist keys per board size, drawn on first use. Those of the standard board are also ZOBRIST, ZOBRIST_TURN
+_ZOBRIST_SIZES = {}
+
+
+def zobrist_keys(size):
+    """
+    :param size: number of rows and columns of the board
+    :return:     keys, turn of the board size (see _zobrist_keys)
+    """
+
+    if size not in _ZOBRIST_SIZES:
+        _ZOBRIST_SIZES[size] = _zobrist_keys(size=size)
+    return _ZOBRIST_SIZES[size]
+
+
+def __getattr__(name):
+    # Module attributes built on first use: the Zobrist keys of the standard board
+    if name in ('ZOBRIST', 'ZOBRIST_TURN'):
+        return zobrist_keys(20)[name == 'ZOBRIST_TURN']
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+# Starting position of the standard 20 x 20 board. Black's / White's initial rings are centered on l3 / l18
+STANDARD_LAYOUT = ('....................',
+                   '..o.o.oooooooo.o.o..',
+                   '.ooo.o.oooo.o.o.ooo.',
+                   '..o.o.oooooooo.o.o..',
+                   '....................',
+                   '....................',
+                   '..o..o..o..o..o..o..',
+                   '....................',
+                   '....................',
+                   '....................',
+                   '....................',
+                   '....................',
+                   '....................',
+                   '..x..x..x..x..x..x..',
+                   '....................',
+                   '....................',
+                   '..x.x.xxxxxxxx.x.x..',
+                   '.xxx.x.xxxx.x.x.xxx.',
+                   '..x.x.xxxxxxxx.x.x..',
+                   '....................')
+
+
+def standard_layout(size):
+    """
+    Fits the standard starting position to a board of another size
+    The home rows and rings are kept; rows are added or removed in the empty middle of the board, and
+        columns are added or removed left of the rings
+
+    :param size: number of rows and columns of the board, at least 12
+    :return:     tuple of size strings of 'x', 'o' and '.', one per row
+    """
+
+    if size < 12:
+        raise ValueError(f'the standard layout needs a board of at least 12 x 12, not {size} x {size}')
+    half = min(8, size // 2)
+    rows = list(range(half)) + [8] * (size - 2 * half) + list(range(20 - half, 20))
+    left = min(6, size - 10)
+    cols = list(range(left)) + [6 + i % 4 for i in range(size - left - 10)] + list(range(10, 20))
+    return tuple(''.join(STANDARD_LAYOUT[row][col] for col in cols) for row in rows)
+
+
+def column_labels(size):
+    """
+    :param size: number of columns
+    :return:     notation of every column: 'a' to 'z', then 'aa', 'ab', ...
+    """
+
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    labels = list(letters[:size])
+    for first in letters:
+        for second in letters:
+            if len(labels) == size:
+                return labels
+            labels.append(first + second)
+    return labels
+
+
+def _reach_table(size, border):
+    """
+    Tabulates the centers a piece of each footprint pattern can move to
+    Any center of the playable area under border 'wipe'; under 'block', only those keeping the stones of the
+        footprint out of the border
+
+    :param size:   number of rows and columns, border included
+    :param border: 'wipe' or 'block'
+    :return:       per pattern, (rows, columns) ranges
+    """
+
+    inside = range(1, size - 1)
+    if border == 'wipe':
+        return ((inside, inside),) * 512
+    # Ranges are shared between the patterns with the same extent
+    spans = {}
+    reach = []
+    for stones in FOOTPRINT_STONES:
+        rows = [r for r, _ in stones] or [0]
+        cols = [c for _, c in stones] or [0]
+        for extent in ((min(rows), max(rows)), (min(cols), max(cols))):
+            if extent not in spans:
+                spans[extent] = range(max(1, 1 - extent[0]), min(size - 1, size - 1 - extent[1]))
+        reach.append((spans[min(rows), max(rows)], spans[min(cols), max(cols)]))
+    return tuple(reach)
+
+
+class BoardConfig():
+    """
+    Geometry and rule variant of a game: board size, starting layout, move limit of pieces without a center stone
+        and border behaviour
+    The outermost rows and columns form the border; pieces are centered on the playable area inside it
+    Configs are immutable and compare by value. Tables derived from the size and rules (Zobrist keys, notation,
+        footprint limits and reach) are built on first access, once per config, so importing the engine and
+        creating configs stays cheap
+    """
+
+    BORDERS = ('wipe', 'block')
+
+    # Tables built on first access by __getattr__
+    DERIVED = ('zobrist', 'zobrist_turn', 'columns', 'squares', 'limits', 'reach')
+
+    def __init__(self, size=20, layout=None, move_limit=3, border='wipe'):
+        """
+        :param size:       number of rows and columns, border included
+        :param layout:     starting position as size strings of 'x', 'o' and '.', one per row; None for the
+                           standard layout fitted to the size (see standard_layout)
+        :param move_limit: maximum distance of a piece without center stone
+        :param border:     'wipe' to remove the stones a move pushes into the border, 'block' to reject such moves
+        """
+
+        if size < 5:
+            raise ValueError(f'board must be at least 5 x 5, not {size} x {size}')
+        layout = standard_layout(size) if layout is None else tuple(layout)
+        if len(layout) != size or any(len(row) != size or set(row) - set('xo.') for row in layout):
+            raise ValueError(f'layout must be {size} strings of {size} x, o or . characters')
+        if layout[0] + layout[-1] + ''.join(row[0] + row[-1] for row in layout) != '.' * (4 * size):
+            raise ValueError('layout must leave the border empty')
+        if border not in self.BORDERS:
+            raise ValueError(f'border must be one of {self.BORDERS}, not {border!r}')
+
+        for name, value in (('size', size), ('layout', layout), ('move_limit', move_limit), ('border', border),
+                            # Centers of pieces: the playable area
+                            ('inside', range(1, size - 1))):
+            object.__setattr__(self, name, value)
+
+    def __getattr__(self, name):
+        # Called only for attributes not set yet: builds the derived tables on first access
+        if name not in self.DERIVED:
+            raise AttributeError(f'BoardConfig has no attribute {name!r}')
+        size = self.size
+        if name in ('zobrist', 'zobrist_turn'):
+            tables = dict(zip(('zobrist', 'zobrist_turn'), zobrist_keys(size)))
+        elif name in ('columns', 'squares'):
+            labels = column_labels(size)
+            # Notation of every square, in lower and upper case, for the fast path of convert_axes
+            squares = {}
+            for row in range(size):
+                for col, label in enumerate(labels):
+                    squares[label + str(size - row)] = squares[label.upper() + str(size - row)] = (row, col)
+            tables = {'columns': {label: col for col, label in enumerate(labels)}, 'squares': squares}
+        elif name == 'limits':
+            # Per footprint pattern, maximum distance
+            tables = {'limits': tuple(size if pattern & 16 else self.move_limit for pattern in range(512))}
+        elif name == 'reach':
+            # Per footprint pattern, rows and columns of the centers a piece can move to
+            tables = {'reach': _reach_table(size, self.border)}
+        for key, value in tables.items():
+            object.__setattr__(self, key, value)
+        return tables[name]
+
+    def __setattr__(self, name, value):
+        raise AttributeError('BoardConfig is immutable')
+
+    def __reduce__(self):
+        return BoardConfig, (self.size, self.layout, self.move_limit, self.border)
+
+    def __eq__(self, other):
+        return (isinstance(other, BoardConfig) and (self.size, self.layout, self.move_limit, self.border) ==
+                (other.size, other.layout, other.move_limit, other.border))
+
+    def __hash__(self):
+        return hash((self.size, self.layout, self.move_limit, self.border))
+
+    def __repr__(self):
+        return f'BoardConfig(size={self.size}, move_limit={self.move_limit}, border={self.border!r})'
+
+
+DEFAULT_CONFIG = BoardConfig()
+
+# Game status codes of a serialized GameState
+STATUS_CODES = {'incomplete': 0, 'black_victory': 1, 'white_victory': 2}
+
+
+class GameState():
+    """
+    Compact immutable snapshot of a position: packed board, player to move, game status and optional Zobrist hash
+    Bit row * size + col of black / white is set for a stone of that player
+    Being immutable, a state is shared rather than copied, and pickles as its to_bytes blob
+    """
+
+    __slots__ = ('black', 'white', 'turn', 'status', 'hash', 'size')
+
+    # Serialized layout: the playable squares of Black then White (18 x 18 bits, 81 bytes on the standard board),
+    #     flags (bit 0 White to move, bits 1-2 status code, bit 3 hash present) and the 64-bit hash (0 if absent)
+    # The size of a blob identifies the size of its board (see blob_bytes)
+    BOARD_BYTES = 81
+    BYTES = 90
+
+    def __init__(self, black, white, turn='x', status='incomplete', hash=None, size=20):
+        """
+        :param black:  bitboard of Black's stones
+        :param white:  bitboard of White's stones
+        :param turn:   player to move ('x' or 'o')
+        :param status: 'incomplete', 'black_victory' or 'white_victory'
+        :param hash:   Zobrist hash of the position, or None
+        :param size:   number of rows and columns of the board
+        """
+
+        for name, value in zip(self.__slots__, (black, white, turn, status, hash, size)):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('GameState is immutable')
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return GameState.from_bytes, (self.to_bytes(),)
+
+    def __eq__(self, other):
+        return (isinstance(other, GameState) and (self.black, self.white, self.turn, self.status, self.size) ==
+                (other.black, other.white, other.turn, other.status, other.size))
+
+    def __hash__(self):
+        return hash((self.black, self.white, self.turn, self.status))
+
+    def __repr__(self):
+        return f'GameState(turn={self.turn!r}, status={self.status!r}, hash={self.hash!r}, size={self.size})'
+
+    @staticmethod
+    def blob_bytes(size):
+        """
+        :param size: number of rows and columns of the board
+        :return:     board  (bytes of the packed playable squares)
+                     total  (bytes of the whole blob)
+        """
+
+        board = (2 * (size - 2) ** 2 + 7) // 8
+        return board, board + 9
+
+    def to_bytes(self):
+        """
+        Serializes the state into blob_bytes(size) bytes, GameState.BYTES on the standard board
+        Stones on the border cannot be serialized; they are wiped after every move
+
+        :return: bytes
+        """
+
+        width = self.size - 2
+        mask = (1 << width) - 1
+        packed = 0
+        for i, bits in enumerate((self.black, self.white)):
+            rows = 0
+            for row in range(1, width + 1):
+                rows |= (bits >> (row * self.size + 1) & mask) << (width * (row - 1))
+                bits &= ~(mask << (row * self.size + 1))
+            if bits:
+                raise ValueError('GameState with stones on the border cannot be serialized')
+            packed |= rows << (width * width * i)
+        flags = (self.turn == 'o') | STATUS_CODES[self.status] << 1 | (self.hash is not None) << 3
+        return (packed.to_bytes(self.blob_bytes(self.size)[0], 'little') + bytes((flags,))
+                + (self.hash or 0).to_bytes(8, 'little'))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        :param data: bytes created by to_bytes
+        :return:     GameState
+        """
+
+        board_bytes = len(data) - 9
+        width = math.isqrt(4 * board_bytes)
+        while width > 1 and cls.blob_bytes(width + 2)[0] > board_bytes:
+            width -= 1
+        if width < 3 or len(data) != cls.blob_bytes(width + 2)[1]:
+            raise ValueError(f'{len(data)} bytes are not the blob of a GameState')
+        size = width + 2
+        mask = (1 << width) - 1
+        packed = int.from_bytes(data[:board_bytes], 'little')
+        boards = []
+        for i in range(2):
+            rows = packed >> (width * width * i)
+            bits = 0
+            for row in range(1, width + 1):
+                bits |= (rows >> (width * (row - 1)) & mask) << (row * size + 1)
+            boards.append(bits)
+        flags = data[board_bytes]
+        status = [name for name, code in STATUS_CODES.items() if code == flags >> 1 & 3][0]
+        key = int.from_bytes(data[board_bytes + 1:], 'little') if flags & 8 else None
+        return cls(boards[0], boards[1], 'o' if flags & 1 else 'x', status, key, size)
+
 
 class LegalMove():
     """
     Tests proposed moves for correct cardinal direction and for obstacles in path
-    Called by propagate_board method in Class TowerkriegGame
+    Deprecated: TowerkriegGame no longer uses it and checks moves with the footprint tables instead. Kept for
+        existing scripts that import it; use TowerkriegGame.all_legal_moves or moves_available in new code
     """
     def __init__(self, gameboard, fp, fp_total, dir):
         """
@@ -14,6 +383,7 @@ class LegalMove():
         :param dir:       normalized direction of movement
         """
 
+        warnings.warn('LegalMove is deprecated; use TowerkriegGame.all_legal_moves', DeprecationWarning, 2)
         self._gb = gameboard
         self._fp = fp
         self._fp_total = fp_total
@@ -28,10 +398,7 @@ class LegalMove():
         :return:      True if legal cardinal direction, False otherwise
         """
 
-        if [s_row + self._dir[0], s_col + self._dir[1]] in self._fp:
-            return True
-        else:
-            return False
+        return [s_row + self._dir[0], s_col + self._dir[1]] in self._fp
 
     def validate_capture(self):
         """
@@ -41,17 +408,16 @@ class LegalMove():
         """
 
         for square in self._fp_total:
-            prop_sq = self._gb[ square[0] + self._dir[0] ][ square[1] + self._dir[1] ]
-            if [(square[0] + self._dir[0]), (square[1] + self._dir[1])] not in self._fp_total:
-                if prop_sq is not None:
-                    return True
+            prop_sq = self._gb[square[0] + self._dir[0]][square[1] + self._dir[1]]
+            if [square[0] + self._dir[0], square[1] + self._dir[1]] not in self._fp_total and prop_sq is not None:
+                return True
         return False
 
 
 class TowerkriegGame():
     """
     Implements Towerkrieg game
-    20 x 20-square board with 19 x 19-square playable area
+    20 x 20-square board with 18 x 18-square playable area, or the size and rule variant of a BoardConfig
     Player Black ('x') vs Player White ('o'). Play begins with Black's move
     Player's piece is composed of 3 x 3-square grid centered on the player-selected center stone
     Movement direction and distance is determined by configuration of piece
@@ -59,22 +425,32 @@ class TowerkriegGame():
     Win by eliminating your opponent's sole ring. Black's / White's initial rings at klm 2-4 / klm 17-19
     """
 
-    def __init__(self):
+    def __init__(self, state=None, config=None):
         """
         Initializes Player Black to 'x' and Player White to 'o'
         Initializes game board places players' stones in starting positions
-        Communicates with class LegalMove to validate cardinal direction and presence of obstacle in path
+
+        :param state:  GameState to start from instead of the starting position
+        :param config: BoardConfig of the board size and rules; None for the standard board, or for the
+                       standard rules on the board size of the state
 
         Private data members:
             _player_b
             _player_w
+            _attacks
+            _attacks_hash
             _board
+            _config
             _direction
             _footprint
             _footprint_none
             _footprint_total
             _game_state
+            _hash
+            _history
+            _moves
             _resign
+            _rings
             _turn
         """
 
@@ -82,37 +458,22 @@ class TowerkriegGame():
         self._player_b = 'x'
         self._player_w = 'o'
 
-        self.initialize_board()
+        if config is None:
+            config = DEFAULT_CONFIG if state is None or state.size == DEFAULT_CONFIG.size else BoardConfig(state.size)
+        self._config = config
+        self._attacks = None
+        self._attacks_hash = None
+        self._moves = None
+
+        if state is None:
+            self.initialize_board()
+        else:
+            self.set_state(state)
 
     def initialize_board(self):
-        # Initialize game board
-        self._board = [[None] * 20 for _ in range(20)]
-
-        # Define starting positions for Player Black
-        self._board[18][2] = self._board[18][4] = self._board[18][6] = self._board[18][7] = self._board[18][8] = \
-            self._board[18][9] = self._board[18][10] = self._board[18][11] = self._board[18][12] = \
-            self._board[18][13]= self._board[18][15] = self._board[18][17] = \
-            self._board[17][1] = self._board[17][2] = self._board[17][3] = self._board[17][5] = self._board[17][7] = \
-            self._board[17][8] = self._board[17][9] = self._board[17][10] = self._board[17][12] = \
-            self._board[17][14] = self._board[17][16] = self._board[17][17] = self._board[17][18] = \
-            self._board[16][2] = self._board[16][4] = self._board[16][6] = self._board[16][7] = self._board[16][8] = \
-            self._board[16][9] = self._board[16][10] = self._board[16][11] = self._board[16][12] = \
-            self._board[16][13] = self._board[16][15] = self._board[16][17] = \
-            self._board[13][2] = self._board[13][5] = self._board[13][8] = self._board[13][11] = \
-            self._board[13][14] = self._board[13][17] = self._player_b
-
-        # Define starting positions for Player White
-        self._board[1][2] = self._board[1][4] = self._board[1][6] = self._board[1][7] = self._board[1][8] = \
-            self._board[1][9] = self._board[1][10] = self._board[1][11] = self._board[1][12] = self._board[1][13]= \
-            self._board[1][15] = self._board[1][17] = \
-            self._board[2][1] = self._board[2][2] = self._board[2][3] = self._board[2][5] = self._board[2][7] = \
-            self._board[2][8] = self._board[2][9] = self._board[2][10] = self._board[2][12] = self._board[2][14] = \
-            self._board[2][16] = self._board[2][17] = self._board[2][18] = \
-            self._board[3][2] = self._board[3][4] = self._board[3][6] = self._board[3][7] = self._board[3][8] = \
-            self._board[3][9] = self._board[3][10] = self._board[3][11] = self._board[3][12] = self._board[3][13] = \
-            self._board[3][15] = self._board[3][17] = \
-            self._board[6][2] = self._board[6][5] = self._board[6][8] = self._board[6][11] = self._board[6][14] = \
-            self._board[6][17] = self._player_w
+        # Initialize game board and place players' stones in their starting positions
+        players = {'x': self._player_b, 'o': self._player_w, '.': None}
+        self._board = [[players[square] for square in row] for row in self._config.layout]
 
         # Initialize private data members
         self._direction = []
@@ -123,12 +484,109 @@ class TowerkriegGame():
         self._resign = False
         self._turn = 'x'
 
+        # Ring centers of both players, maintained incrementally as stones move
+        self._rings = self.find_rings(self._board)
+
+        # Undo stack of committed moves (see push_move)
+        self._history = []
+
+        # Zobrist hash of the position, maintained incrementally as stones move
+        self._hash = self.compute_hash(self._board, self._turn)
+
     def get_gameboard(self):
         return self._board
 
+    def get_config(self):
+        return self._config
+
+    def get_state(self, with_hash=True):
+        """
+        Exports the position
+
+        :param with_hash: include the Zobrist hash
+        :return:          GameState
+        """
+
+        size = self._config.size
+        bits = {self._player_b: 0, self._player_w: 0}
+        for row, squares in enumerate(self._board):
+            for col, square in enumerate(squares):
+                if square is not None:
+                    bits[square] |= 1 << (row * size + col)
+        return GameState(bits[self._player_b], bits[self._player_w], self._turn, self._game_state,
+                         self._hash if with_hash else None, size)
+
+    def set_state(self, state):
+        """
+        Sets up the position of a GameState. The undo stack is cleared
+
+        :param state: GameState of the game's board size
+        """
+
+        size = self._config.size
+        if state.size != size:
+            raise ValueError(f'GameState of a {state.size} x {state.size} board does not fit a {size} x {size} board')
+        self.initialize_board()
+        for row in range(size):
+            for col in range(size):
+                index = row * size + col
+                self._board[row][col] = (self._player_b if state.black >> index & 1 else
+                                         self._player_w if state.white >> index & 1 else None)
+        self._turn = state.turn
+        self._game_state = state.status
+        self._rings = self.find_rings(self._board)
+        self._hash = state.hash if state.hash is not None else self.compute_hash(self._board, self._turn)
+
+    def clone(self):
+        """
+        Copies the position into a new game of the same class, without the undo stack
+        The clone shares the move cache of the game (see get_move_cache)
+
+        :return: game
+        """
+
+        game = type(self)(self.get_state(), self._config)
+        # Move lists are keyed by position, so the clone can share the cache
+        game._moves = self._moves
+        return game
+
     def get_turn(self):
         return self._turn
 
+    def get_hash(self):
+        return self._hash
+
+    def compute_hash(self, board, turn):
+        """
+        Computes the Zobrist hash of a position from scratch
+
+        :param board: game board
+        :param turn:  player to move ('x' or 'o')
+        :return:      64-bit hash
+        """
+
+        keys = self._config.zobrist
+        key = self._config.zobrist_turn if turn == 'o' else 0
+        for row, squares in enumerate(board):
+            for col, square in enumerate(squares):
+                if square is not None:
+                    key ^= keys[square][row][col]
+        return key
+
+    def _rehash(self, squares):
+        """
+        Toggles the Zobrist keys of the stones currently on the given squares
+        Called once before and once after the squares change to update the hash incrementally
+
+        :param squares: squares about to change or just changed
+        """
+
+        keys = self._config.zobrist
+        for row, col in squares:
+            square = self._board[row][col]
+            if square is not None:
+                self._hash ^= keys[square][row][col]
+
     def resign(self):
         """
         Allows the current player to concede the game, giving the other player the win
@@ -174,10 +632,35 @@ class TowerkriegGame():
                     footprint_none.append([(s_row + r), (s_col + c)])
         return footprint, footprint_none
 
+    def footprint_pattern(self, board, row, col, player):
+        """
+        Packs the 3 x 3 footprint of a piece into a pattern index of the footprint tables
+
+        :param board:  game board
+        :param row:    row of the piece's center
+        :param col:    column of the piece's center
+        :param player: owner of the piece ('x' or 'o')
+        :return:       pattern of the player's stones (see _footprint_tables), -1 if the footprint holds an
+                       opponent's stone
+        """
+
+        pattern = 0
+        bit = 1
+        for r in range(row - 1, row + 2):
+            squares = board[r]
+            for c in range(col - 1, col + 2):
+                square = squares[c]
+                if square is not None:
+                    if square != player:
+                        return -1
+                    pattern |= bit
+                bit <<= 1
+        return pattern
+
     def convert_axes(self, starting, ending):
         """
         Converts user's alphanumeric entry to the coordinate system of the game
-        a20 corresponds to coordinate [0, 0] and t1 corresponds to [19, 19]
+        a20 corresponds to coordinate [0, 0] and t1 corresponds to [19, 19] on the standard board
 
         :param starting: coordinates of central stone in piece
         :param ending:   coordinates of proposed destination for piece
@@ -187,45 +670,182 @@ class TowerkriegGame():
                          e_col: ending column
         """
 
+        # Whole squares of the notation are looked up directly; other spellings are parsed
+        squares = self._config.squares
+        if starting in squares and ending in squares:
+            (s_row, s_col), (e_row, e_col) = squares[starting], squares[ending]
+            return s_row, s_col, e_row, e_col
+
         # Convert alphabetical column values to numbers
-        alpha_dict = {"a": 0, "b": 1, "c": 2, "d": 3, "e": 4,
-                      "f": 5, "g": 6, "h": 7, "i": 8, "j": 9,
-                      "k": 10, "l": 11, "m": 12, "n": 13, "o": 14,
-                      "p": 15, "q": 16, "r": 17, "s": 18, "t": 19}
+        alpha_dict = self._config.columns
+        s_label, e_label = starting.rstrip('0123456789'), ending.rstrip('0123456789')
 
-        s_col, e_col = alpha_dict[starting[0]], alpha_dict[ending[0]]
+        s_col, e_col = alpha_dict[s_label.lower()], alpha_dict[e_label.lower()]
 
         # Correct row entry for game axes system
-        s_row, e_row = (20 - int(starting[1:])), (20 - int(ending[1:]))
+        size = self._config.size
+        s_row, e_row = (size - int(starting[len(s_label):])), (size - int(ending[len(e_label):]))
         return s_row, s_col, e_row, e_col
 
-    def ring_scan(self, hyp_board):
+    def ring_at(self, board, row, col):
+        """
+        Tests whether an empty square is the center of a ring of 8 stones of one color
+
+        :param board: game board
+        :param row:   row of the proposed ring center (2 to 17 on the standard board)
+        :param col:   column of the proposed ring center (2 to 17 on the standard board)
+        :return:      owner of the ring ('x' or 'o'), None if there is no ring
+        """
+
+        if board[row][col] is not None:
+            return None
+        owner = board[row - 1][col - 1]
+        if owner is None:
+            return None
+        for r, c in RING_PERIMETER:
+            if board[row + r][col + c] != owner:
+                return None
+        return owner
+
+    def find_rings(self, board):
+        """
+        Scans the whole game board for rings of both players
+
+        :param board: game board
+        :return:      dictionary of the ring centers of each player, {'x': set(), 'o': set()}
+        """
+
+        rings = {self._player_b: set(), self._player_w: set()}
+        size = self._config.size
+        for row in range(2, size - 2):
+            for col in range(2, size - 2):
+                owner = self.ring_at(board, row, col)
+                if owner is not None:
+                    rings[owner].add((row, col))
+        return rings
+
+    def update_rings(self, board, rings, squares):
+        """
+        Re-evaluates only the ring centers next to squares whose contents changed
+
+        :param board:   game board after the change
+        :param rings:   dictionary of the ring centers of each player (see find_rings), updated in place
+        :param squares: changed squares
+        """
+
+        centers = set()
+        last = self._config.size - 2
+        for row, col in squares:
+            for r in range(max(row - 1, 2), min(row + 2, last)):
+                for c in range(max(col - 1, 2), min(col + 2, last)):
+                    centers.add((r, c))
+
+        for center in centers:
+            for player_rings in rings.values():
+                player_rings.discard(center)
+            owner = self.ring_at(board, center[0], center[1])
+            if owner is not None:
+                rings[owner].add(center)
+
+    def get_ring_count(self, player):
+        """
+        Returns the number of rings currently held by a player
+
+        :param player: 'x' or 'o'
+        :return:       number of rings
+        """
+        return len(self._rings[player])
+
+    def get_rings(self, player):
+        """
+        Returns the centers of a player's rings
+
+        :param player: 'x' or 'o'
+        :return:       list of (row, col) ring centers in row-major order
+        """
+        return sorted(self._rings[player])
+
+    def get_stone_count(self, player):
+        return sum(squares.count(player) for squares in self._board)
+
+    def get_attack_maps(self):
+        """
+        Returns the attack maps of the position (see towerkrieg_attacks.AttackMaps), brought up to date with the
+        moves made since the last call by recomputing only the rays next to the changed squares
+
+        :return: AttackMaps
+        """
+
+        if self._attacks is None:
+            import towerkrieg_attacks
+            self._attacks = towerkrieg_attacks.AttackMaps(self._config)
+        # The Zobrist hash spares the board scan of get_state while the position is unchanged
+        if self._attacks_hash != self._hash:
+            state = self.get_state(with_hash=False)
+            self._attacks.update(state.black, state.white)
+            self._attacks_hash = self._hash
+        return self._attacks
+
+    def ring_in_danger(self, player):
+        """
+        Tests whether the opponent's next move can hit one of a player's rings. The players' rings are not
+        evaluated for the opponent's move, as in all_legal_moves
+
+        :param player: 'x' or 'o'
+        :return:       True if a ring of the player can be hit
+        """
+        return self.get_attack_maps().ring_in_danger(player)
+
+    def get_attacker_count(self, player, row, col):
+        """
+        Returns the number of a player's pieces whose next move can capture the stone on a square
+
+        :param player: attacking player ('x' or 'o')
+        :param row:    row of the square
+        :param col:    column of the square
+        :return:       number of pieces
+        """
+        return self.get_attack_maps().get_attacker_count(player, row, col)
+
+    def count_stones_near(self, player, row, col, reach):
+        """
+        Counts a player's stones in the square area within reach of row / col
+
+        :param player: 'x' or 'o'
+        :param row:    row of the center of the area
+        :param col:    column of the center of the area
+        :param reach:  distance from the center to the edge of the area
+        :return:       number of stones
+        """
+
+        count = 0
+        for r in range(max(row - reach, 0), min(row + reach + 1, self._config.size)):
+            count += self._board[r][max(col - reach, 0):col + reach + 1].count(player)
+        return count
+
+    def is_capture(self, move):
+        """
+        Tests whether a move of the current player captures a stone of the opponent
+
+        :param move: ((s_row, s_col), (e_row, e_col)) in the coordinate system of the game
+        :return:     True if the last step of the move enters a square holding an opponent's stone
+        """
+
+        (s_row, s_col), (e_row, e_col) = move
+        d = ((e_row > s_row) - (e_row < s_row), (e_col > s_col) - (e_col < s_col))
+        if d == (0, 0):
+            return False
+        return any(self._board[e_row + r][e_col + c] not in (None, self._turn) for r, c in LEADING_EDGE[d])
+
+    def ring_verdict(self, x_ring_stat, y_ring_stat):
         """
-        Scans game board for presence of rings from both players
         Awards victory if the sole ring of an opponent is disrupted
-        Prevents moves that disrupt player's sole ring. In this case, the proposed (hypothetical)
-            game board is rejected
+        Prevents moves that disrupt player's sole ring
 
-        :param hyp_board: proposed (hypothetical) game board
-        :return:          False if player's move removes that player's sole ring
+        :param x_ring_stat: True if Black holds at least one ring
+        :param y_ring_stat: True if White holds at least one ring
+        :return:            False if player's move removes that player's sole ring
         """
-        x_ring_stat = False
-        y_ring_stat = False
-        for row in range(2,18):
-            for col in range(2,18):
-                if hyp_board[row][col] is None:
-                    per1 = [hyp_board[row + m][col + n] for m in [-1, 1] for n in range(-1, 2)]
-                    per2 = [hyp_board[row][col + n] for n in [-1, 1]]
-                    perimeter = per1 + per2
-
-                    x_ring = all(sq == 'x' for sq in perimeter)
-                    if x_ring is True:
-                        # Black ring identified
-                        x_ring_stat = True
-                    y_ring = all(sq == 'o' for sq in perimeter)
-                    if y_ring is True:
-                        # White ring identified
-                        y_ring_stat = True
 
         if x_ring_stat is True:
             # Black ring exists
@@ -253,6 +873,20 @@ class TowerkriegGame():
                 # Black's turn. Move disrupts Black's sole ring
                 return False
 
+    def ring_scan(self, hyp_board):
+        """
+        Scans game board for presence of rings from both players
+        Awards victory if the sole ring of an opponent is disrupted
+        Prevents moves that disrupt player's sole ring. In this case, the proposed (hypothetical)
+            game board is rejected
+        Full-board counterpart of the incremental ring tracking in propagate_board
+
+        :param hyp_board: proposed (hypothetical) game board
+        :return:          False if player's move removes that player's sole ring
+        """
+        rings = self.find_rings(hyp_board)
+        return self.ring_verdict(len(rings['x']) > 0, len(rings['o']) > 0)
+
     def propagate_board(self, s_row, s_col, e_row, e_col, ring_scan=True):
         """
         Propagates player's piece on a hypothetical game board, from starting to ending row / col
@@ -271,52 +905,50 @@ class TowerkriegGame():
         for i in self._board:
             hyp_board.append(list(i))
 
-        capture = False
+        # Rings of both players on the hypothetical board, updated step by step
+        rings = {player: set(centers) for player, centers in self._rings.items()}
+
+        d = tuple(self.direction)
+        # Bit of the footprint pattern holding the neighbour in the direction of travel
+        lead = 3 * (d[0] + 1) + d[1] + 1
 
         while [s_row, s_col] != [e_row, e_col]:
             # Repeat ONE BLOCK AT A TIME until we reach the destination row and column
-            footprint, footprint_none = self.make_footprint(hyp_board, s_row, s_col)
-            if footprint == [-1]:
+            pattern = self.footprint_pattern(hyp_board, s_row, s_col, self._turn)
+            if pattern < 0:
                 # Negative value signals failed footprint creation (i.e. mixed stone, not player's turn)
                 return False
-            footprint_total = footprint + footprint_none
-
-            # Check legality of move
-            legal_obj = LegalMove(hyp_board, footprint, footprint_total, self.direction)
-            cardinal = legal_obj.validate_cardinal(s_row, s_col)
 
-            # Tests for approved cardinal direction
-            if cardinal is False:
+            if not pattern >> lead & 1:
                 # Proposed cardinal direction is not permitted by the stone configuration
                 return False
-            else:
-                # Tests if the next step of the proposed move results in capture
-                capture = legal_obj.validate_capture()
-
-                if capture is True:
-                    if (s_row + self.direction[0], s_col + self.direction[1]) != (e_row, e_col):
-                        # Path to requested destination is blocked by stone. Move not allowed
-                        return False
-
-                # No capture on next step. Continue to propagate forward
-
-                # Propagate hypothetical board by one step
-                for stone in footprint:
-                    hyp_board[stone[0]][stone[1]] = None
-                for stone in footprint:
-                    hyp_board[stone[0] + self.direction[0]][stone[1] + self.direction[1]] = self._turn
-
-                for blank in footprint_none:
-                    hyp_board[blank[0] + self.direction[0]][blank[1] + self.direction[1]] = None
 
-                s_row, s_col = (s_row + self.direction[0]), (s_col + self.direction[1])
+            # Tests if the next step of the proposed move results in capture
+            row, col = s_row + d[0], s_col + d[1]
+            captured = [(row + r, col + c) for r, c in LEADING_EDGE[d] if hyp_board[row + r][col + c] is not None]
+            if captured and (row, col) != (e_row, e_col):
+                # Path to requested destination is blocked by stone. Move not allowed
+                return False
 
-                if ring_scan == True:
-                    # Check status of players' rings
-                    ring_stat = self.ring_scan(hyp_board)
-                    if ring_stat is False:
-                        # Fails ring scan (i.e. move disrupts player's sole ring)
-                        return False
+            # Propagate hypothetical board by one step
+            old = {(s_row + r, s_col + c) for r, c in FOOTPRINT_STONES[pattern]}
+            new = {(row + r, col + c) for r, c in FOOTPRINT_STONES[pattern]}
+            for r, c in captured:
+                hyp_board[r][c] = None
+            for r, c in old:
+                hyp_board[r][c] = None
+            for r, c in new:
+                hyp_board[r][c] = self._turn
+
+            s_row, s_col = row, col
+
+            if ring_scan == True:
+                # Check status of players' rings next to the changed squares
+                self.update_rings(hyp_board, rings, (old ^ new).union(captured))
+                ring_stat = self.ring_verdict(len(rings['x']) > 0, len(rings['o']) > 0)
+                if ring_stat is False:
+                    # Fails ring scan (i.e. move disrupts player's sole ring)
+                    return False
         return True
 
     def advance_board(self, s_row, s_col, e_row, e_col):
@@ -331,28 +963,34 @@ class TowerkriegGame():
         :return:      True at completion of move
         """
 
+        d = tuple(self.direction)
         while [s_row, s_col] != [e_row, e_col]:
             # Repeat ONE BLOCK AT A TIME until we reach the destination row and column
-            self._footprint, self._footprint_none = self.make_footprint(self._board, s_row, s_col)
-            self._footprint_total = self._footprint + self._footprint_none
+            pattern = self.footprint_pattern(self._board, s_row, s_col, self._turn)
+            row, col = s_row + d[0], s_col + d[1]
+            captured = [(row + r, col + c) for r, c in LEADING_EDGE[d] if self._board[row + r][col + c] is not None]
+            old = {(s_row + r, s_col + c) for r, c in FOOTPRINT_STONES[pattern]}
+            new = {(row + r, col + c) for r, c in FOOTPRINT_STONES[pattern]}
 
             # Move piece on game board, one step at a time
-            for stone in self._footprint:
-                self._board[stone[0]][stone[1]] = None
-            for stone in self._footprint:
-                self._board[stone[0] + self.direction[0]][stone[1] + self.direction[1]] = self._turn
-
-            for blank in self._footprint_none:
-                self._board[blank[0] + self.direction[0]][blank[1] + self.direction[1]] = None
-
-            s_row, s_col = (s_row + self.direction[0]), (s_col + self.direction[1])
+            changed = (old ^ new).union(captured)
+            self._rehash(changed)
+            for r, c in captured:
+                self._board[r][c] = None
+            for r, c in old:
+                self._board[r][c] = None
+            for r, c in new:
+                self._board[r][c] = self._turn
+            self._rehash(changed)
+            self.update_rings(self._board, self._rings, changed)
+
+            s_row, s_col = row, col
         return True
 
     def make_move(self, starting, ending, axes=0):
         """
         Moves player's 3x3 piece from starting position to ending (destination) position
-        Validates move via propagate_board method
-        Commits move via advance_board method
+        Validates and commits the move in place via push_move method
         Removes any stones in the margins
         Switches turn to next player
 
@@ -365,92 +1003,298 @@ class TowerkriegGame():
         if self._game_state in ['black_victory','white_victory']:
             return False
 
+        # Convert user's input to game axes system
+        if axes == 0: # axes = 1 from gui.py
+            s_row, s_col, e_row, e_col = self.convert_axes(starting, ending)
         else:
-            # Convert user's input to game axes system
-            if axes == 0: # axes = 1 from gui.py
-                s_row, s_col, e_row, e_col = self.convert_axes(starting, ending)
-            else:
-                s_row, s_col, e_row, e_col = starting[0], starting[1], ending[0], ending[1]
+            s_row, s_col, e_row, e_col = starting[0], starting[1], ending[0], ending[1]
 
-            # Test for user's input that is out-of-bounds
-            user_entry = [s_row, s_col, e_row, e_col]
-            for element in user_entry:
-                if element not in range(1, 19):
-                    return False
+        return self.push_move(((s_row, s_col), (e_row, e_col)))
 
-            # Calculate magnitude of requested move in y and x axes
-            move_y = abs(s_row - e_row)
-            move_x = abs(e_col - s_col)
+    def push_move(self, move):
+        """
+        Applies a move to the game board in place and records it on the undo stack
+        The move is validated step by step while it is applied. A rejected move is rolled back
 
-            # Normalize movement values and resolve into unit direction
-            if move_y != 0:
-                norm_y = int((e_row - s_row) / abs(e_row - s_row))
-            else:
-                norm_y = 0
-            if move_x != 0:
-                norm_x = int((e_col - s_col) / abs(e_col - s_col))
-            else:
-                norm_x = 0
+        :param move: ((s_row, s_col), (e_row, e_col)) in the coordinate system of the game
+        :return:     True if move completed successfully; False otherwise
+        """
+
+        if self._game_state in ['black_victory', 'white_victory']:
+            return False
 
-            self.direction = [norm_y, norm_x]
+        (s_row, s_col), (e_row, e_col) = move
+        config = self._config
+
+        # Test for move that is out-of-bounds
+        for element in (s_row, s_col, e_row, e_col):
+            if element not in config.inside:
+                return False
+
+        # Resolve requested move into unit direction and number of steps
+        move_y, move_x = e_row - s_row, e_col - s_col
+        self.direction = [(move_y > 0) - (move_y < 0), (move_x > 0) - (move_x < 0)]
+        d = tuple(self.direction)
+        steps = max(abs(move_y), abs(move_x))
+        if (s_row + d[0] * steps, s_col + d[1] * steps) != (e_row, e_col):
+            # Destination does not lie on one of the 8 lines through the starting square
+            return False
 
+        board = self._board
+        footprint = []
+        if steps != 0:
             # Tests for requested move exceeding 3-block limit (no center stone)
-            if self._board[s_row][s_col] is None:
-                # No central stone. Move limited to 3 spaces maximum
-                if abs(max(move_y, move_x)) > 3:
-                    # Requested move > 3 for piece without central stone
-                    return False
+            if board[s_row][s_col] is None and steps > config.move_limit:
+                return False
 
-            # Validate move using hypothetical board
-            advance = self.propagate_board(s_row, s_col, e_row, e_col)
+            pattern = self.footprint_pattern(board, s_row, s_col, self._turn)
+            if pattern < 0 or not pattern >> (3 * (d[0] + 1) + d[1] + 1) & 1:
+                # Mixed stones, not the player's turn, or direction not permitted by the stone configuration
+                return False
+            footprint = [(s_row + r, s_col + c) for r, c in FOOTPRINT_STONES[pattern]]
+
+        # Undo entry: start, direction, steps taken, moved stones, captured stones, wiped border stones,
+        # previous turn, previous game state and previous hash
+        entry = [(s_row, s_col), d, 0, footprint, [], [], self._turn, self._game_state, self._hash]
+        stones = entry[3]
+
+        row, col = s_row, s_col
+        for step in range(1, steps + 1):
+            row, col = row + d[0], col + d[1]
+
+            # Stones in the squares entered by the piece are captured, which is only allowed on the last step
+            captured = []
+            for r, c in LEADING_EDGE[d]:
+                if board[row + r][col + c] is not None:
+                    captured.append((row + r, col + c, board[row + r][col + c]))
+            if captured and step != steps:
+                # Path to requested destination is blocked by stone. Move not allowed
+                self._undo(entry)
+                return False
 
-            if advance is True:
-                # Propagation scan looks good. Advance on the actual game board
-                self.advance_board(s_row, s_col, e_row, e_col)
-            else:
-                # Propagation scan found an issue. Stay put and don't advance game board
+            # Advance piece by one step
+            old = {(r + d[0] * (step - 1), c + d[1] * (step - 1)) for r, c in stones}
+            new = {(r + d[0] * step, c + d[1] * step) for r, c in stones}
+            changed = (old ^ new).union((r, c) for r, c, _ in captured)
+            self._rehash(changed)
+            for r, c, _ in captured:
+                board[r][c] = None
+            for r, c in old:
+                board[r][c] = None
+            for r, c in new:
+                board[r][c] = self._turn
+            self._rehash(changed)
+            entry[2] = step
+            entry[4] = captured
+
+            # Check status of players' rings next to the changed squares
+            self.update_rings(board, self._rings, changed)
+            if self.ring_verdict(len(self._rings['x']) > 0, len(self._rings['o']) > 0) is False:
+                # Fails ring scan (i.e. move disrupts player's sole ring)
+                self._undo(entry)
                 return False
 
-            # Wipe-out stones in the border zone
-            for i in (0, 19):
-                for j in range(20):
-                    self._board[i][j] = None
-                    self._board[j][i] = None
+        # Wipe-out stones in the border zone. Only the moved piece can have reached it
+        edge = config.size - 1
+        for r, c in stones:
+            r, c = r + d[0] * steps, c + d[1] * steps
+            if r in (0, edge) or c in (0, edge):
+                if config.border == 'block':
+                    # Rule variant: pieces cannot push stones into the border
+                    self._undo(entry)
+                    return False
+                entry[5].append((r, c, board[r][c]))
+                self._hash ^= config.zobrist[board[r][c]][r][c]
+                board[r][c] = None
 
-            # Switch player turn
-            if self._turn == 'x':
-                self._turn = 'o'
-            else:
-                self._turn = 'x'
+        # Switch player turn
+        if self._turn == 'x':
+            self._turn = 'o'
+        else:
+            self._turn = 'x'
+        self._hash ^= config.zobrist_turn
+
+        self._history.append(tuple(entry))
+        if self._moves is not None and self._moves.holds(entry[8]):
+            self._moves.carry(entry[8], self._hash, self._entry_squares(entry))
         return True
 
+    def pop_move(self):
+        """
+        Takes back the last move committed by make_move or push_move
+
+        :return: ((s_row, s_col), (e_row, e_col)) of the move taken back, None if no move has been made
+        """
+
+        if not self._history:
+            return None
+        entry = self._history.pop()
+        key = self._hash
+        self._undo(entry)
+        if self._moves is not None and self._moves.holds(key):
+            self._moves.carry(key, self._hash, self._entry_squares(entry))
+        (s_row, s_col), d, steps = entry[0], entry[1], entry[2]
+        return (s_row, s_col), (s_row + d[0] * steps, s_col + d[1] * steps)
+
+    def _undo(self, entry):
+        """
+        Restores the game board, turn, game state and hash recorded in an undo entry
+
+        :param entry: undo entry created by push_move
+        """
+
+        board = self._board
+        _, d, steps, stones, captured, _, turn, game_state, key = entry
+
+        # Wiped border stones were part of the moved piece, which is lifted as a whole
+        changed = set()
+        for r, c in stones:
+            board[r + d[0] * steps][c + d[1] * steps] = None
+            changed.add((r + d[0] * steps, c + d[1] * steps))
+        for r, c, player in captured:
+            board[r][c] = player
+            changed.add((r, c))
+        for r, c in stones:
+            board[r][c] = turn
+            changed.add((r, c))
+
+        self.update_rings(board, self._rings, changed)
+        self._turn = turn
+        self._game_state = game_state
+        self._hash = key
+
+    def _entry_squares(self, entry):
+        # Bitboard (row * size + col) of the squares changed by the move of an undo entry
+        size = self._config.size
+        _, d, steps, stones, captured = entry[:5]
+        squares = 0
+        for r, c in stones:
+            squares |= 1 << (r * size + c) | 1 << ((r + d[0] * steps) * size + c + d[1] * steps)
+        for r, c, _ in captured:
+            squares |= 1 << (r * size + c)
+        return squares
+
+    def cast_rays(self, board, row, col, player):
+        """
+        Casts one ray from the piece centered on row / col in every direction permitted by its footprint
+        A ray stops at the first capture, at the edge of the playable area (under border 'block', before a stone of
+            the footprint enters the border), or after the move limit of a piece without center stone. The players'
+            rings are not evaluated
+
+        :param board:  game board
+        :param row:    row of the piece's center
+        :param col:    column of the piece's center
+        :param player: owner of the piece ('x' or 'o')
+        :return:       list of (row, col) destinations
+        """
+
+        inside = self._config.inside
+        if row not in inside or col not in inside:
+            return []
+
+        # Footprint must not contain stones of the opponent
+        pattern = self.footprint_pattern(board, row, col, player)
+        if pattern < 0:
+            return []
+
+        limit = self._config.limits[pattern]
+        rows, cols = self._config.reach[pattern]
+
+        moves = []
+        for d, edge in FOOTPRINT_MOVES[pattern]:
+            r, c = row, col
+            for _ in range(limit):
+                r, c = r + d[0], c + d[1]
+                if r not in rows or c not in cols:
+                    break
+                moves.append((r, c))
+                if any(board[r + i][c + j] is not None for i, j in edge):
+                    # Step captures a stone. Piece cannot move beyond it
+                    break
+        return moves
+
+    def _cast_rays(self, row, col, player):
+        return self.cast_rays(self._board, row, col, player)
+
     def moves_available(self, row, col):
-        moves = []      # Initializes list containing legal moves given selected row and col
-        for r, pieces_row in enumerate(self._board):
-            for c, piece in enumerate(pieces_row):
-                # Hypothetical move from selected row and col to current iterator of r and c
-                move_y = abs(row - r)
-                move_x = abs(col - c)
-                if self._board[row][col] is None:
-                    if abs(max(move_y, move_x)) > 3:
-                        # Violates rule against moving a piece with no center stone > 3 places
-                        continue
-
-                if move_y != 0:
-                    norm_y = int((r - row) / abs(r - row))
-                else:
-                    norm_y = 0
-                if move_x != 0:
-                    norm_x = int((c - col) / abs(c - col))
-                else:
-                    norm_x = 0
+        """
+        Lists the destinations of the current player's piece centered on row / col
+        Like propagate_board with ring_scan=False, the players' rings are not evaluated
+        Move lists are cached by position, so repeated queries on an unchanged position are lookups
+
+        :param row: row of the piece's center
+        :param col: column of the piece's center
+        :return:    list of (row, col) destinations in row-major order
+        """
 
-                self.direction = [norm_y, norm_x]
+        cache = self.get_move_cache()
+        moves = cache.probe(self._hash, self._turn, row, col)
+        if moves is None:
+            moves = self._cast_rays(row, col, self._turn)
+            moves.sort()
+            if row in self._config.inside and col in self._config.inside:
+                cache.store(self._hash, self._turn, row, col, moves)
+        return list(moves)
 
-                try:
-                    if self.propagate_board(row, col, r, c, ring_scan=False) and (row, col) != (r, c):
-                        moves.append((r, c))
-                except:
-                    pass
+    def get_move_cache(self):
+        """
+        Returns the cache of moves_available (see towerkrieg_moves.MoveCache), created on first use
+        Its move lists are carried over by push_move and pop_move, and hits / misses are counted by get_stats
+
+        :return: MoveCache
+        """
+
+        if self._moves is None:
+            import towerkrieg_moves
+            self._moves = towerkrieg_moves.MoveCache(self._config.size)
+        return self._moves
+
+    def all_legal_moves(self, player):
+        """
+        Lists every move of a player in one pass over the board. The players' rings are not evaluated
+
+        :param player: 'x' or 'o'
+        :return:       list of ((s_row, s_col), (e_row, e_col)) moves in row-major order
+        """
+
+        # Only squares next to one of the player's stones can center a piece
+        centers = set()
+        last = self._config.size - 1
+        for r, squares in enumerate(self._board):
+            for c, square in enumerate(squares):
+                if square == player:
+                    for i in range(max(r - 1, 1), min(r + 2, last)):
+                        for j in range(max(c - 1, 1), min(c + 2, last)):
+                            centers.add((i, j))
+
+        moves = []
+        for start in sorted(centers):
+            for end in sorted(self.cast_rays(self._board, start[0], start[1], player)):
+                moves.append((start, end))
         return moves
 
+
+# Batch commands of python -m towerkrieg: module whose main(argv) runs the command, imported when it is run
+COMMANDS = {'bench': 'towerkrieg_bench',
+            'perft': 'towerkrieg_perft',
+            'replay': 'towerkrieg_archive',
+            'selfplay': 'towerkrieg_selfplay',
+            'serve': 'towerkrieg_server',
+            'tournament': 'towerkrieg_tournament'}
+
+
+def main(argv=None):
+    """
+    Entry point of python -m towerkrieg: runs a batch command of COMMANDS with the remaining arguments
+    Only the rules engine and the module of the command are imported, never tkinter
+
+    :param argv: command and its arguments, sys.argv[1:] if None
+    """
+
+    import argparse
+    import importlib
+    parser = argparse.ArgumentParser(prog='python -m towerkrieg', description='Runs Towerkrieg batch jobs')
+    parser.add_argument('command', choices=sorted(COMMANDS), help='command; see python -m towerkrieg COMMAND -h')
+    parser.add_argument('arguments', nargs=argparse.REMAINDER, help='arguments of the command')
+    args = parser.parse_args(argv)
+    importlib.import_module(COMMANDS[args.command]).main(args.arguments, prog=f'python -m towerkrieg {args.command}')
@@ -0,0 +1,315 @@
+import collections
+import itertools
+import sys
+import time
+
+import towerkrieg
+import towerkrieg_bitboard
+
+# Archive format: one game per line, its moves as start-end pairs in the notation of convert_axes (e.g. k3-k5)
+# separated by white space. Empty lines and lines starting with # are skipped. Files ending in .gz are
+# decompressed on the fly, and - reads standard input
+
+
+def read_games(path):
+    """
+    Streams the games of an archive
+
+    :param path: archive file, or - for standard input
+    :return:     generator of (line number, list of move tokens)
+    """
+
+    if path == '-':
+        lines = sys.stdin
+    elif path.endswith('.gz'):
+        # Imported on demand: gzip pulls in zlib and struct, which plain archives and the workers do not need
+        import gzip
+        lines = gzip.open(path, 'rt')
+    else:
+        lines = open(path)
+    try:
+        for number, line in enumerate(lines, 1):
+            tokens = line.split()
+            if tokens and not tokens[0].startswith('#'):
+                yield number, tokens
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+
+
+def chunked(iterable, size):
+    """
+    :param iterable: any iterable
+    :param size:     items per chunk
+    :return:         generator of lists of up to size consecutive items
+    """
+
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def format_game(moves, config=towerkrieg.DEFAULT_CONFIG):
+    """
+    Writes a game as an archive line
+
+    :param moves:  list of ((s_row, s_col), (e_row, e_col)) moves
+    :param config: BoardConfig of the game
+    :return:       line of start-end pairs, without line break
+    """
+
+    labels = list(config.columns)
+    return ' '.join(f'{labels[s_col]}{config.size - s_row}-{labels[e_col]}{config.size - e_row}'
+                    for (s_row, s_col), (e_row, e_col) in moves)
+
+
+def replay(tokens, game_class=towerkrieg_bitboard.BitboardTowerkriegGame, config=towerkrieg.DEFAULT_CONFIG):
+    """
+    Replays the moves of a game through make_move, up to the first move that cannot be played
+
+    :param tokens:     move tokens of the game
+    :param game_class: game backend
+    :param config:     BoardConfig of the games
+    :return:           status      (game status after the last move played)
+                       moves       (number of moves played)
+                       captures    (list of (ply, opponent's stones captured) of the capturing moves)
+                       rings       (list of (ply, player) of the rings formed, one entry per new ring centre)
+                       error       ((ply, token, reason) of the move that could not be played, None if all were)
+    """
+
+    game = game_class(config=config)
+    captures, rings = [], []
+    ring_centres = {side: set(game.get_rings(side)) for side in ('x', 'o')}
+    for ply, token in enumerate(tokens, 1):
+        if game.get_status() != 'incomplete':
+            return game.get_status(), ply - 1, captures, rings, (ply, token, 'game over')
+        starting, _, ending = token.partition('-')
+        try:
+            s_row, s_col, e_row, e_col = game.convert_axes(starting, ending)
+        except (KeyError, ValueError):
+            return game.get_status(), ply - 1, captures, rings, (ply, token, 'notation')
+        move = ((s_row, s_col), (e_row, e_col))
+        player = game.get_turn()
+        opponent = 'o' if player == 'x' else 'x'
+        capture = game.is_capture(move)
+        if capture:
+            stones = game.get_stone_count(opponent)
+        if not game.make_move(move[0], move[1], 1):
+            return game.get_status(), ply - 1, captures, rings, (ply, token, 'illegal')
+        if capture:
+            captures.append((ply, stones - game.get_stone_count(opponent)))
+        # New centres rather than the change in the count: a move can form one ring while breaking another.
+        # A ring carried by the moved piece keeps its centre relative to the piece, so it is not a new ring
+        for side in ring_centres:
+            centres = set(game.get_rings(side))
+            formed = centres - ring_centres[side]
+            if side == player and move[0] in ring_centres[side]:
+                formed.discard(move[1])
+            rings.extend((ply, side) for _ in formed)
+            ring_centres[side] = centres
+    return game.get_status(), len(tokens), captures, rings, None
+
+
+class ArchiveStats():
+    """
+    Statistics of the games of an archive, aggregated incrementally: the memory they take does not depend on the
+    number of games. Stats of separate parts of an archive are combined with merge
+    """
+
+    # Width of the game length histogram bins, in moves
+    BIN = 10
+
+    def __init__(self, examples=10):
+        """
+        :param examples: unplayable moves kept as examples, those of the earliest lines
+        """
+
+        self.examples = examples
+        self.games = 0
+        self.moves = 0
+        self.results = collections.Counter()
+        self.lengths = collections.Counter()
+        self.shortest = None
+        self.longest = 0
+        self.capture_moves = 0
+        self.captured = 0
+        self.games_with_capture = 0
+        self.rings_formed = {'x': 0, 'o': 0}
+        self.ring_plies = {'x': 0, 'o': 0}
+        self.first_rings = {'x': 0, 'o': 0}
+        self.first_ring_plies = {'x': 0, 'o': 0}
+        self.errors = collections.Counter()
+        self.error_examples = []
+        self.seconds = 0.0
+
+    def add(self, line, status, moves, captures, rings, error):
+        """
+        Adds a game replayed by replay
+
+        :param line: line number of the game in the archive
+        """
+
+        self.games += 1
+        self.moves += moves
+        self.results[status] += 1
+        self.lengths[moves // self.BIN * self.BIN] += 1
+        self.shortest = moves if self.shortest is None else min(self.shortest, moves)
+        self.longest = max(self.longest, moves)
+        self.capture_moves += len(captures)
+        self.captured += sum(stones for _, stones in captures)
+        self.games_with_capture += len(captures) > 0
+        first = {}
+        for ply, player in rings:
+            self.rings_formed[player] += 1
+            self.ring_plies[player] += ply
+            first.setdefault(player, ply)
+        for player, ply in first.items():
+            self.first_rings[player] += 1
+            self.first_ring_plies[player] += ply
+        if error is not None:
+            self.errors[error[2]] += 1
+            if len(self.error_examples) < self.examples:
+                self.error_examples.append((line,) + error)
+
+    def merge(self, other):
+        """
+        Adds the games of other stats
+
+        :param other: ArchiveStats
+        :return:      self
+        """
+
+        self.games += other.games
+        self.moves += other.moves
+        self.results.update(other.results)
+        self.lengths.update(other.lengths)
+        if other.shortest is not None:
+            self.shortest = other.shortest if self.shortest is None else min(self.shortest, other.shortest)
+        self.longest = max(self.longest, other.longest)
+        self.capture_moves += other.capture_moves
+        self.captured += other.captured
+        self.games_with_capture += other.games_with_capture
+        for player in self.rings_formed:
+            self.rings_formed[player] += other.rings_formed[player]
+            self.ring_plies[player] += other.ring_plies[player]
+            self.first_rings[player] += other.first_rings[player]
+            self.first_ring_plies[player] += other.first_ring_plies[player]
+        self.errors.update(other.errors)
+        self.error_examples = sorted(self.error_examples + other.error_examples)[:self.examples]
+        return self
+
+    def summary(self):
+        """
+        :return: report text
+        """
+
+        games = self.games or 1
+        lines = [f'{self.games} games, {self.moves} moves in {self.seconds:.1f} s: '
+                 f'{self.games / self.seconds if self.seconds > 0 else 0.0:.0f} games/s',
+                 f'Black wins {self.results["black_victory"] / games:.1%}, '
+                 f'White wins {self.results["white_victory"] / games:.1%}, '
+                 f'unfinished {self.results["incomplete"] / games:.1%}',
+                 f'Length: mean {self.moves / games:.1f}, shortest {self.shortest or 0}, longest {self.longest}']
+        for start, count in sorted(self.lengths.items()):
+            lines.append(f'{start:>6}-{start + self.BIN - 1:<6}{count:>10}  {"#" * round(40 * count / games)}')
+        lines.append(f'Captures: {self.capture_moves / (self.moves or 1):.2%} of moves, '
+                     f'{self.captured} stones, in {self.games_with_capture / games:.1%} of games')
+        for player, name in (('x', 'Black'), ('o', 'White')):
+            formed, first = self.rings_formed[player], self.first_rings[player]
+            line = f'{name} rings formed: {formed}'
+            if formed:
+                line += (f', mean ply {self.ring_plies[player] / formed:.1f}, first in {first / games:.1%} of '
+                         f'games at mean ply {self.first_ring_plies[player] / first:.1f}')
+            lines.append(line)
+        lines.append(f'Unplayable moves: {sum(self.errors.values())} '
+                     f'({", ".join(f"{reason} {count}" for reason, count in sorted(self.errors.items())) or "none"})')
+        for line, ply, token, reason in self.error_examples:
+            lines.append(f'    line {line}, move {ply} {token}: {reason}')
+        return '\n'.join(lines)
+
+
+def _analyse_chunk(task):
+    # Runs in a worker process: replays a chunk of games into stats of their own
+    games, game_class, config, examples = task
+    stats = ArchiveStats(examples)
+    for line, tokens in games:
+        stats.add(line, *replay(tokens, game_class, config))
+    return stats
+
+
+def analyse(path, workers=1, chunk_size=256, game_class=towerkrieg_bitboard.BitboardTowerkriegGame,
+            config=towerkrieg.DEFAULT_CONFIG, examples=10, report=None):
+    """
+    Streams an archive through replay in chunks of games, across a process pool if workers > 1
+    At most two chunks per worker are in flight, so memory stays constant however large the archive is
+
+    :param path:       archive file, or - for standard input
+    :param workers:    worker processes, games are replayed in this process if 1
+    :param chunk_size: games per chunk
+    :param game_class: game backend
+    :param config:     BoardConfig of the games
+    :param examples:   unplayable moves kept as examples
+    :param report:     callable receiving the stats after every chunk
+    :return:           ArchiveStats
+    """
+
+    stats = ArchiveStats(examples)
+    start = time.perf_counter()
+    tasks = ((chunk, game_class, config, examples) for chunk in chunked(read_games(path), chunk_size))
+
+    def record(result):
+        stats.merge(result)
+        stats.seconds = time.perf_counter() - start
+        if report is not None:
+            report(stats)
+
+    if workers == 1:
+        for task in tasks:
+            record(_analyse_chunk(task))
+    else:
+        import concurrent.futures
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = set()
+            for task in tasks:
+                pending.add(pool.submit(_analyse_chunk, task))
+                if len(pending) >= 2 * workers:
+                    done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        record(future.result())
+            for future in concurrent.futures.as_completed(pending):
+                record(future.result())
+    stats.seconds = time.perf_counter() - start
+    return stats
+
+
+def main(argv=None, prog=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog=prog,
+                                     description='Replays an archive of Towerkrieg games and reports its statistics')
+    parser.add_argument('archive', help='one game per line of start-end moves (e.g. k3-k5); .gz or - for stdin')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--chunk-size', type=int, default=256, help='games per task of a worker')
+    parser.add_argument('--size', type=int, default=20, help='board size of the games')
+    parser.add_argument('--backend', choices=['list', 'bitboard'], default='bitboard')
+    parser.add_argument('--examples', type=int, default=10, help='unplayable moves listed in the report')
+    parser.add_argument('--progress', action='store_true', help='report the games replayed so far on stderr')
+    args = parser.parse_args(argv)
+
+    game_class = towerkrieg.TowerkriegGame if args.backend == 'list' else towerkrieg_bitboard.BitboardTowerkriegGame
+    config = towerkrieg.DEFAULT_CONFIG if args.size == 20 else towerkrieg.BoardConfig(args.size)
+
+    def progress(stats):
+        print(f'\r{stats.games} games, {stats.moves} moves', end='', file=sys.stderr, flush=True)
+
+    stats = analyse(args.archive, args.workers, args.chunk_size, game_class, config, args.examples,
+                    progress if args.progress else None)
+    if args.progress:
+        print(file=sys.stderr)
+    print(stats.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+import towerkrieg
+import towerkrieg_bitboard
+
+
+def _dilate(bits, board):
+    # Squares within one step of a stone of the bitboard
+    dilated = bits
+    for step in board.shifts.values():
+        dilated |= bits << step if step >= 0 else bits >> -step
+    return dilated
+
+
+class AttackMaps():
+    """
+    Per-player attack maps of a position: for every square, the pieces of a player whose next move can capture
+    the stone on it, and for every ring, whether the opponent can hit it in one move
+    Like all_legal_moves, the maps follow the rays of cast_rays and do not evaluate the players' rings, so a
+        capture counted here may still be rejected by the ring verdict
+    The maps are brought up to date from bitboard snapshots (see update): only the pieces whose footprint or
+        rays read a square that changed since the previous snapshot are recomputed
+    """
+
+    # Changed squares above which the maps are rebuilt rather than updated
+    REBUILD = 64
+
+    def __init__(self, config=towerkrieg.DEFAULT_CONFIG):
+        """
+        :param config: BoardConfig of the game
+
+        Private data members:
+            _attacked
+            _board
+            _counts
+            _pieces
+            _rings
+            _stones
+            _threatened
+        """
+
+        self.config = config
+        self._board = towerkrieg_bitboard.tables(config.size)
+        self._stones = None
+        # Per player: centre index -> (squares read by the piece, squares its moves capture, its rays)
+        self._pieces = {'x': {}, 'o': {}}
+        # Per player: square index -> number of the player's pieces capturing it, and the same as a bitboard
+        self._counts = {'x': {}, 'o': {}}
+        self._attacked = {'x': 0, 'o': 0}
+        # Per player: ring centres, and those the opponent can hit
+        self._rings = {'x': 0, 'o': 0}
+        self._threatened = {'x': 0, 'o': 0}
+
+    def update(self, black, white):
+        """
+        Brings the maps up to date with a position
+
+        :param black: bitboard of Black's stones
+        :param white: bitboard of White's stones
+        :return:      self
+        """
+
+        if self._stones == (black, white):
+            return self
+        board = self._board
+        stones = {'x': black, 'o': white}
+        if self._stones is None:
+            changed = board.playable | board.border
+        else:
+            changed = (black ^ self._stones[0]) | (white ^ self._stones[1])
+        self._stones = (black, white)
+
+        if bin(changed).count('1') > self.REBUILD:
+            for player in self._pieces:
+                self._pieces[player] = {}
+                self._counts[player] = {}
+                self._attacked[player] = 0
+            candidates = board.playable
+        else:
+            # Pieces can only appear or change next to a changed square
+            candidates = _dilate(changed, board) & board.playable
+
+        occupied = black | white
+        for player, opponent in (('x', 'o'), ('o', 'x')):
+            pieces = self._pieces[player]
+            own, opp = stones[player], stones[opponent]
+            stale = [centre for centre, entry in pieces.items() if entry[0] & changed]
+            for centre in stale:
+                self._remove(player, centre)
+            todo = set(stale)
+            # Centres next to the player's stones and away from the opponent's
+            bits = candidates & _dilate(own, board) & ~_dilate(opp, board)
+            while bits:
+                low = bits & -bits
+                todo.add(low.bit_length() - 1)
+                bits ^= low
+            for centre in todo:
+                if centre not in pieces:
+                    self._add(player, centre, own, opp, occupied)
+
+        for player, opponent in (('x', 'o'), ('o', 'x')):
+            rings = towerkrieg_bitboard.ring_centres(stones[player], occupied, board)
+            self._rings[player] = rings
+            threatened = 0
+            attacked = self._attacked[opponent]
+            if attacked:
+                while rings:
+                    low = rings & -rings
+                    centre = low.bit_length() - 1
+                    if attacked & board.window[centre]:
+                        threatened |= low
+                    rings ^= low
+            self._threatened[player] = threatened
+        return self
+
+    def _add(self, player, centre, own, opp, occupied):
+        # Casts the rays of the piece of a player centred on a square, if the square centres one
+        board = self._board
+        window = board.window[centre]
+        if opp & window or not own & window:
+            return
+        size = board.size
+        pattern = (((own >> (centre - size - 1)) & 7) | ((own >> (centre - 1)) & 7) << 3
+                   | ((own >> (centre + size - 1)) & 7) << 6)
+        limit = self.config.limits[pattern]
+        rows, cols = self.config.reach[pattern]
+        leadings, shifts = board.leading, board.shifts
+        reads, captures, rays = window, 0, []
+        for d, _ in towerkrieg.FOOTPRINT_MOVES[pattern]:
+            step = shifts[d]
+            square = centre
+            r, c = divmod(centre, size)
+            for _ in range(limit):
+                r, c = r + d[0], c + d[1]
+                if r not in rows or c not in cols:
+                    break
+                leading = leadings[square, d]
+                reads |= leading
+                square += step
+                hit = occupied & leading
+                if hit:
+                    # Capture ends the ray
+                    captures |= hit
+                    rays.append((d, square, hit))
+                    break
+        self._pieces[player][centre] = (reads, captures, tuple(rays))
+        counts = self._counts[player]
+        while captures:
+            low = captures & -captures
+            index = low.bit_length() - 1
+            counts[index] = counts.get(index, 0) + 1
+            if counts[index] == 1:
+                self._attacked[player] |= low
+            captures ^= low
+
+    def _remove(self, player, centre):
+        _, captures, _ = self._pieces[player].pop(centre)
+        counts = self._counts[player]
+        while captures:
+            low = captures & -captures
+            index = low.bit_length() - 1
+            counts[index] -= 1
+            if not counts[index]:
+                del counts[index]
+                self._attacked[player] &= ~low
+            captures ^= low
+
+    def get_attacked(self, player):
+        """
+        :param player: attacking player ('x' or 'o')
+        :return:       bitboard of the stones the player's next move can capture
+        """
+        return self._attacked[player]
+
+    def get_attacker_count(self, player, row, col):
+        """
+        :param player: attacking player ('x' or 'o')
+        :param row:    row of the square
+        :param col:    column of the square
+        :return:       number of the player's pieces whose next move can capture the stone on the square
+        """
+        return self._counts[player].get(row * self._board.size + col, 0)
+
+    def get_attackers(self, player, row, col):
+        """
+        :param player: attacking player ('x' or 'o')
+        :param row:    row of the square
+        :param col:    column of the square
+        :return:       list of ((s_row, s_col), (e_row, e_col)) capturing moves of the player's pieces, in
+                       row-major order
+        """
+
+        size = self._board.size
+        bit = 1 << (row * size + col)
+        moves = []
+        for centre, (_, captures, rays) in self._pieces[player].items():
+            if captures & bit:
+                for _, end, captured in rays:
+                    if captured & bit:
+                        moves.append(((centre // size, centre % size), (end // size, end % size)))
+        moves.sort()
+        return moves
+
+    def ring_in_danger(self, player):
+        """
+        :param player: owner of the rings ('x' or 'o')
+        :return:       True if the opponent's next move can hit one of the player's rings
+        """
+        return self._threatened[player] != 0
+
+    def get_threatened_rings(self, player):
+        """
+        :param player: owner of the rings ('x' or 'o')
+        :return:       list of (row, col) centres of the player's rings the opponent can hit, in row-major order
+        """
+        size = self._board.size
+        rings, squares = self._threatened[player], []
+        while rings:
+            low = rings & -rings
+            index = low.bit_length() - 1
+            squares.append((index // size, index % size))
+            rings ^= low
+        return squares
@@ -0,0 +1,226 @@
+import argparse
+import json
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import towerkrieg_perft
+
+
+def load_positions(path=towerkrieg_perft.REFERENCE_FILE):
+    """
+    Reads the fixed benchmark positions, stored as move sequences from the start position
+
+    :param path: reference file
+    :return:     dictionary of position name -> list of ((s_row, s_col), (e_row, e_col)) moves
+    """
+
+    positions = {'start': []}
+    for name, moves in towerkrieg_perft.load_reference(path)['positions'].items():
+        positions[name] = [((m[0], m[1]), (m[2], m[3])) for m in moves]
+    return positions
+
+
+def setup(game_class, moves):
+    game = game_class()
+    for move in moves:
+        if not game.make_move(move[0], move[1], 1):
+            raise ValueError(f'benchmark move {move} rejected by {game_class.__name__}')
+    return game
+
+
+def _footprint_calls(game, centers, moves):
+    board = game.get_gameboard()
+    return [lambda r=r, c=c: game.make_footprint(board, r, c) for r, c in centers]
+
+
+def _propagate_calls(game, centers, moves):
+    def call(move):
+        game.direction = [(move[1][0] > move[0][0]) - (move[1][0] < move[0][0]),
+                          (move[1][1] > move[0][1]) - (move[1][1] < move[0][1])]
+        game.propagate_board(move[0][0], move[0][1], move[1][0], move[1][1])
+    return [lambda m=m: call(m) for m in moves]
+
+
+def _ring_scan_calls(game, centers, moves):
+    board = game.get_gameboard()
+    return [lambda: game.ring_scan(board)]
+
+
+def _moves_available_calls(game, centers, moves):
+    # Move lists are generated on every call: a cache hit would time a dictionary lookup
+    cache = game.get_move_cache()
+
+    def call(row, col):
+        cache.clear()
+        game.moves_available(row, col)
+    return [lambda r=r, c=c: call(r, c) for r, c in centers]
+
+
+def _make_move_calls(game, centers, moves):
+    def call(move):
+        if game.make_move(move[0], move[1], 1):
+            game.pop_move()
+    return [lambda m=m: call(m) for m in moves]
+
+
+# Operations timed on every position: one call per piece, per move, or per position
+OPERATIONS = {'make_footprint': _footprint_calls,
+              'propagate_board': _propagate_calls,
+              'ring_scan': _ring_scan_calls,
+              'moves_available': _moves_available_calls,
+              'make_move': _make_move_calls}
+
+
+def measure(calls, min_time=0.2):
+    """
+    Times a list of calls and records their allocations
+
+    :param calls:    list of callables
+    :param min_time: seconds the calls are repeated for at least
+    :return:         dictionary of ops_per_sec, us_per_op, peak_bytes_per_op and retained_blocks
+    """
+
+    count, elapsed = 0, 0.0
+    while elapsed < min_time:
+        start = time.perf_counter()
+        for call in calls:
+            call()
+        elapsed += time.perf_counter() - start
+        count += len(calls)
+
+    # Allocations of one pass over the calls, measured separately since tracing slows them down
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    for call in calls:
+        call()
+    peak = tracemalloc.get_traced_memory()[1] - base
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    retained = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+
+    return {'ops_per_sec': count / elapsed,
+            'us_per_op': elapsed / count * 1e6,
+            'peak_bytes_per_op': peak / len(calls),
+            'retained_blocks': retained}
+
+
+# Modules imported by batch jobs and their worker processes, and the budget of each import in a fresh interpreter
+# The modules import in 5 to 10 ms on a developer machine; the budget leaves room for slower nodes and a loaded
+#     machine, and catches regressions such as tables built at import or an optional module imported eagerly
+IMPORT_MODULES = ('towerkrieg', 'towerkrieg_bitboard', 'towerkrieg_players', 'towerkrieg_search',
+                  'towerkrieg_mcts', 'towerkrieg_selfplay', 'towerkrieg_archive', 'towerkrieg_tournament')
+IMPORT_BUDGET_MS = 30.0
+
+# Optional parts that none of IMPORT_MODULES may import
+OPTIONAL_MODULES = ('tkinter', 'numpy', 'sqlite3', 'concurrent.futures', 'argparse')
+
+
+def import_time(module, runs=5):
+    """
+    Measures the import of a module in fresh interpreters with -X importtime
+
+    :param module: module name
+    :param runs:   interpreters started; the fastest import counts
+    :return:       milliseconds (imports of the module's dependencies included), None if no interpreter reported
+                       the import, e.g. of a module already loaded at start-up
+                   optional modules of OPTIONAL_MODULES imported with it
+    """
+
+    best, loaded = None, []
+    code = f'import sys, {module}; print(" ".join(sys.modules))'
+    for _ in range(runs):
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True,
+                                 check=True)
+        for line in process.stderr.splitlines():
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].strip() == module:
+                milliseconds = int(fields[1]) / 1000
+                best = milliseconds if best is None else min(best, milliseconds)
+        loaded = [name for name in OPTIONAL_MODULES if name in process.stdout.split()]
+    return best, loaded
+
+
+def check_imports(modules=IMPORT_MODULES, budget=IMPORT_BUDGET_MS, runs=5):
+    """
+    Checks that the modules import within the budget and without the optional modules
+
+    :param modules: module names
+    :param budget:  milliseconds allowed per module
+    :param runs:    interpreters started per module
+    :return:        list of (module, milliseconds, optional modules imported)
+    """
+
+    results = [(module,) + import_time(module, runs) for module in modules]
+    for module, milliseconds, loaded in results:
+        if milliseconds is None:
+            raise AssertionError(f'importing {module} was not timed: -X importtime did not report it')
+        if milliseconds > budget:
+            raise AssertionError(f'importing {module} took {milliseconds:.1f} ms, over the budget of {budget} ms')
+        if loaded:
+            raise AssertionError(f'importing {module} imported the optional modules {", ".join(loaded)}')
+    return results
+
+
+def run(backends=None, operations=None, min_time=0.2):
+    """
+    Runs the benchmark suite
+
+    :param backends:   backend names of towerkrieg_perft.BACKENDS, all if None
+    :param operations: operation names of OPERATIONS, all if None
+    :param min_time:   seconds each measurement is repeated for at least
+    :return:           list of result dictionaries (backend, position, operation and the measure() fields)
+    """
+
+    results = []
+    for backend in backends or towerkrieg_perft.BACKENDS:
+        game_class = towerkrieg_perft.BACKENDS[backend]
+        for position, moves in load_positions().items():
+            for operation in operations or OPERATIONS:
+                # A fresh game per operation, since propagate_board may decide the game as a side effect
+                game = setup(game_class, moves)
+                legal = game.all_legal_moves(game.get_turn())
+                centers = sorted({move[0] for move in legal})
+                calls = OPERATIONS[operation](game, centers, legal)
+                result = {'backend': backend, 'position': position, 'operation': operation}
+                result.update(measure(calls, min_time))
+                results.append(result)
+    return results
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description='Times the hot paths of the Towerkrieg rules engine')
+    parser.add_argument('--backend', action='append', choices=sorted(towerkrieg_perft.BACKENDS))
+    parser.add_argument('--operation', action='append', choices=sorted(OPERATIONS))
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds per measurement')
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--imports', action='store_true', help='check the import times of IMPORT_MODULES instead')
+    parser.add_argument('--import-budget', type=float, default=IMPORT_BUDGET_MS, help='milliseconds per module')
+    args = parser.parse_args(argv)
+
+    if args.imports:
+        try:
+            results = check_imports(budget=args.import_budget)
+        except AssertionError as error:
+            parser.exit(1, f'import check failed: {error}\n')
+        for module, milliseconds, _ in results:
+            print(f'{module:24}{milliseconds:8.1f} ms')
+        print(f'import check passed: every module within {args.import_budget} ms')
+        return
+
+    results = run(args.backend, args.operation, args.min_time)
+    print(f'{"backend":10}{"position":12}{"operation":17}{"ops/sec":>12}{"us/op":>10}{"peak B/op":>11}'
+          f'{"retained":>10}')
+    for r in results:
+        print(f'{r["backend"]:10}{r["position"]:12}{r["operation"]:17}{r["ops_per_sec"]:12.0f}'
+              f'{r["us_per_op"]:10.1f}{r["peak_bytes_per_op"]:11.0f}{r["retained_blocks"]:10d}')
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(results, output, indent=1)
+
+
+if __name__ == "__main__":
+    main()
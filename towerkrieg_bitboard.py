@@ -0,0 +1,545 @@
+import towerkrieg
+
+
+# Square [row, col] of the 20 x 20 game board is stored in bit (row * 20 + col) of a player's bitboard; other
+# board sizes (see towerkrieg.BoardConfig) use bit (row * size + col)
+SIZE = 20
+
+# Unit directions of movement [row, col]
+DIRECTIONS = towerkrieg.DIRECTIONS
+
+
+def _shift(bits, step):
+    """
+    Translates every stone of a bitboard by a signed bit offset
+
+    :param bits: bitboard
+    :param step: signed bit offset (see BoardTables.shifts)
+    :return:     translated bitboard
+    """
+
+    if step >= 0:
+        return bits << step
+    return bits >> -step
+
+
+class BoardTables():
+    """
+    Masks and keys used by the engine hot paths on a board of one size, shared by all games of that size
+    """
+
+    def __init__(self, size):
+        """
+        :param size: number of rows and columns of the board
+
+        Data members:
+            size     (number of rows and columns)
+            shifts   (bit shift of a one-step translation, per direction)
+            window   (3 x 3 mask for every centre square of the playable area)
+            leading  (mask of squares entered by a piece taking one step from a centre square, per direction)
+            border   (mask of the border squares wiped after every move)
+            centres  (mask of the squares that can hold the empty centre of a ring)
+            playable (mask of the playable area)
+            keys     (Zobrist keys of TowerkriegGame indexed by bit)
+            areas    (masks of the areas counted by count_stones_near, built on first use)
+            bands    (per number of rows, mask of the rows and mask of the ring centres within them, see band_rings)
+        """
+
+        self.size = size
+        self.shifts = {d: d[0] * size + d[1] for d in DIRECTIONS}
+
+        # Masks are assembled from whole rows: 3 bits wide for a window, size - 4 bits for ring centres
+        block = 7 | 7 << size | 7 << (2 * size)
+        self.window = {}
+        for row in range(1, size - 1):
+            for col in range(1, size - 1):
+                self.window[row * size + col] = block << ((row - 1) * size + col - 1)
+
+        self.leading = {}
+        for centre, mask in self.window.items():
+            for d, step in self.shifts.items():
+                if centre + step in self.window:
+                    self.leading[centre, d] = self.window[centre + step] & ~mask
+
+        full, edges = (1 << size) - 1, 1 | 1 << (size - 1)
+        self.border = full | full << ((size - 1) * size)
+        for row in range(1, size - 1):
+            self.border |= edges << (row * size)
+
+        centre_row = ((1 << (size - 4)) - 1) << 2
+        self.centres = 0
+        for row in range(2, size - 2):
+            self.centres |= centre_row << (row * size)
+
+        self.playable = ((1 << (size * size)) - 1) & ~self.border
+        zobrist = towerkrieg.zobrist_keys(size)[0]
+        self.keys = {player: [zobrist[player][i // size][i % size] for i in range(size * size)]
+                     for player in zobrist}
+        self.areas = {}
+
+        self.bands = {}
+        centres = 0
+        for height in range(3, size + 1):
+            centres |= centre_row << ((height - 2) * size)
+            self.bands[height] = ((1 << (height * size)) - 1, centres)
+
+    def band_rings(self, own, opp, top, bottom):
+        """
+        Counts the rings of both players centred on rows top to bottom, reading only those rows and their
+        neighbours, so the cost does not grow with the number of rows of the board
+
+        :param own:    bitboard of one player's stones
+        :param opp:    bitboard of the other player's stones
+        :param top:    first row of ring centres
+        :param bottom: last row of ring centres
+        :return:       own_rings, opp_rings
+        """
+
+        size = self.size
+        top, bottom = max(top, 2), min(bottom, size - 3)
+        if top > bottom:
+            return 0, 0
+        shift = (top - 1) * size
+        mask, centres = self.bands[bottom - top + 3]
+        own = (own >> shift) & mask
+        opp = (opp >> shift) & mask
+        occupied = own | opp
+        return (bin(_ring_centres(own, occupied, centres, size)).count('1'),
+                bin(_ring_centres(opp, occupied, centres, size)).count('1'))
+
+
+# Tables per board size, built on first use
+_TABLES = {}
+
+
+def tables(size=SIZE):
+    """
+    :param size: number of rows and columns of the board
+    :return:     BoardTables of the size
+    """
+
+    if size not in _TABLES:
+        _TABLES[size] = BoardTables(size)
+    return _TABLES[size]
+
+
+# Tables of the standard board, as module attributes built on first use
+_STANDARD = {'SHIFTS': 'shifts', 'WINDOW': 'window', 'LEADING': 'leading', 'BORDER': 'border',
+             'RING_CENTRES': 'centres', 'PLAYABLE': 'playable', 'KEYS': 'keys'}
+
+
+def __getattr__(name):
+    if name in _STANDARD:
+        return getattr(tables(), _STANDARD[name])
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def _squares(bits, size=SIZE):
+    """
+    Decodes a bitboard into its squares
+
+    :param bits: bitboard
+    :param size: number of rows and columns of the board
+    :return:     list of (row, col) squares in row-major order
+    """
+
+    squares = []
+    while bits:
+        low = bits & -bits
+        index = low.bit_length() - 1
+        squares.append((index // size, index % size))
+        bits ^= low
+    return squares
+
+
+def toggle_keys(keys, bits):
+    """
+    Combines the Zobrist keys of every square set in a bitboard
+
+    :param keys: Zobrist keys of one player indexed by bit (see KEYS)
+    :param bits: bitboard of changed squares
+    :return:     XOR of the keys
+    """
+
+    key = 0
+    while bits:
+        low = bits & -bits
+        key ^= keys[low.bit_length() - 1]
+        bits ^= low
+    return key
+
+
+def _ring_centres(stones, occupied, centres, size):
+    return (centres & ~occupied
+            & (stones << (size + 1)) & (stones << size) & (stones << (size - 1)) & (stones << 1)
+            & (stones >> 1) & (stones >> (size - 1)) & (stones >> size) & (stones >> (size + 1)))
+
+
+def ring_centres(stones, occupied, board=None):
+    """
+    Locates every ring of one player in a single pass of shifts and masks
+
+    :param stones:   bitboard of the player's stones
+    :param occupied: bitboard of all stones on the board
+    :param board:    BoardTables of the board size, None for the standard board
+    :return:         bitboard of the empty squares enclosed by 8 of the player's stones
+    """
+
+    board = board or tables()
+    return _ring_centres(stones, occupied, board.centres, board.size)
+
+
+class BitboardTowerkriegGame(towerkrieg.TowerkriegGame):
+    """
+    Implements Towerkrieg game on integer bitboards
+    Drop-in replacement for TowerkriegGame: each player's stones are held in one 400-bit integer (size x size
+        bits on other boards) and the footprint, translation, capture and border wipe of a move are resolved
+        with shifts and masks
+    A list view of the board is only built on request by get_gameboard
+    """
+
+    def initialize_board(self):
+        # Lay out the starting position on a list board, then pack it into one bitboard per player
+        super().initialize_board()
+        self._tables = tables(self._config.size)
+        self._stones = {self._player_b: 0, self._player_w: 0}
+        for row, squares in enumerate(self._board):
+            for col, square in enumerate(squares):
+                if square is not None:
+                    self._stones[square] |= 1 << (row * self._config.size + col)
+
+        # List view of the board, rebuilt lazily after the bitboards change. Rings are read from the bitboards,
+        # and their number is maintained move by move
+        self._board = None
+        self._rings = None
+        self._count_rings()
+
+    def get_gameboard(self):
+        if self._board is None:
+            size = self._tables.size
+            self._board = [[None] * size for _ in range(size)]
+            for player, bits in self._stones.items():
+                while bits:
+                    low = bits & -bits
+                    index = low.bit_length() - 1
+                    self._board[index // size][index % size] = player
+                    bits ^= low
+        return self._board
+
+    def get_state(self, with_hash=True):
+        return towerkrieg.GameState(self._stones[self._player_b], self._stones[self._player_w], self._turn,
+                                    self._game_state, self._hash if with_hash else None, self._tables.size)
+
+    def set_state(self, state):
+        # Only the bitboards are needed, so the list board of initialize_board is skipped
+        size = self._config.size
+        if state.size != size:
+            raise ValueError(f'GameState of a {state.size} x {state.size} board does not fit a {size} x {size} board')
+        self._tables = tables(size)
+        self._stones = {self._player_b: state.black, self._player_w: state.white}
+        self._board = None
+        self._rings = None
+        self._direction = []
+        self._footprint = []
+        self._footprint_none = []
+        self._footprint_total = []
+        self._history = []
+        self._resign = False
+        self._turn = state.turn
+        self._game_state = state.status
+        self._hash = state.hash if state.hash is not None else self.compute_hash(self.get_gameboard(), self._turn)
+        self._count_rings()
+
+    def get_bitboards(self):
+        """
+        Returns the bitboards of both players
+
+        :return: black (bitboard of 'x' stones)
+                 white (bitboard of 'o' stones)
+        """
+        return self._stones[self._player_b], self._stones[self._player_w]
+
+    def _opponent(self):
+        if self._turn == self._player_b:
+            return self._player_w
+        return self._player_b
+
+    def _count_rings(self):
+        # Full count of both players' rings, after the bitboards were replaced
+        occupied = self._stones[self._player_b] | self._stones[self._player_w]
+        self._ring_counts = {player: bin(ring_centres(stones, occupied, self._tables)).count('1')
+                             for player, stones in self._stones.items()}
+
+    def get_ring_count(self, player):
+        return self._ring_counts[player]
+
+    def get_rings(self, player):
+        occupied = self._stones[self._player_b] | self._stones[self._player_w]
+        return _squares(ring_centres(self._stones[player], occupied, self._tables), self._tables.size)
+
+    def get_stone_count(self, player):
+        return bin(self._stones[player]).count('1')
+
+    def count_stones_near(self, player, row, col, reach):
+        areas, size = self._tables.areas, self._tables.size
+        key = (row, col, reach)
+        if key not in areas:
+            mask = 0
+            for r in range(max(row - reach, 0), min(row + reach + 1, size)):
+                for c in range(max(col - reach, 0), min(col + reach + 1, size)):
+                    mask |= 1 << (r * size + c)
+            areas[key] = mask
+        return bin(self._stones[player] & areas[key]).count('1')
+
+    def is_capture(self, move):
+        (s_row, s_col), (e_row, e_col) = move
+        d = ((e_row > s_row) - (e_row < s_row), (e_col > s_col) - (e_col < s_col))
+        if d == (0, 0):
+            return False
+        board = self._tables
+        return self._stones[self._opponent()] & board.leading[e_row * board.size + e_col - board.shifts[d], d] != 0
+
+    def ring_scan_bits(self, own, opp):
+        """
+        Bitboard counterpart of ring_scan: evaluates the players' rings for the player to move
+
+        :param own: bitboard of the stones of the player to move
+        :param opp: bitboard of the opponent's stones
+        :return:    False if player's move removes that player's sole ring
+        """
+
+        occupied = own | opp
+        own_ring = ring_centres(own, occupied, self._tables) != 0
+        opp_ring = ring_centres(opp, occupied, self._tables) != 0
+        if self._turn == self._player_b:
+            return self.ring_verdict(own_ring, opp_ring)
+        return self.ring_verdict(opp_ring, own_ring)
+
+    def _propagate(self, s_row, s_col, e_row, e_col, ring_scan=True):
+        """
+        Resolves a move from starting to ending row / col on the bitboards without committing it
+
+        :param s_row:     starting row
+        :param s_col:     starting column
+        :param e_row:     ending row
+        :param e_col:     ending column
+        :param ring_scan: evaluate the players' rings after every step
+        :return:          (own, opp) bitboards and (own, opp) ring counts after the move, None if the move is
+                          not valid. Ring counts are None without ring scan
+        """
+
+        board = self._tables
+        d = tuple(self.direction)
+        if d not in board.shifts:
+            return None
+        steps = max(abs(e_row - s_row), abs(e_col - s_col))
+        if (s_row + d[0] * steps, s_col + d[1] * steps) != (e_row, e_col):
+            # Destination does not lie on one of the 8 lines through the starting square
+            return None
+
+        own = self._stones[self._turn]
+        opp = self._stones[self._opponent()]
+        centre = s_row * board.size + s_col
+        window, leading = board.window, board.leading
+        if opp & window[centre]:
+            # Selected piece has mixed stones
+            return None
+        piece = own & window[centre]
+        step = board.shifts[d]
+        if not (piece >> (centre + step)) & 1:
+            # Proposed cardinal direction is not permitted by the stone configuration
+            return None
+
+        occupied = own | opp
+        rest = own ^ piece
+        own_rings, opp_rings = self._ring_counts[self._turn], self._ring_counts[self._opponent()]
+        black_turn = self._turn == self._player_b
+        for i in range(1, steps + 1):
+            rest_before, opp_before = rest, opp
+            if occupied & leading[centre, d]:
+                if i != steps:
+                    # Path to requested destination is blocked by stone. Move not allowed
+                    return None
+                # Stones entered on the final step are captured
+                rest &= ~window[centre + step]
+                opp &= ~window[centre + step]
+            centre += step
+            if ring_scan is True:
+                # Only rings centred within 2 rows of the piece's old and new centre can have changed
+                top = min(centre, centre - step) // board.size - 2
+                bottom = max(centre, centre - step) // board.size + 2
+                old_own, old_opp = board.band_rings(rest_before | _shift(piece, (i - 1) * step), opp_before,
+                                                    top, bottom)
+                new_own, new_opp = board.band_rings(rest | _shift(piece, i * step), opp, top, bottom)
+                own_rings += new_own - old_own
+                opp_rings += new_opp - old_opp
+                if black_turn:
+                    verdict = self.ring_verdict(own_rings > 0, opp_rings > 0)
+                else:
+                    verdict = self.ring_verdict(opp_rings > 0, own_rings > 0)
+                if verdict is False:
+                    # Fails ring scan (i.e. move disrupts player's sole ring)
+                    return None
+        if ring_scan is not True:
+            own_rings = opp_rings = None
+        return rest | _shift(piece, steps * step), opp, own_rings, opp_rings
+
+    def propagate_board(self, s_row, s_col, e_row, e_col, ring_scan=True):
+        return self._propagate(s_row, s_col, e_row, e_col, ring_scan) is not None
+
+    def advance_board(self, s_row, s_col, e_row, e_col):
+        own, opp, _, _ = self._propagate(s_row, s_col, e_row, e_col, ring_scan=False)
+        keys = self._tables.keys
+        self._hash ^= toggle_keys(keys[self._turn], own ^ self._stones[self._turn])
+        self._hash ^= toggle_keys(keys[self._opponent()], opp ^ self._stones[self._opponent()])
+        self._stones[self._turn], self._stones[self._opponent()] = own, opp
+        self._board = None
+        self._count_rings()
+        return True
+
+    def push_move(self, move):
+        """
+        Applies a move to the bitboards and records it on the undo stack
+        Same semantics as TowerkriegGame.push_move, resolved in a single validation pass
+
+        :param move: ((s_row, s_col), (e_row, e_col)) in the coordinate system of the game
+        :return:     True if move completed successfully; False otherwise
+        """
+
+        # Test if game has already been won
+        if self._game_state in ['black_victory', 'white_victory']:
+            return False
+
+        (s_row, s_col), (e_row, e_col) = move
+        config, board = self._config, self._tables
+
+        # Test for move that is out-of-bounds
+        for element in (s_row, s_col, e_row, e_col):
+            if element not in config.inside:
+                return False
+
+        move_y = e_row - s_row
+        move_x = e_col - s_col
+        self.direction = [(move_y > 0) - (move_y < 0), (move_x > 0) - (move_x < 0)]
+
+        # Undo entry: the bitboards are immutable integers, so the previous position is kept whole
+        entry = (move, self._stones[self._player_b], self._stones[self._player_w], self._turn, self._game_state,
+                 self._hash, self._ring_counts)
+
+        changed = 0
+        if (move_y, move_x) != (0, 0):
+            # Tests for requested move exceeding 3-block limit (no center stone)
+            if not (self._stones[self._turn] >> (s_row * board.size + s_col)) & 1:
+                if max(abs(move_y), abs(move_x)) > config.move_limit:
+                    return False
+
+            result = self._propagate(s_row, s_col, e_row, e_col)
+            if result is None:
+                # Roll back a game state set by the ring scan of a rejected move
+                self._game_state = entry[4]
+                return False
+
+            # Commit the move and wipe-out stones in the border zone
+            own, opp, own_rings, opp_rings = result
+            if own & board.border and config.border == 'block':
+                # Rule variant: pieces cannot push stones into the border
+                self._game_state = entry[4]
+                return False
+            own &= ~board.border
+            opp &= ~board.border
+            self._hash ^= toggle_keys(board.keys[self._turn], own ^ self._stones[self._turn])
+            self._hash ^= toggle_keys(board.keys[self._opponent()], opp ^ self._stones[self._opponent()])
+            changed = (own ^ self._stones[self._turn]) | (opp ^ self._stones[self._opponent()])
+            self._stones[self._turn] = own
+            self._stones[self._opponent()] = opp
+            self._board = None
+            # Rings lie inside the border, so the wipe leaves them unchanged
+            self._ring_counts = {self._turn: own_rings, self._opponent(): opp_rings}
+
+        # Switch player turn
+        self._turn = self._opponent()
+        self._hash ^= config.zobrist_turn
+        self._history.append(entry)
+        if self._moves is not None and self._moves.holds(entry[5]):
+            self._moves.carry(entry[5], self._hash, changed)
+        return True
+
+    def pop_move(self):
+        if not self._history:
+            return None
+        key = self._hash
+        move, black, white, self._turn, self._game_state, self._hash, self._ring_counts = self._history.pop()
+        changed = (black ^ self._stones[self._player_b]) | (white ^ self._stones[self._player_w])
+        self._stones[self._player_b], self._stones[self._player_w] = black, white
+        self._board = None
+        if self._moves is not None and self._moves.holds(key):
+            self._moves.carry(key, self._hash, changed)
+        return move
+
+    def _cast_rays(self, row, col, player):
+        """
+        Casts one ray from the piece centred on row / col in every direction permitted by its footprint
+
+        :param row:    row of the centre of the piece
+        :param col:    column of the centre of the piece
+        :param player: owner of the piece ('x' or 'o')
+        :return:       list of (row, col) destinations
+        """
+
+        inside = self._config.inside
+        if row not in inside or col not in inside:
+            return []
+        board = self._tables
+        size = board.size
+        own = self._stones[player]
+        occupied = self._stones[self._player_b] | self._stones[self._player_w]
+        centre = row * size + col
+        if (occupied ^ own) & board.window[centre]:
+            return []
+        pattern = (((own >> (centre - size - 1)) & 7) | ((own >> (centre - 1)) & 7) << 3
+                   | ((own >> (centre + size - 1)) & 7) << 6)
+        limit = self._config.limits[pattern]
+        rows, cols = self._config.reach[pattern]
+
+        moves = []
+        shifts, leading = board.shifts, board.leading
+        for d, _ in towerkrieg.FOOTPRINT_MOVES[pattern]:
+            step = shifts[d]
+            r, c, square = row, col, centre
+            for _ in range(limit):
+                r, c = r + d[0], c + d[1]
+                if r not in rows or c not in cols:
+                    break
+                moves.append((r, c))
+                if occupied & leading[square, d]:
+                    # Capture ends the ray
+                    break
+                square += step
+        return moves
+
+    def all_legal_moves(self, player):
+        """
+        Lists every move of a player. The players' rings are not evaluated
+
+        :param player: 'x' or 'o'
+        :return:       list of ((s_row, s_col), (e_row, e_col)) moves in row-major order
+        """
+
+        # Only centres within one step of the player's stones can hold a piece
+        board = self._tables
+        stones = self._stones[player]
+        centres = stones
+        for step in board.shifts.values():
+            centres |= _shift(stones, step)
+
+        centres &= board.playable
+
+        moves = []
+        while centres:
+            low = centres & -centres
+            index = low.bit_length() - 1
+            start = (index // board.size, index % board.size)
+            for end in sorted(self._cast_rays(start[0], start[1], player)):
+                moves.append((start, end))
+            centres ^= low
+        return moves
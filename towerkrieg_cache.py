@@ -0,0 +1,211 @@
+import collections
+import sqlite3
+import threading
+
+
+def position_key(game, engine=''):
+    """
+    Canonical key of a position: the engine keyed, the packed board of GameState.to_bytes, the player to move
+        and the rule variant (move limit and border) of the game's BoardConfig
+    Unlike the Zobrist hash, the key is collision-free and stable across versions of the key tables
+
+    :param game:   game
+    :param engine: name of the engine whose results are keyed; engines with other value scales or depths (e.g.
+                   alpha-beta scores and MCTS playout means) keep separate entries of a position
+    :return:       bytes
+    """
+
+    state = game.get_state(with_hash=False)
+    config = game.get_config()
+    name = engine.encode()
+    return (bytes((len(name),)) + name + state.to_bytes()[:state.blob_bytes(state.size)[0]]
+            + (b'o' if state.turn == 'o' else b'x') + config.move_limit.to_bytes(2, 'little') + config.border.encode())
+
+
+class PositionCache():
+    """
+    Persistent cache of position evaluations: an SQLite file behind a bounded in-memory LRU front
+    Entries hold the evaluation (for the player to move), best move, search depth and visit count of a position
+    A deeper search, or an equally deep one with more visits, replaces a stored entry. Entries of a position are
+        kept per engine and rule variant (see position_key), so an engine only reads results on its own scale
+    The file is opened in WAL mode so worker processes can read while one of them writes; a cache pickles as
+        its path and settings, and reconnects in the receiving process
+    """
+
+    def __init__(self, path, capacity=1 << 16, flush_every=256):
+        """
+        :param path:        SQLite file, created if missing; ':memory:' for a cache without persistence
+        :param capacity:    entries kept in the in-memory LRU front
+        :param flush_every: stores buffered before they are written to the file in one transaction
+
+        Private data members:
+            _connection
+            _lock
+            _lru
+            _pending
+        """
+
+        self.path = path
+        self.capacity = capacity
+        self.flush_every = flush_every
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self._lru = collections.OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._connection = None
+        self._connect()
+
+    def __getstate__(self):
+        self.flush()
+        return {'path': self.path, 'capacity': self.capacity, 'flush_every': self.flush_every}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['capacity'], state['flush_every'])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        self.flush()
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM positions').fetchone()[0]
+
+    def _connect(self):
+        self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS positions (key BLOB PRIMARY KEY, value REAL, '
+                                 'move INTEGER, depth INTEGER, visits INTEGER)')
+        self._connection.commit()
+
+    @staticmethod
+    def _pack_move(move):
+        # Moves on boards up to 20 x 20 pack their squares as row * 20 + col, 9 bits each; larger boards use
+        # 6 bits per coordinate, flagged by bit 24
+        if move is None:
+            return None
+        (s_row, s_col), (e_row, e_col) = move
+        if max(s_row, s_col, e_row, e_col) < 20:
+            return ((s_row * 20 + s_col) << 9) | (e_row * 20 + e_col)
+        return 1 << 24 | s_row << 18 | s_col << 12 | e_row << 6 | e_col
+
+    @staticmethod
+    def _unpack_move(packed):
+        if packed is None:
+            return None
+        if packed >> 24:
+            return (packed >> 18 & 63, packed >> 12 & 63), (packed >> 6 & 63, packed & 63)
+        start, end = packed >> 9, packed & 511
+        return (start // 20, start % 20), (end // 20, end % 20)
+
+    def _remember(self, key, entry):
+        self._lru[key] = entry
+        self._lru.move_to_end(key)
+        if len(self._lru) > self.capacity:
+            self._lru.popitem(last=False)
+
+    def probe(self, key, engine=''):
+        """
+        Looks up a position, first in memory, then in the file
+
+        :param key:    position_key of the position, or a game
+        :param engine: engine whose result is looked up, if key is a game (see position_key)
+        :return:       (value, move, depth, visits), None if the position is not stored
+        """
+
+        if not isinstance(key, bytes):
+            key = position_key(key, engine)
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return entry
+            # Stores evicted from memory before they were flushed are newer than the file
+            entry = self._pending.get(key)
+            if entry is not None:
+                self._remember(key, entry)
+                self.hits += 1
+                return entry
+            row = self._connection.execute('SELECT value, move, depth, visits FROM positions WHERE key = ?',
+                                           (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            entry = (row[0], self._unpack_move(row[1]), row[2], row[3])
+            self._remember(key, entry)
+            self.disk_hits += 1
+            return entry
+
+    def store(self, key, value, move=None, depth=0, visits=0, engine=''):
+        """
+        Stores the result of a search or evaluation, unless a deeper result of the position is stored
+        The stored result is looked up in memory first, then among the unflushed stores, then in the file
+
+        :param key:    position_key of the position, or a game
+        :param value:  evaluation for the player to move
+        :param move:   best move, if any
+        :param depth:  search depth of the result
+        :param visits: visits (playouts or nodes) behind the result
+        :param engine: engine storing the result, if key is a game (see position_key)
+        """
+
+        if not isinstance(key, bytes):
+            key = position_key(key, engine)
+        with self._lock:
+            old = self._lru.get(key) or self._pending.get(key)
+            if old is None:
+                old = self._connection.execute('SELECT value, move, depth, visits FROM positions WHERE key = ?',
+                                               (key,)).fetchone()
+            if old is not None and (old[2], old[3]) > (depth, visits):
+                return
+            entry = (value, move, depth, visits)
+            self._remember(key, entry)
+            self._pending[key] = entry
+            self.stores += 1
+            if len(self._pending) >= self.flush_every:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        rows = [(key, value, self._pack_move(move), depth, visits)
+                for key, (value, move, depth, visits) in self._pending.items()]
+        with self._connection:
+            self._connection.executemany(
+                'INSERT INTO positions (key, value, move, depth, visits) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET value = excluded.value, move = excluded.move, '
+                'depth = excluded.depth, visits = excluded.visits '
+                'WHERE (excluded.depth, excluded.visits) >= (positions.depth, positions.visits)', rows)
+        self._pending.clear()
+
+    def close(self):
+        if self._connection is not None:
+            self.flush()
+            self._connection.close()
+            self._connection = None
+
+    def get_stats(self):
+        """
+        Returns the hit / miss counters of the cache
+
+        :return: dictionary of hits (memory), disk hits, misses, stores, hit rate and entries held in memory
+        """
+
+        probes = self.hits + self.disk_hits + self.misses
+        return {'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'stores': self.stores,
+                'hit_rate': (self.hits + self.disk_hits) / probes if probes else 0.0,
+                'entries': len(self._lru)}
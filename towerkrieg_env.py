@@ -0,0 +1,542 @@
+import random
+
+import numpy as np
+
+import towerkrieg
+
+
+# Contents of a square: Black ('x') stone, White ('o') stone or empty. The player to move is BLACK or WHITE
+BLACK = 1
+WHITE = -1
+EMPTY = 0
+SIZE = 20
+
+# Fixed action space: starting square of the playable area x direction x distance, laid out as one
+# 18 x 18 plane of starting squares per (direction, distance):
+# action ((direction * 17 + distance - 1) * 18 + s_row - 1) * 18 + s_col - 1
+PLAYABLE = SIZE - 2
+MAX_DISTANCE = PLAYABLE - 1
+DIRECTIONS = towerkrieg.DIRECTIONS
+ACTION_COUNT = PLAYABLE * PLAYABLE * len(DIRECTIONS) * MAX_DISTANCE
+
+_DIR_ROW = np.array([d[0] for d in DIRECTIONS])
+_DIR_COL = np.array([d[1] for d in DIRECTIONS])
+_OFFSETS = np.arange(-1, 2)
+_CENTRES = np.arange(1, SIZE - 1)
+
+# Direction index of every unit step (row + 1, col + 1), -1 for no movement
+_DIRECTION_INDEX = np.full((3, 3), -1)
+for _i, _d in enumerate(DIRECTIONS):
+    _DIRECTION_INDEX[_d[0] + 1, _d[1] + 1] = _i
+
+# Leading edge of every direction (see towerkrieg.LEADING_EDGE), padded to 5 squares by repeating a square
+_LEAD_ROW = np.array([[r for r, _ in (towerkrieg.LEADING_EDGE[d] * 2)[:5]] for d in DIRECTIONS])
+_LEAD_COL = np.array([[c for _, c in (towerkrieg.LEADING_EDGE[d] * 2)[:5]] for d in DIRECTIONS])
+
+
+def _bits(squares):
+    return sum(1 << (row * SIZE + col) for row, col in squares)
+
+
+# Bitboards (bit row * 20 + col) for the sweep of legal_action_mask: the playable area, and per direction and
+# distance the starting squares whose destination stays in the playable area. Shifts wrap across rows, so every
+# shifted bitboard is masked with one of these
+_INSIDE = _bits((row, col) for row in range(1, SIZE - 1) for col in range(1, SIZE - 1))
+_BORDER = _bits((row, col) for row in range(SIZE) for col in range(SIZE)
+                if row in (0, SIZE - 1) or col in (0, SIZE - 1))
+_REACHABLE = [[_bits((row, col) for row in range(1, SIZE - 1) for col in range(1, SIZE - 1)
+                     if 1 <= row + d[0] * distance <= PLAYABLE and 1 <= col + d[1] * distance <= PLAYABLE)
+               for distance in range(MAX_DISTANCE + 1)] for d in DIRECTIONS]
+_STEP = [d[0] * SIZE + d[1] for d in DIRECTIONS]
+_WINDOW = [row * SIZE + col for row in range(-1, 2) for col in range(-1, 2)]
+_LEAD_STEP = [[r * SIZE + c for r, c in towerkrieg.LEADING_EDGE[d]] for d in DIRECTIONS]
+_PLANE_BYTES = SIZE * SIZE // 8
+
+
+def encode_action(move):
+    """
+    Encodes a move in the fixed action space
+
+    :param move: ((s_row, s_col), (e_row, e_col)) in the coordinate system of the game
+    :return:     action index
+    """
+
+    (s_row, s_col), (e_row, e_col) = move
+    d = ((e_row > s_row) - (e_row < s_row), (e_col > s_col) - (e_col < s_col))
+    distance = max(abs(e_row - s_row), abs(e_col - s_col))
+    if (d == (0, 0) or (s_row + d[0] * distance, s_col + d[1] * distance) != (e_row, e_col)
+            or not all(element in range(1, SIZE - 1) for element in (s_row, s_col, e_row, e_col))):
+        raise ValueError(f'move {move} has no action')
+    plane = DIRECTIONS.index(d) * MAX_DISTANCE + distance - 1
+    return (plane * PLAYABLE + s_row - 1) * PLAYABLE + s_col - 1
+
+
+def decode_action(action):
+    """
+    Decodes an action into a move for make_move(starting, ending, axes=1) or push_move
+
+    :param action: action index
+    :return:       ((s_row, s_col), (e_row, e_col)) in the coordinate system of the game
+    """
+
+    plane, square = divmod(int(action), PLAYABLE * PLAYABLE)
+    direction, distance = divmod(plane, MAX_DISTANCE)
+    s_row, s_col = square // PLAYABLE + 1, square % PLAYABLE + 1
+    d = DIRECTIONS[direction]
+    return (s_row, s_col), (s_row + d[0] * (distance + 1), s_col + d[1] * (distance + 1))
+
+
+def encode_actions(moves):
+    """
+    Encodes many moves at once. Moves without an action are encoded as -1
+
+    :param moves: (N, 2, 2) array-like of ((s_row, s_col), (e_row, e_col))
+    :return:      (N,) int64 action indices
+    """
+
+    moves = np.asarray(moves, dtype=np.int64).reshape(-1, 4)
+    s_row, s_col, e_row, e_col = moves.T
+    d_row, d_col = np.sign(e_row - s_row), np.sign(e_col - s_col)
+    distance = np.maximum(abs(e_row - s_row), abs(e_col - s_col))
+    direction = _DIRECTION_INDEX[d_row + 1, d_col + 1]
+    valid = ((direction >= 0) & (s_row + d_row * distance == e_row) & (s_col + d_col * distance == e_col)
+             & (moves >= 1).all(axis=1) & (moves <= PLAYABLE).all(axis=1))
+    actions = ((direction * MAX_DISTANCE + distance - 1) * PLAYABLE + s_row - 1) * PLAYABLE + s_col - 1
+    return np.where(valid, actions, -1)
+
+
+def decode_actions(actions):
+    """
+    Decodes many actions at once
+
+    :param actions: (N,) action indices
+    :return:        (N, 2, 2) int64 array of ((s_row, s_col), (e_row, e_col))
+    """
+
+    plane, square = np.divmod(np.asarray(actions, dtype=np.int64), PLAYABLE * PLAYABLE)
+    direction, distance = np.divmod(plane, MAX_DISTANCE)
+    s_row, s_col = square // PLAYABLE + 1, square % PLAYABLE + 1
+    e_row, e_col = s_row + _DIR_ROW[direction] * (distance + 1), s_col + _DIR_COL[direction] * (distance + 1)
+    return np.stack([s_row, s_col, e_row, e_col], axis=-1).reshape(-1, 2, 2)
+
+
+def _shift(bits, offset):
+    # bits[s] -> bits[s + offset]
+    return bits << offset if offset >= 0 else bits >> -offset
+
+
+def _gather(bits, offset):
+    # out[s] = bits[s + offset]
+    return bits >> offset if offset >= 0 else bits << -offset
+
+
+def _state(game):
+    state = game if isinstance(game, towerkrieg.GameState) else game.get_state(with_hash=False)
+    if state.size != SIZE:
+        raise ValueError(f'the action space covers {SIZE} x {SIZE} boards, not {state.size} x {state.size}')
+    return state
+
+
+def _config(game, config):
+    # Rule variant of a game. GameStates carry none, so theirs is given or the default
+    if hasattr(game, 'get_config'):
+        return game.get_config()
+    return towerkrieg.DEFAULT_CONFIG if config is None else config
+
+
+def legal_action_mask(game, rings=False, config=None):
+    """
+    Marks the moves of the player to move in one sweep over all of the player's pieces: the rays of every piece are
+    cast together, one direction and distance at a time, on bitboards of the position
+    Like TowerkriegGame.all_legal_moves, the players' rings are not evaluated unless asked for
+
+    :param game:   game of either backend, or a GameState
+    :param rings:  also drop the moves rejected by the ring verdict, by trying each one (requires a game)
+    :param config: BoardConfig of a GameState, the default config if None; games use their own
+    :return:       (ACTION_COUNT,) bool array
+    """
+
+    state = _state(game)
+    config = _config(game, config)
+    block = config.border == 'block'
+    own, opp = (state.black, state.white) if state.turn == 'x' else (state.white, state.black)
+    occupied = own | opp
+
+    # Pieces: centres of the playable area whose 3 x 3 footprint holds no stone of the opponent
+    attacked = 0
+    for offset in _WINDOW:
+        attacked |= _gather(opp, offset)
+    pieces = _INSIDE & ~attacked
+
+    planes = []
+    for i, step in enumerate(_STEP):
+        reachable = _REACHABLE[i]
+        lead = 0
+        for offset in _LEAD_STEP[i]:
+            lead |= _gather(occupied, offset)
+        # A piece moves in a direction if it holds a stone there; beyond the move limit only with a centre stone
+        clear = pieces & _gather(own, step)
+        for distance in range(1, MAX_DISTANCE + 1):
+            if distance == config.move_limit + 1:
+                clear &= own
+            reach = clear & reachable[distance]
+            if block:
+                # Rule variant: pieces cannot push stones into the border. Once a ray enters it, it stays there
+                entering = own & _gather(_BORDER, step * distance)
+                for offset in _WINDOW:
+                    reach &= ~_gather(entering, offset)
+            planes.append(reach)
+            # Capture ends the ray
+            clear = reach & ~_gather(lead, step * distance)
+            if not clear:
+                break
+        planes.extend([0] * (MAX_DISTANCE - distance))
+
+    bits = np.unpackbits(np.frombuffer(b''.join(plane.to_bytes(_PLANE_BYTES, 'little') for plane in planes),
+                                       dtype=np.uint8), bitorder='little')
+    mask = bits.reshape(len(DIRECTIONS) * MAX_DISTANCE, SIZE, SIZE)[:, 1:-1, 1:-1].reshape(ACTION_COUNT).astype(bool)
+    if rings:
+        _drop_ring_rejections(game, mask)
+    return mask
+
+
+def _drop_ring_rejections(game, mask):
+    for action in np.flatnonzero(mask):
+        if game.push_move(decode_action(action)):
+            game.pop_move()
+        else:
+            mask[action] = False
+
+
+def legal_action_masks(games, rings=False, config=None):
+    """
+    Batched legal_action_mask over many positions: the positions are stacked into boards and swept together by
+    action_masks
+
+    :param games:  games of either backend, or GameStates, all of one BoardConfig
+    :param rings:  see legal_action_mask
+    :param config: see legal_action_mask
+    :return:       (N, ACTION_COUNT) bool array
+    """
+
+    if not len(games):
+        return np.zeros((0, ACTION_COUNT), dtype=bool)
+    configs = {_config(game, config) for game in games}
+    if len(configs) > 1:
+        raise ValueError(f'games of a batch must share one BoardConfig, not {len(configs)}')
+    boards, turns = zip(*(game_array(game) for game in games))
+    masks = action_masks(np.stack(boards), turns, configs.pop())
+    if rings:
+        for game, mask in zip(games, masks):
+            _drop_ring_rejections(game, mask)
+    return masks
+
+
+def game_array(game):
+    """
+    Converts a game or GameState to an int8 array, with the player to move
+
+    :param game: game of either backend, or a GameState
+    :return:     board ((20, 20) array of BLACK, WHITE and EMPTY)
+                 turn  (BLACK or WHITE)
+    """
+
+    state = _state(game)
+    black, white = (np.unpackbits(np.frombuffer(bits.to_bytes(_PLANE_BYTES, 'little'), dtype=np.uint8),
+                                  bitorder='little').reshape(SIZE, SIZE) for bits in (state.black, state.white))
+    return (black.astype(np.int8) - white.astype(np.int8)), (BLACK if state.turn == 'x' else WHITE)
+
+
+def initial_board():
+    """
+    Returns the starting position of TowerkriegGame as an int8 array
+
+    :return: (20, 20) array of BLACK, WHITE and EMPTY
+    """
+
+    return to_array(towerkrieg.TowerkriegGame().get_gameboard())
+
+
+def to_array(board):
+    """
+    Converts a list game board of 'x' / 'o' / None to an int8 array
+
+    :param board: game board
+    :return:      (20, 20) array of BLACK, WHITE and EMPTY
+    """
+
+    values = {'x': BLACK, 'o': WHITE, None: EMPTY}
+    return np.array([[values[square] for square in squares] for squares in board], dtype=np.int8)
+
+
+def _shifted(planes, row, col, fill):
+    """
+    Reads every centre of the playable area at a fixed offset
+
+    :param planes: (N, 18, 18) array over the centres 1 to 18
+    :param row:    row offset
+    :param col:    column offset
+    :param fill:   value of offsets falling outside the playable area
+    :return:       (N, 18, 18) array, out[:, r, c] = planes[:, r + row, c + col]
+    """
+
+    out = np.full_like(planes, fill)
+    if abs(row) < PLAYABLE and abs(col) < PLAYABLE:
+        rows, cols = slice(max(-row, 0), PLAYABLE - max(row, 0)), slice(max(-col, 0), PLAYABLE - max(col, 0))
+        out[:, rows, cols] = planes[:, max(row, 0):PLAYABLE + min(row, 0), max(col, 0):PLAYABLE + min(col, 0)]
+    return out
+
+
+def ring_flags(boards):
+    """
+    Tests every board for rings of both players
+
+    :param boards: (N, 20, 20) int8 boards
+    :return:       black (N bools, True if Black holds a ring)
+                   white (N bools, True if White holds a ring)
+    """
+
+    centre = boards[:, 2:18, 2:18] == EMPTY
+    black = centre.copy()
+    white = centre
+    for r in range(3):
+        for c in range(3):
+            if (r, c) != (1, 1):
+                perimeter = boards[:, 1 + r:17 + r, 1 + c:17 + c]
+                black &= perimeter == BLACK
+                white &= perimeter == WHITE
+    return black.any(axis=(1, 2)), white.any(axis=(1, 2))
+
+
+def _pushed(own, row, col):
+    """
+    Finds the pieces that would push a stone into the border if moved by a fixed offset
+
+    :param own:  (N, 20, 20) stones of the player
+    :param row:  row offset of the move
+    :param col:  column offset of the move
+    :return:     (N, 18, 18) array over the centres 1 to 18
+    """
+
+    pushed = np.zeros((len(own), PLAYABLE, PLAYABLE), dtype=bool)
+    for r in range(-1, 2):
+        for c in range(-1, 2):
+            rows, cols = _CENTRES + r + row, _CENTRES + c + col
+            border = ((rows <= 0) | (rows >= SIZE - 1))[:, None] | ((cols <= 0) | (cols >= SIZE - 1))[None, :]
+            pushed |= own[:, 1 + r:PLAYABLE + 1 + r, 1 + c:PLAYABLE + 1 + c] & border
+    return pushed
+
+
+def action_masks(boards, turns, config=towerkrieg.DEFAULT_CONFIG):
+    """
+    Marks the moves of the player to move on every board, casting the rays of all pieces at once
+    Like TowerkriegGame.all_legal_moves, the players' rings are not evaluated
+
+    :param boards: (N, 20, 20) int8 boards
+    :param turns:  (N,) player to move, BLACK or WHITE
+    :param config: BoardConfig of the boards, for the move limit and border rule
+    :return:       (N, ACTION_COUNT) bool array
+    """
+
+    n = len(boards)
+    turns = np.asarray(turns).reshape(n, 1, 1)
+    own = boards == turns
+    occupied = boards != EMPTY
+
+    # Pieces: centres 1 to 18 whose 3 x 3 footprint holds no stone of the opponent
+    piece = np.ones((n, PLAYABLE, PLAYABLE), dtype=bool)
+    for r in range(3):
+        for c in range(3):
+            piece &= ~(boards[:, r:r + PLAYABLE, c:c + PLAYABLE] == -turns)
+    limit = np.where(own[:, 1:-1, 1:-1], MAX_DISTANCE, config.move_limit)
+
+    masks = np.zeros((n, len(DIRECTIONS), MAX_DISTANCE, PLAYABLE, PLAYABLE), dtype=bool)
+    for i, d in enumerate(DIRECTIONS):
+        # Stones in the squares entered by a piece arriving on each centre
+        lead = np.zeros((n, PLAYABLE, PLAYABLE), dtype=bool)
+        for r, c in towerkrieg.LEADING_EDGE[d]:
+            lead |= occupied[:, 1 + r:PLAYABLE + 1 + r, 1 + c:PLAYABLE + 1 + c]
+
+        clear = piece & own[:, 1 + d[0]:PLAYABLE + 1 + d[0], 1 + d[1]:PLAYABLE + 1 + d[1]]
+        inside = np.ones((1, PLAYABLE, PLAYABLE), dtype=bool)
+        for distance in range(1, MAX_DISTANCE + 1):
+            reach = clear & _shifted(inside, d[0] * distance, d[1] * distance, False) & (distance <= limit)
+            if config.border == 'block':
+                # Rule variant: pieces cannot push stones into the border
+                reach &= ~_pushed(own, d[0] * distance, d[1] * distance)
+            masks[:, i, distance - 1] = reach
+            # Capture ends the ray
+            clear = reach & ~_shifted(lead, d[0] * distance, d[1] * distance, True)
+            if not clear.any():
+                break
+    return masks.reshape(n, ACTION_COUNT)
+
+
+def check_masks(game_class, config, games=3, max_moves=100, seed=0):
+    """
+    Checks legal_action_mask and legal_action_masks against all_legal_moves along random games
+
+    :param game_class: game backend
+    :param config:     BoardConfig of the games, 20 x 20
+    :param games:      number of random games
+    :param max_moves:  moves per game
+    :param seed:       seed of the random moves
+    :return:           number of positions checked; raises AssertionError on a mismatch
+    """
+
+    rng = random.Random(seed)
+    checked = 0
+    for _ in range(games):
+        game = game_class(config=config)
+        for _ in range(max_moves):
+            if game.get_status() != 'incomplete':
+                break
+            moves = game.all_legal_moves(game.get_turn())
+            expected = np.zeros(ACTION_COUNT, dtype=bool)
+            expected[encode_actions(moves)] = True
+            for name, mask in (('legal_action_mask', legal_action_mask(game)),
+                               ('legal_action_masks', legal_action_masks([game])[0])):
+                if not np.array_equal(mask, expected):
+                    raise AssertionError(f'{name} of {game_class.__name__} under {config}: '
+                                         f'{np.count_nonzero(mask & ~expected)} actions too many, '
+                                         f'{np.count_nonzero(expected & ~mask)} missing')
+            checked += 1
+            rng.shuffle(moves)
+            if not any(game.push_move(move) for move in moves):
+                break
+    return checked
+
+
+class BatchTowerkriegEnv():
+    """
+    Steps N Towerkrieg games at once on a (N, 20, 20) int8 array
+    Moves, captures, border wipes and ring verdicts are resolved as batched NumPy operations with the
+        semantics of TowerkriegGame.make_move under the default BoardConfig: a rejected move leaves its game
+        unchanged with the same player to move. Finished games are reset automatically
+    Observations show the stones of the player to move as 1 and the opponent's stones as -1
+    """
+
+    def __init__(self, n, max_moves=None):
+        """
+        :param n:         number of games
+        :param max_moves: moves after which a game ends in a draw, None for no limit
+
+        Private data members:
+            _initial
+        """
+
+        self.n = n
+        self.max_moves = max_moves
+        self._initial = initial_board()
+        self.boards = np.empty((n, SIZE, SIZE), dtype=np.int8)
+        self.turns = np.empty(n, dtype=np.int8)
+        self.states = np.empty(n, dtype=np.int8)
+        self.moves = np.empty(n, dtype=np.int32)
+        self.accepted = np.zeros(n, dtype=bool)
+        self.masks = None
+        self.reset()
+
+    def reset(self, games=None):
+        """
+        Puts games back in the starting position
+
+        :param games: indices or bool mask of the games to reset, all games if None
+        :return:      observations, legal-action masks
+        """
+
+        if games is None:
+            games = np.ones(self.n, dtype=bool)
+        self.boards[games] = self._initial
+        self.turns[games] = BLACK
+        self.states[games] = 0
+        self.moves[games] = 0
+        if self.masks is None:
+            self.masks = action_masks(self.boards, self.turns)
+        else:
+            self.masks[games] = action_masks(self.boards[games], self.turns[games])
+        return self.observe(), self.masks
+
+    def observe(self):
+        return self.boards * self.turns[:, None, None]
+
+    def step(self, actions):
+        """
+        Plays one action in every game
+
+        :param actions: (N,) action indices (see encode_action)
+        :return:        observations  ((N, 20, 20) int8, after automatic reset of finished games)
+                        rewards       ((N,) float32, +1 / -1 if the acting player won / lost)
+                        dones         ((N,) bool, True if the game ended and was reset)
+                        masks         ((N, ACTION_COUNT) bool, legal actions of the player to move)
+        """
+
+        n = self.n
+        games = np.arange(n)
+        actions = np.asarray(actions, dtype=np.int64)
+        valid = (actions >= 0) & (actions < ACTION_COUNT)
+        actions = np.where(valid, actions, 0)
+
+        plane, square = np.divmod(actions, PLAYABLE * PLAYABLE)
+        direction, distance = np.divmod(plane, MAX_DISTANCE)
+        distance += 1
+        s_row, s_col = square // PLAYABLE + 1, square % PLAYABLE + 1
+        d_row, d_col = _DIR_ROW[direction], _DIR_COL[direction]
+        e_row, e_col = s_row + d_row * distance, s_col + d_col * distance
+        valid &= (e_row >= 1) & (e_row <= PLAYABLE) & (e_col >= 1) & (e_col <= PLAYABLE)
+
+        # Footprint: no stone of the opponent, a stone in the direction of movement, 3-square limit
+        turns = self.turns
+        window = self.boards[games[:, None, None], s_row[:, None, None] + _OFFSETS[None, :, None],
+                             s_col[:, None, None] + _OFFSETS[None, None, :]]
+        valid &= ~(window == -turns[:, None, None]).any(axis=(1, 2))
+        valid &= window[games, 1 + d_row, 1 + d_col] == turns
+        valid &= (window[:, 1, 1] == turns) | (distance <= 3)
+        pattern = np.where(window == turns[:, None, None], window, EMPTY).astype(np.int8)
+
+        # Advance the pieces one step at a time on a working copy of the boards
+        work = self.boards.copy()
+        states = self.states.copy()
+        for step in range(1, int(distance[valid].max(initial=0)) + 1):
+            active = games[valid & (distance >= step)]
+            row, col = s_row[active] + d_row[active] * step, s_col[active] + d_col[active] * step
+
+            # Stones in the squares entered by the piece are captured, which is only allowed on the last step
+            lead = work[active[:, None], row[:, None] + _LEAD_ROW[direction[active]],
+                        col[:, None] + _LEAD_COL[direction[active]]]
+            blocked = (lead != EMPTY).any(axis=1) & (distance[active] > step)
+            valid[active[blocked]] = False
+            active, row, col = active[~blocked], row[~blocked], col[~blocked]
+
+            # Lift the piece from its previous window and lay it on the new one
+            prev_row, prev_col = row - d_row[active], col - d_col[active]
+            work[active[:, None, None], prev_row[:, None, None] + _OFFSETS[None, :, None],
+                 prev_col[:, None, None] + _OFFSETS[None, None, :]] = EMPTY
+            work[active[:, None, None], row[:, None, None] + _OFFSETS[None, :, None],
+                 col[:, None, None] + _OFFSETS[None, None, :]] = pattern[active]
+
+            # Ring verdict of TowerkriegGame.ring_verdict for the player to move
+            black, white = ring_flags(work[active])
+            black_turn = turns[active] == BLACK
+            rejected = (black & ~white & ~black_turn) | (~black & ~white & ~black_turn) | (~black & white)
+            states[active[black & ~white & black_turn]] = BLACK
+            states[active[~black & ~white & black_turn]] = WHITE
+            valid[active[rejected]] = False
+
+        # Commit accepted moves, wipe-out stones in the border zone and switch player turn
+        self.accepted = valid
+        self.boards[valid] = work[valid]
+        self.boards[:, (0, SIZE - 1), :] = EMPTY
+        self.boards[:, :, (0, SIZE - 1)] = EMPTY
+        self.states[valid] = states[valid]
+        self.moves[valid] += 1
+        movers = turns.copy()
+        self.turns[valid] = -turns[valid]
+
+        rewards = (self.states * movers).astype(np.float32)
+        self.masks = action_masks(self.boards, self.turns)
+        dones = (self.states != 0) | ~self.masks.any(axis=1)
+        if self.max_moves is not None:
+            dones |= self.moves >= self.max_moves
+        if dones.any():
+            self.reset(dones)
+        return self.observe(), rewards, dones, self.masks
@@ -1,4 +1,8 @@
+import concurrent.futures
+import queue
 import towerkrieg
+import towerkrieg_cache
+import towerkrieg_search
 import tkinter as tk
 
 
@@ -9,18 +13,27 @@ class GUI:
     border_color = "#b35900"
     square_color = "#999966"
     accent = "yellow"
-    rows = 20
-    columns = 20
     square_size = 32
+    engine_player = None        # 'x' or 'o' when playing against the engine
+    engine_time = 2.0           # seconds per engine move
+    poll_interval = 50          # milliseconds between checks for worker results
+    cache_path = None           # towerkrieg_cache file shared by the engine and hints, None for no cache
 
     def __init__(self, parent, tkriegboard):
         self.tkriegboard = tkriegboard
         self.parent = parent
+        # Board geometry of the game's BoardConfig
+        self.rows = self.columns = tkriegboard.get_config().size
+        self.labels = towerkrieg.column_labels(self.columns)
 
         # Build Menu
         self.menubar = tk.Menu(parent)
         self.filemenu = tk.Menu(self.menubar, tearoff=0)
         self.filemenu.add_command(label="New Game", command=self.new_game)
+        self.filemenu.add_command(label="Play Black vs Engine", command=lambda: self.new_game('o'))
+        self.filemenu.add_command(label="Play White vs Engine", command=lambda: self.new_game('x'))
+        self.filemenu.add_command(label="Hint", command=self.request_hint)
+        self.filemenu.add_command(label="Undo Move", command=self.undo_move)
         self.menubar.add_cascade(label="File", menu=self.filemenu)
         self.parent.config(menu=self.menubar)
 
@@ -37,19 +50,160 @@ class GUI:
         self.canvas = tk.Canvas(parent, width=canvas_width,
                                height=canvas_height)
         self.canvas.pack(padx=8, pady=8)
+
+        # Canvas items are created once and updated in place: one rectangle and one (possibly hidden) stone
+        # sprite per square, keyed by board (row, col), along with what each currently shows
+        self._squares = {}
+        self._square_fills = {}
+        self._sprites = {}
+        self._sprite_stones = {}
+        self.create_canvas_items()
+
+        # Move generation and engine search run in a worker thread on a clone of the game, so the Tk loop never
+        # blocks. Results are posted to a queue polled with after(); only the latest request's result is used
+        self._worker = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._results = queue.Queue()
+        self._request = 0
+        self._pending = None
+        self._polling = False
+        self._engine = None
         self.show_gameboard()
         self.canvas.bind("<Button-1>", self.mouse_selection)
 
-    def new_game(self):
+    def new_game(self, engine_player=None):
+        self.cancel_request()
+        self.engine_player = engine_player
         self.tkriegboard.initialize_board()
+        self.selected_square = None
+        self.legal_moves = None
         self.show_gameboard()
         self.show_gamepieces()
         self.info_label.config(text="   Black has first move   ", fg='red')
+        self.request_engine_move()
+
+    def undo_move(self):
+        self.cancel_request()
+        if self.tkriegboard.pop_move() is None:
+            # No move to take back
+            return
+        if self.tkriegboard.get_turn() == self.engine_player:
+            # Take back the engine's reply as well as the player's move
+            self.tkriegboard.pop_move()
+        self.selected_square = None
+        self.legal_moves = None
+        self.show_gameboard()
+        self.show_gamepieces()
+        turn = 'Black' if self.tkriegboard.get_turn() == 'x' else 'White'
+        self.info_label['text'] = f'   Move taken back    {turn}\'s turn   '
+        self.request_engine_move()
+
+    def close(self):
+        self.cancel_request()
+        if self._engine is not None and self._engine.cache is not None:
+            # Closed by the worker thread once any running search has stopped
+            self._worker.submit(self._engine.cache.close)
+        self._worker.shutdown(wait=False)
+
+    def submit_request(self, kind, function, *args):
+        """
+        Runs a function in the worker thread, replacing any pending request
+
+        :param kind:     name of the request, passed to handle_result with its result
+        :param function: callable run in the worker thread; must not touch Tk or the displayed game
+        :param args:     arguments of the function
+        """
+
+        self.cancel_request()
+        request = self._request
+
+        def run():
+            # A stop of the engine from here on belongs to this request, and one of an older request is cleared.
+            # A cancel that came first is seen in the request number
+            if self._engine is not None:
+                self._engine.resume()
+            if request != self._request:
+                return
+            self._results.put((request, kind, function(*args)))
+
+        self._pending = self._worker.submit(run)
+        if not self._polling:
+            self._polling = True
+            self.parent.after(self.poll_interval, self.poll_results)
+
+    def cancel_request(self):
+        # Results of older requests are discarded when they arrive
+        self._request += 1
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+        if self._engine is not None:
+            self._engine.stop()
+
+    def poll_results(self):
+        while True:
+            try:
+                request, kind, result = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if request == self._request:
+                self._pending = None
+                self.handle_result(kind, result)
+        if self._pending is not None:
+            self.parent.after(self.poll_interval, self.poll_results)
+        else:
+            self._polling = False
+
+    def handle_result(self, kind, result):
+        if kind == 'moves':
+            if result is not None:
+                self.selected_square, self.legal_moves = result
+                self.show_gameboard()
+        elif kind == 'hint':
+            if result is None:
+                self.info_label['text'] = '   No move available   '
+                return
+            # Highlight the hinted piece's destination; clicking it plays the move
+            self.selected_square, self.legal_moves = result[0], [result[1]]
+            self.show_gameboard()
+            pos1, pos2 = self.notation(result[0]), self.notation(result[1])
+            self.info_label['text'] = f'   Hint : {pos1}->{pos2}   '
+        elif kind == 'engine':
+            if result is None:
+                self.info_label['text'] = '   Engine has no move   '
+                return
+            self.move(result[0], result[1])
+            self.show_gameboard()
+            self.show_gamepieces()
+
+    def get_engine(self):
+        if self._engine is None:
+            cache = towerkrieg_cache.PositionCache(self.cache_path) if self.cache_path is not None else None
+            self._engine = towerkrieg_search.AlphaBetaSearch(time_limit=self.engine_time, cache=cache)
+        return self._engine
+
+    def request_hint(self):
+        if self.tkriegboard.get_status() != 'incomplete' or self.tkriegboard.get_turn() == self.engine_player:
+            return
+        self.selected_square = None
+        self.legal_moves = None
+        self.show_gameboard()
+        self.submit_request('hint', self.get_engine().choose_move, self.tkriegboard.clone())
+        self.info_label['text'] = '   Thinking ...   '
+
+    def request_engine_move(self):
+        if self.tkriegboard.get_turn() != self.engine_player or self.tkriegboard.get_status() != 'incomplete':
+            return
+        self.submit_request('engine', self.get_engine().choose_move, self.tkriegboard.clone())
+        # Thinking indicator, replaced by the move once the engine has played
+        self.info_label['text'] = self.info_label['text'].rstrip() + '    Engine thinking ...   '
 
     def mouse_selection(self, event):
         if self.tkriegboard.get_status() in ['black_victory','white_victory']:
             # Match has already been won
             return
+        if self.tkriegboard.get_turn() == self.engine_player:
+            # Engine is thinking
+            return
 
         col_size = row_size = self.square_size
         # Obtain mouse click input
@@ -64,18 +218,17 @@ class GUI:
             self.legal_moves = None
             self.show_gameboard()
             self.show_gamepieces()
+            self.request_engine_move()
         else:
-            # 3 x 3 gamepiece is being selected
+            # 3 x 3 gamepiece is being selected. Highlights appear once the worker has found its moves
             self.show_moves(selected_row, selected_column)
-            self.show_gameboard()
 
     def move(self, p1, p2):
         move_result = self.tkriegboard.make_move(p1, p2, 1)     # axes = 1 bypasses axes conversion method
         turn = 'Black' if self.tkriegboard.get_turn() == 'x' else 'White'
         color = 'White' if self.tkriegboard.get_turn() == 'x' else 'Black'
-        # Convert position to game notation (i.e. (2,2) represented as 'C3')
-        pos1 = chr(p1[1]+65) + str(20-p1[0])
-        pos2 = chr(p2[1]+65) + str(20-p2[0])
+        # Convert position to game notation (i.e. (2,2) represented as 'C18')
+        pos1, pos2 = self.notation(p1), self.notation(p2)
 
         # Populate informational text box at bottom of board
         if self.tkriegboard.get_status() == 'white_victory':
@@ -87,62 +240,86 @@ class GUI:
         elif move_result:
             self.info_label['text'] = f'{color} : {pos1}->{pos2}    {turn}\'s turn'
 
+    def notation(self, square):
+        return self.labels[square[1]].upper() + str(self.rows - square[0])
+
     def show_moves(self, row, col):
-        board = self.tkriegboard.get_gameboard()
-        footprint, footprint_none = self.tkriegboard.make_footprint(board, row, col)
+        self.submit_request('moves', self.find_moves, self.tkriegboard.clone(), row, col)
+
+    @staticmethod
+    def find_moves(game, row, col):
+        # Runs in the worker thread. Returns the selected square and its moves, None if it is not a piece
+        board = game.get_gameboard()
+        footprint, footprint_none = game.make_footprint(board, row, col)
         if (footprint, footprint_none) != ([-1], [-1]) and len(footprint) > 0:
-            self.selected_square = (row, col)
-            self.legal_moves = self.tkriegboard.moves_available(row, col)
+            return (row, col), game.moves_available(row, col)
+        return None
 
-    def show_gameboard(self):
+    def create_canvas_items(self):
         for row in range(self.rows):
             for col in range(self.columns):
-                x1 = (col * self.square_size)
-                # Recall: In game coordinate system, first row is Row 20
-                y1 = ((19 - row) * self.square_size)
-                x2 = x1 + self.square_size
-                y2 = y1 + self.square_size
-                if (self.legal_moves is not None and (19-row, col) in self.legal_moves):
-                    # Highlight squares of eligible moves
-                    self.canvas.create_rectangle(x1, y1, x2, y2,
-                                                 fill=self.accent,
-                                                 tags="area")
-                else:
-                    # Create squares in game area (#999966) and borders (#b35900)
-                    self.canvas.create_rectangle(x1, y1, x2, y2, fill=self.border_color if row*col*(row-19)*(col-19) == 0 else self.square_color,
-                                                 tags="area")
-        self.canvas.tag_raise("occupied")
-        self.canvas.tag_lower("area")
+                x1 = col * self.square_size
+                y1 = row * self.square_size
+                fill = self.square_fill(row, col)
+                self._squares[(row, col)] = self.canvas.create_rectangle(x1, y1, x1 + self.square_size,
+                                                                         y1 + self.square_size, fill=fill,
+                                                                         tags="area")
+                self._square_fills[(row, col)] = fill
+        # Sprites are created after the squares so they stay on top
+        for row in range(self.rows):
+            for col in range(self.columns):
+                x0 = (col * self.square_size) + int(self.square_size / 2)
+                y0 = (row * self.square_size) + int(self.square_size / 2)
+                self._sprites[(row, col)] = self.canvas.create_image(x0, y0, anchor="c", state=tk.HIDDEN,
+                                                                     tags="occupied")
+                self._sprite_stones[(row, col)] = None
+
+    def square_fill(self, row, col):
+        if self.legal_moves is not None and (row, col) in self.legal_moves:
+            # Highlight squares of eligible moves
+            return self.accent
+        # Squares in game area (#999966) and borders (#b35900)
+        last = self.rows - 1
+        return self.border_color if row*col*(row-last)*(col-last) == 0 else self.square_color
+
+    def show_gameboard(self):
+        # Only squares whose highlight changed since the last call are reconfigured
+        for square, item in self._squares.items():
+            fill = self.square_fill(*square)
+            if fill != self._square_fills[square]:
+                self.canvas.itemconfig(item, fill=fill)
+                self._square_fills[square] = fill
 
     def show_gamepieces(self):
-        self.canvas.delete("occupied")
+        # Only sprites whose square changed occupancy since the last call are reconfigured
         board = self.tkriegboard.get_gameboard()
-        for y, row in enumerate(board):
-            for x, piece in enumerate(row):
-                if piece == 'x':
-                    filename = 'towerkrieg_images/black.png'
-                elif piece == 'o':
-                    filename = 'towerkrieg_images/white.png'
-                else:
-                    continue
-                piecename = "%s%s%s" % (piece, str(x).zfill(2), str(y).zfill(2))
-                if filename not in self.images:
-                    self.images[filename] = tk.PhotoImage(file=filename)
-                self.canvas.create_image(0, 0, image=self.images[filename],
-                                         tags=(piecename, "occupied"),
-                                         anchor="c")
-                y0 = (y * self.square_size) + int(self.square_size / 2)
-                x0 = (x * self.square_size) + int(self.square_size / 2)
-                self.canvas.coords(piecename, x0, y0)
-
-
-def main(tkriegboard):
+        for (row, col), item in self._sprites.items():
+            piece = board[row][col]
+            if piece == self._sprite_stones[(row, col)]:
+                continue
+            if piece == 'x':
+                filename = 'towerkrieg_images/black.png'
+            elif piece == 'o':
+                filename = 'towerkrieg_images/white.png'
+            else:
+                self.canvas.itemconfig(item, state=tk.HIDDEN)
+                self._sprite_stones[(row, col)] = piece
+                continue
+            if filename not in self.images:
+                self.images[filename] = tk.PhotoImage(file=filename)
+            self.canvas.itemconfig(item, image=self.images[filename], state=tk.NORMAL)
+            self._sprite_stones[(row, col)] = piece
+
+
+def main(tkriegboard, cache_path=None):
     root = tk.Tk()
     root.title("Towerkrieg")
     gui = GUI(root, tkriegboard)
+    gui.cache_path = cache_path
     gui.show_gameboard()
     gui.show_gamepieces()
     root.mainloop()
+    gui.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,341 @@
+import math
+import random
+import time
+
+import towerkrieg_search
+
+
+class Node():
+    """
+    Node of the search tree. Values are kept from the point of view of the player whose move leads to the node
+    """
+
+    __slots__ = ('move', 'player', 'prior', 'visits', 'value', 'children')
+
+    def __init__(self, move, player, prior):
+        """
+        :param move:   move leading to the node, None for the root
+        :param player: player making the move ('x' or 'o')
+        :param prior:  prior probability of the move
+        """
+
+        self.move = move
+        self.player = player
+        self.prior = prior
+        self.visits = 0
+        self.value = 0.0
+        self.children = None
+
+
+class MCTSResult():
+    """
+    Outcome of a Monte Carlo tree search, merged over all workers
+    """
+
+    def __init__(self, move, visits, values, playouts, seconds):
+        """
+        :param move:     most visited move, None if the player to move has no move
+        :param visits:   dictionary of root move -> visit count
+        :param values:   dictionary of root move -> mean value for the player to move
+        :param playouts: playouts run by all workers
+        :param seconds:  wall time of the search
+        """
+
+        self.move = move
+        self.visits = visits
+        self.values = values
+        self.playouts = playouts
+        self.seconds = seconds
+        self.pps = playouts / seconds if seconds > 0 else 0.0
+
+    def __repr__(self):
+        return (f'MCTSResult(move={self.move}, visits={self.visits.get(self.move, 0)}, '
+                f'value={self.values.get(self.move, 0.0):.3f}, playouts={self.playouts}, pps={self.pps:.0f})')
+
+
+def rollout_value(game, player, depth, rng):
+    """
+    Plays random moves from the current position and scores the outcome
+    A playout that is still undecided after depth moves is scored by the default evaluation
+
+    :param game:   game in the position to play out; restored before returning
+    :param player: player whose point of view is scored
+    :param depth:  maximum number of moves played
+    :param rng:    random.Random instance
+    :return:       value in [-1, 1] for player
+    """
+
+    pushed = 0
+    try:
+        while pushed < depth and game.get_status() == 'incomplete':
+            moves = game.all_legal_moves(game.get_turn())
+            rng.shuffle(moves)
+            for move in moves:
+                if game.push_move(move):
+                    pushed += 1
+                    break
+            else:
+                # Player to move has no move. Scored as a draw
+                return 0.0
+        return terminal_value(game, player)
+    finally:
+        for _ in range(pushed):
+            game.pop_move()
+
+
+def terminal_value(game, player):
+    """
+    Scores a position for a player: 1 / -1 for a win / loss, the clipped default evaluation otherwise
+
+    :param game:   game in the position to score
+    :param player: player whose point of view is scored
+    :return:       value in [-1, 1]
+    """
+
+    status = game.get_status()
+    if status != 'incomplete':
+        winner = 'x' if status == 'black_victory' else 'o'
+        return 1.0 if winner == player else -1.0
+    value = towerkrieg_search.evaluate(game) / (2 * towerkrieg_search.RING_WEIGHT)
+    if game.get_turn() != player:
+        value = -value
+    return max(-1.0, min(1.0, value))
+
+
+class TreeSearch():
+    """
+    Single-threaded UCT / PUCT tree search from the current position of a game
+    Moves are applied in place with push_move / pop_move; the game is restored after every playout
+    """
+
+    def __init__(self, exploration=1.4, policy=None, rollout_depth=40, seed=None):
+        """
+        :param exploration:   exploration constant of the selection formula
+        :param policy:        callable (game, moves) -> list of priors. Enables PUCT selection; UCT if None
+        :param rollout_depth: maximum number of random moves per playout
+        :param seed:          seed of the random number generator
+        """
+
+        self.exploration = exploration
+        self.policy = policy
+        self.rollout_depth = rollout_depth
+        self.rng = random.Random(seed)
+
+    def run(self, game, playouts=None, time_limit=None):
+        """
+        Runs playouts from the current position until the playout or time budget runs out
+
+        :param game:       game in the position to search
+        :param playouts:   number of playouts, None for no limit
+        :param time_limit: seconds, None for no limit
+        :return:           root node and the number of playouts run
+        """
+
+        root = Node(None, None, 1.0)
+        deadline = time.perf_counter() + time_limit if time_limit is not None else None
+        count = 0
+        while playouts is None or count < playouts:
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+            if not self.playout(game, root):
+                # Player to move has no move
+                break
+            count += 1
+        return root, count
+
+    def expand(self, game, node):
+        """
+        Creates the children of a node for every move of the player to move
+
+        :param game: game in the position of the node
+        :param node: node to expand
+        """
+
+        moves = game.all_legal_moves(game.get_turn())
+        if self.policy is not None:
+            priors = self.policy(game, moves)
+        else:
+            priors = [1.0 / len(moves)] * len(moves) if moves else []
+        children = [Node(move, game.get_turn(), prior) for move, prior in zip(moves, priors)]
+        # Unvisited children are tried in random order
+        self.rng.shuffle(children)
+        node.children = children
+
+    def select(self, node):
+        """
+        Picks the child of a node maximising the UCT (or PUCT, with a policy) score
+
+        :param node: expanded node with at least one child
+        :return:     selected child
+        """
+
+        log_visits = math.log(node.visits + 1)
+        sqrt_visits = math.sqrt(node.visits + 1)
+        best, best_score = None, -math.inf
+        for child in node.children:
+            if self.policy is None:
+                if child.visits == 0:
+                    return child
+                score = child.value / child.visits + self.exploration * math.sqrt(log_visits / child.visits)
+            else:
+                q = child.value / child.visits if child.visits else 0.0
+                score = q + self.exploration * child.prior * sqrt_visits / (1 + child.visits)
+            if score > best_score:
+                best, best_score = child, score
+        return best
+
+    def playout(self, game, root):
+        """
+        Runs one selection / expansion / rollout / backpropagation cycle
+
+        :param game: game in the position of the root
+        :param root: root node
+        :return:     False if the player to move at the root has no move, True otherwise
+        """
+
+        path = [root]
+        node = root
+        pushed = 0
+        try:
+            while game.get_status() == 'incomplete':
+                if node.children is None:
+                    self.expand(game, node)
+                if not node.children:
+                    break
+                child = self.select(node)
+                if not game.push_move(child.move):
+                    # Move disrupts player's sole ring. Drop it from the tree
+                    node.children.remove(child)
+                    continue
+                pushed += 1
+                node = child
+                path.append(node)
+                if node.visits == 0:
+                    break
+
+            if len(path) == 1 and not root.children:
+                return False
+
+            # Score the leaf for Black, then credit every node from the point of view of its mover
+            value = rollout_value(game, 'x', self.rollout_depth, self.rng)
+        finally:
+            for _ in range(pushed):
+                game.pop_move()
+
+        for node in path:
+            node.visits += 1
+            node.value += value if node.player == 'x' else -value
+        return True
+
+
+def _worker_search(game, playouts, time_limit, settings, seed):
+    """
+    Runs one independent tree search. Executed in a worker process for root parallelisation
+
+    :return: dictionary of root move -> (visits, total value), and the number of playouts run
+    """
+
+    search = TreeSearch(seed=seed, **settings)
+    root, count = search.run(game, playouts, time_limit)
+    return {child.move: (child.visits, child.value) for child in root.children or []}, count
+
+
+def _worker_search_state(game_class, state, config, playouts, time_limit, settings, seed):
+    # Worker processes receive the compact GameState of the position and the BoardConfig of its rules rather than
+    # a pickled game
+    return _worker_search(game_class(state, config), playouts, time_limit, settings, seed)
+
+
+class MCTSPlayer():
+    """
+    Monte Carlo tree search player
+    With workers > 1, independent trees are grown from the root in a process pool and their root visit
+        statistics are merged (root parallelisation). The policy callable must then be picklable
+    """
+
+    # Engine name of the results kept in a PositionCache: mean playout values in [-1, 1] and playout counts
+    CACHE_ENGINE = 'mcts'
+
+    def __init__(self, playouts=1000, time_limit=None, workers=1, exploration=1.4, policy=None,
+                 rollout_depth=40, seed=None, cache=None):
+        """
+        :param playouts:      playouts per move, shared by the workers; None for no limit
+        :param time_limit:    seconds per move, None for no limit
+        :param workers:       number of worker processes, 1 to search in the calling process
+        :param exploration:   exploration constant of the selection formula
+        :param policy:        callable (game, moves) -> list of priors. Enables PUCT selection; UCT if None
+        :param rollout_depth: maximum number of random moves per playout
+        :param seed:          seed of the random number generators
+        :param cache:         towerkrieg_cache.PositionCache of root results shared across searches and processes
+
+        Private data members:
+            _pool
+            _rng
+        """
+
+        if playouts is None and time_limit is None:
+            raise ValueError('MCTSPlayer needs a playout or time budget')
+        self.playouts = playouts
+        self.time_limit = time_limit
+        self.workers = workers
+        self.settings = {'exploration': exploration, 'policy': policy, 'rollout_depth': rollout_depth}
+        self.cache = cache
+        self._rng = random.Random(seed)
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def choose_move(self, game):
+        return self.search(game).move
+
+    def search(self, game):
+        """
+        Searches the current position of a game
+
+        :param game: game to search; must not be finished. Left in its original position
+        :return:     MCTSResult
+        """
+
+        start = time.perf_counter()
+        if self.cache is not None and self.playouts is not None:
+            entry = self.cache.probe(game, self.CACHE_ENGINE)
+            if entry is not None and entry[1] is not None and entry[3] >= self.playouts:
+                # Cached result is backed by at least as many playouts as this search
+                value, move, _, visits = entry
+                return MCTSResult(move, {move: visits}, {move: value}, 0, time.perf_counter() - start)
+
+        seeds = [self._rng.getrandbits(32) for _ in range(self.workers)]
+        if self.workers == 1:
+            results = [_worker_search(game, self.playouts, self.time_limit, self.settings, seeds[0])]
+        else:
+            if self._pool is None:
+                import concurrent.futures
+                self._pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+            share = None if self.playouts is None else -(-self.playouts // self.workers)
+            state = game.get_state()
+            futures = [self._pool.submit(_worker_search_state, type(game), state, game.get_config(), share,
+                                         self.time_limit, self.settings, seed)
+                       for seed in seeds]
+            results = [future.result() for future in futures]
+
+        # Merge the root statistics of all workers
+        visits, totals, playouts = {}, {}, 0
+        for stats, count in results:
+            playouts += count
+            for move, (n, w) in stats.items():
+                visits[move] = visits.get(move, 0) + n
+                totals[move] = totals.get(move, 0.0) + w
+        values = {move: totals[move] / visits[move] for move in visits if visits[move]}
+        move = max(visits, key=lambda m: (visits[m], values.get(m, 0.0))) if visits else None
+        if self.cache is not None and move is not None:
+            self.cache.store(game, values.get(move, 0.0), move, 0, playouts, self.CACHE_ENGINE)
+        return MCTSResult(move, visits, values, playouts, time.perf_counter() - start)
@@ -0,0 +1,141 @@
+import collections
+import threading
+
+
+class MoveCache():
+    """
+    Bounded cache of the move lists of moves_available, keyed by position (Zobrist hash) and piece centre
+    Every entry records the squares read to generate it: the 3 x 3 footprint of the piece and of every destination,
+    which hold the squares entered along its rays. After a move, the entries of the position left behind are
+    carried over to the new position, except those reading a changed square
+    A game shares its cache with its clones; the cache is thread-safe and evicts the least recently used positions
+    """
+
+    def __init__(self, size, capacity=1024):
+        """
+        :param size:     number of rows and columns of the board
+        :param capacity: move lists kept
+
+        Private data members:
+            _entries
+            _lock
+            _positions
+        """
+
+        self.size = size
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.carried = 0
+        self.dropped = 0
+        # Position hash -> {(player, row, col): (destinations, squares read)}, in order of use
+        self._positions = collections.OrderedDict()
+        self._entries = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._entries
+
+    def holds(self, key):
+        """
+        :param key: Zobrist hash of a position
+        :return:    True if move lists of the position are cached
+        """
+        return key in self._positions
+
+    def probe(self, key, player, row, col):
+        """
+        :param key:    Zobrist hash of the position
+        :param player: owner of the piece ('x' or 'o')
+        :param row:    row of the piece's center
+        :param col:    column of the piece's center
+        :return:       tuple of (row, col) destinations, None if the move list is not cached
+        """
+
+        with self._lock:
+            entries = self._positions.get(key)
+            if entries is not None:
+                entry = entries.get((player, row, col))
+                if entry is not None:
+                    self._positions.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+            self.misses += 1
+            return None
+
+    def store(self, key, player, row, col, moves):
+        """
+        Stores the move list of a piece
+
+        :param key:    Zobrist hash of the position
+        :param player: owner of the piece ('x' or 'o')
+        :param row:    row of the piece's center
+        :param col:    column of the piece's center
+        :param moves:  (row, col) destinations
+        """
+
+        # Squares read: the footprints of the piece and of all its destinations, one 3-bit row at a time
+        size = self.size
+        reads = 0
+        for r, c in [(row, col)] + list(moves):
+            square = (r - 1) * size + c - 1
+            reads |= 7 << square | 7 << (square + size) | 7 << (square + 2 * size)
+        with self._lock:
+            entries = self._positions.setdefault(key, {})
+            self._positions.move_to_end(key)
+            if (player, row, col) not in entries:
+                self._entries += 1
+            entries[player, row, col] = (tuple(moves), reads)
+            self._evict()
+
+    def carry(self, key, new_key, changed):
+        """
+        Carries the move lists of a position over to the position reached from it by a move or an undo
+        Move lists reading one of the changed squares are dropped
+
+        :param key:     Zobrist hash of the position left behind
+        :param new_key: Zobrist hash of the new position
+        :param changed: bitboard (row * size + col) of the squares whose stones changed
+        """
+
+        with self._lock:
+            entries = self._positions.pop(key, None)
+            if entries is None:
+                return
+            self._entries -= len(entries)
+            kept = {piece: entry for piece, entry in entries.items() if not entry[1] & changed}
+            self.dropped += len(entries) - len(kept)
+            self.carried += len(kept)
+            target = self._positions.setdefault(new_key, {})
+            self._positions.move_to_end(new_key)
+            self._entries -= len(target)
+            kept.update(target)
+            self._positions[new_key] = kept
+            self._entries += len(kept)
+            self._evict()
+
+    def _evict(self):
+        while self._entries > self.capacity and len(self._positions) > 1:
+            _, entries = self._positions.popitem(last=False)
+            self._entries -= len(entries)
+
+    def clear(self):
+        with self._lock:
+            self._positions.clear()
+            self._entries = 0
+
+    def get_stats(self):
+        """
+        Returns the hit / miss counters of the cache
+
+        :return: dictionary of hits, misses, hit rate, move lists carried over and dropped by moves, and move lists
+                 held
+        """
+
+        probes = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / probes if probes else 0.0,
+                'carried': self.carried,
+                'dropped': self.dropped,
+                'entries': self._entries}
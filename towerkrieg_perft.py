@@ -0,0 +1,186 @@
+import argparse
+import json
+import os
+import random
+import time
+
+import towerkrieg
+import towerkrieg_bitboard
+
+
+# Reference node counts and benchmark positions, stored next to this module
+REFERENCE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'towerkrieg_perft.json')
+
+BACKENDS = {'list': towerkrieg.TowerkriegGame, 'bitboard': towerkrieg_bitboard.BitboardTowerkriegGame}
+
+# Rule variants whose move generation check_generation checks
+GENERATION_CONFIGS = [towerkrieg.BoardConfig(20, border='block'),
+                      towerkrieg.BoardConfig(20, move_limit=5, border='block'),
+                      towerkrieg.BoardConfig(12, border='block')]
+
+# Rule variants whose legal action masks (towerkrieg_env, 20 x 20 boards only) are checked with them
+MASK_CONFIGS = [towerkrieg.BoardConfig(20, move_limit=5), towerkrieg.BoardConfig(20, border='block'),
+                towerkrieg.BoardConfig(20, move_limit=5, border='block')]
+
+
+def perft(game, depth):
+    """
+    Counts the positions reached by every sequence of accepted moves of a given length
+    A move counts if push_move accepts it, so moves that disrupt the player's sole ring are excluded
+
+    :param game:  game in the position to count from; left unchanged
+    :param depth: number of moves
+    :return:      number of leaf positions
+    """
+
+    if depth == 0:
+        return 1
+    if game.get_status() != 'incomplete':
+        return 0
+    nodes = 0
+    for move in game.all_legal_moves(game.get_turn()):
+        if game.push_move(move):
+            nodes += perft(game, depth - 1)
+            game.pop_move()
+    return nodes
+
+
+def divide(game, depth):
+    """
+    Breaks perft down by first move
+
+    :param game:  game in the position to count from; left unchanged
+    :param depth: number of moves, at least 1
+    :return:      dictionary of first move -> number of leaf positions
+    """
+
+    counts = {}
+    for move in game.all_legal_moves(game.get_turn()):
+        if game.push_move(move):
+            counts[move] = perft(game, depth - 1)
+            game.pop_move()
+    return counts
+
+
+def load_reference(path=REFERENCE_FILE):
+    with open(path) as reference:
+        return json.load(reference)
+
+
+def check(game_class, max_depth=None, path=REFERENCE_FILE):
+    """
+    Compares perft from the start position with the reference counts
+
+    :param game_class: game backend
+    :param max_depth:  deepest reference count checked, all if None
+    :param path:       reference file
+    :return:           list of (depth, expected, counted, seconds); raises AssertionError on a mismatch
+    """
+
+    results = []
+    for depth, expected in sorted((int(depth), count) for depth, count in load_reference(path)['perft'].items()):
+        if max_depth is not None and depth > max_depth:
+            continue
+        start = time.perf_counter()
+        counted = perft(game_class(), depth)
+        results.append((depth, expected, counted, time.perf_counter() - start))
+        if counted != expected:
+            raise AssertionError(f'perft({depth}) of {game_class.__name__}: expected {expected}, counted {counted}')
+    return results
+
+
+def check_generation(game_class, config, games=5, max_moves=100, seed=0):
+    """
+    Checks all_legal_moves against push_move along random games
+    The border rule must reject no generated move: a move is rejected only where the same position under border
+        'wipe' rejects it too, i.e. for disrupting the player's sole ring. Conversely every accepted move of the
+        'wipe' variant that the config accepts must be generated
+
+    :param game_class: game backend
+    :param config:     BoardConfig checked
+    :param games:      number of random games
+    :param max_moves:  moves per game
+    :param seed:       seed of the random moves
+    :return:           number of moves checked; raises AssertionError on a mismatch
+    """
+
+    rng = random.Random(seed)
+    wipe = towerkrieg.BoardConfig(config.size, config.layout, config.move_limit, 'wipe')
+    checked = 0
+    for _ in range(games):
+        game, twin = game_class(config=config), game_class(config=wipe)
+        for _ in range(max_moves):
+            if game.get_status() != 'incomplete':
+                break
+            player = game.get_turn()
+            moves = game.all_legal_moves(player)
+            accepted = []
+            for move in moves:
+                if game.push_move(move):
+                    game.pop_move()
+                    accepted.append(move)
+                elif twin.push_move(move):
+                    raise AssertionError(f'{game_class.__name__} under {config}: generated move {move} is rejected '
+                                         f'by the border rule')
+            generated = set(moves)
+            for move in twin.all_legal_moves(player):
+                if move not in generated and game.push_move(move):
+                    raise AssertionError(f'{game_class.__name__} under {config}: accepted move {move} is not '
+                                         f'generated')
+            checked += len(moves)
+            if not accepted:
+                break
+            move = rng.choice(accepted)
+            game.push_move(move)
+            twin.push_move(move)
+    return checked
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description='Counts Towerkrieg move sequences from the start position')
+    parser.add_argument('depth', type=int, nargs='?', help='perft depth; checks the reference counts if omitted')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='bitboard')
+    parser.add_argument('--divide', action='store_true', help='break the count down by first move')
+    parser.add_argument('--max-depth', type=int, default=2,
+                        help='deepest reference count checked; depth 3 takes minutes')
+    parser.add_argument('--generation', action='store_true',
+                        help='check on random games that the generated moves and legal action masks obey the rule '
+                             'variants')
+    args = parser.parse_args(argv)
+
+    game_class = BACKENDS[args.backend]
+    if args.generation:
+        for config in GENERATION_CONFIGS:
+            start = time.perf_counter()
+            checked = check_generation(game_class, config)
+            print(f'{config}: {checked} moves checked    {time.perf_counter() - start:.2f} s')
+        try:
+            # NumPy is optional, and only the masks need it
+            import towerkrieg_env
+        except ImportError:
+            print('legal action masks not checked: NumPy is not installed')
+            return
+        for config in MASK_CONFIGS:
+            start = time.perf_counter()
+            checked = towerkrieg_env.check_masks(game_class, config)
+            print(f'{config}: legal action masks of {checked} positions checked    '
+                  f'{time.perf_counter() - start:.2f} s')
+        return
+    if args.depth is None:
+        for depth, expected, counted, seconds in check(game_class, args.max_depth):
+            print(f'perft({depth}) = {counted}    reference {expected}    {seconds:.2f} s')
+        return
+
+    start = time.perf_counter()
+    if args.divide:
+        counts = divide(game_class(), args.depth)
+        for move, count in counts.items():
+            print(f'{move[0]} -> {move[1]}: {count}')
+        total = sum(counts.values())
+    else:
+        total = perft(game_class(), args.depth)
+    print(f'perft({args.depth}) = {total}    {time.perf_counter() - start:.2f} s')
+
+
+if __name__ == "__main__":
+    main()
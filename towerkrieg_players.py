@@ -0,0 +1,60 @@
+import random
+
+
+class RandomPlayer():
+    """
+    Plays a uniformly random move among the moves accepted by the game
+    """
+
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+
+    def choose_move(self, game):
+        """
+        :param game: game in the position to play; left unchanged
+        :return:     ((s_row, s_col), (e_row, e_col)), None if the player to move has no move
+        """
+
+        moves = game.all_legal_moves(game.get_turn())
+        self.rng.shuffle(moves)
+        for move in moves:
+            # Skip moves that disrupt the player's sole ring
+            if game.push_move(move):
+                game.pop_move()
+                return move
+        return None
+
+
+class GreedyCapturePlayer():
+    """
+    Plays the move capturing the most opponent stones, or winning the game outright, among the moves accepted
+    by the game; ties are broken at random
+    """
+
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+
+    def choose_move(self, game):
+        """
+        :param game: game in the position to play; left unchanged
+        :return:     ((s_row, s_col), (e_row, e_col)), None if the player to move has no move
+        """
+
+        player = game.get_turn()
+        opponent = 'o' if player == 'x' else 'x'
+        stones = game.get_stone_count(opponent)
+        best, best_gain = [], -1
+        for move in game.all_legal_moves(player):
+            if not game.push_move(move):
+                continue
+            gain = stones - game.get_stone_count(opponent)
+            status = game.get_status()
+            if status != 'incomplete':
+                # A won game beats any capture; a lost one is played only as a last resort
+                gain = stones + 1 if (status == 'black_victory') == (player == 'x') else -0.5
+            game.pop_move()
+            if gain > best_gain:
+                best, best_gain = [move], gain
+            elif gain == best_gain:
+                best.append(move)
+        return self.rng.choice(best) if best else None
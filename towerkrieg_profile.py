@@ -0,0 +1,200 @@
+import contextlib
+import functools
+import heapq
+import itertools
+import sys
+import threading
+import time
+
+import towerkrieg
+
+
+# Instrumented methods. Subclasses overriding them (e.g. BitboardTowerkriegGame) are instrumented as well
+# Besides the original move pipeline, push_move / pop_move, move generation and ring tracking are the hot paths of
+#     searches and self-play
+TARGETS = {towerkrieg.TowerkriegGame: ['make_footprint', 'propagate_board', 'ring_scan', 'advance_board',
+                                       'moves_available', 'convert_axes', 'push_move', 'pop_move',
+                                       'all_legal_moves', 'cast_rays', '_cast_rays', 'find_rings', 'update_rings']}
+
+# Instrumentation wraps the methods only while enabled, so disabled instrumentation costs nothing
+_enabled = False
+_allocations = False
+# Per thread, names of the instrumented methods being timed, so a thread's nested calls are counted once
+_local = threading.local()
+_patched = []
+_sample = 0
+_sequence = itertools.count()
+_slowest = []
+_stats = {}
+
+
+def is_enabled():
+    return _enabled
+
+
+def _classes(cls):
+    yield cls
+    for subclass in cls.__subclasses__():
+        yield from _classes(subclass)
+
+
+def _active():
+    # Set of the methods being timed on the calling thread
+    active = getattr(_local, 'active', None)
+    if active is None:
+        active = _local.active = set()
+    return active
+
+
+def _timed(name, method):
+    stats = _stats.setdefault(name, [0, 0.0, 0])
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        active = _active()
+        if name in active:
+            # Nested call of the same method (e.g. an override calling super()) is counted once
+            return method(*args, **kwargs)
+        active.add(name)
+        blocks = sys.getallocatedblocks() if _allocations else 0
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            stats[1] += time.perf_counter() - start
+            stats[0] += 1
+            if _allocations:
+                stats[2] += sys.getallocatedblocks() - blocks
+            active.discard(name)
+    return wrapper
+
+
+def _position(game):
+    # Cheap copy of the position, rendered only when exported
+    if hasattr(game, 'get_bitboards'):
+        return game.get_state(with_hash=False)
+    return tuple(tuple(row) for row in game.get_gameboard())
+
+
+def _render(position):
+    if isinstance(position, towerkrieg.GameState):
+        size, black, white = position.size, position.black, position.white
+        return [''.join('x' if black >> (row * size + col) & 1 else 'o' if white >> (row * size + col) & 1 else '.'
+                        for col in range(size)) for row in range(size)]
+    return [''.join(square or '.' for square in row) for row in position]
+
+
+def _sampled(method):
+    @functools.wraps(method)
+    def wrapper(game, move):
+        active = _active()
+        if 'sample' in active:
+            return method(game, move)
+        active.add('sample')
+        position, turn = _position(game), game.get_turn()
+        start = time.perf_counter()
+        try:
+            return method(game, move)
+        finally:
+            seconds = time.perf_counter() - start
+            active.discard('sample')
+            entry = (seconds, next(_sequence), move, turn, position)
+            if len(_slowest) < _sample:
+                heapq.heappush(_slowest, entry)
+            elif seconds > _slowest[0][0]:
+                heapq.heapreplace(_slowest, entry)
+    return wrapper
+
+
+def enable(allocations=False, sample=0):
+    """
+    Instruments the hot paths of every game class loaded so far
+
+    :param allocations: also count net allocated memory blocks per call (slower)
+    :param sample:      number of slowest moves kept with their positions, 0 for none
+    """
+
+    global _enabled, _allocations, _sample
+    if _enabled:
+        disable()
+    _enabled, _allocations, _sample = True, allocations, sample
+    for base, names in TARGETS.items():
+        for cls in _classes(base):
+            for name in names:
+                if name in cls.__dict__:
+                    _patched.append((cls, name, cls.__dict__[name]))
+                    setattr(cls, name, _timed(name, cls.__dict__[name]))
+            if sample and 'push_move' in cls.__dict__:
+                _patched.append((cls, 'push_move', cls.__dict__['push_move']))
+                setattr(cls, 'push_move', _sampled(cls.__dict__['push_move']))
+
+
+def disable():
+    # Restores the original methods; collected statistics are kept until reset
+    global _enabled, _local
+    while _patched:
+        cls, name, method = _patched.pop()
+        setattr(cls, name, method)
+    _local = threading.local()
+    _enabled = False
+
+
+def reset():
+    _stats.clear()
+    _slowest.clear()
+
+
+@contextlib.contextmanager
+def profiling(allocations=False, sample=0):
+    """
+    Context manager instrumenting the hot paths for the duration of a block
+
+    :param allocations: also count net allocated memory blocks per call
+    :param sample:      number of slowest moves kept with their positions
+    """
+
+    enable(allocations, sample)
+    try:
+        yield sys.modules[__name__]
+    finally:
+        disable()
+
+
+def snapshot():
+    """
+    Returns the collected statistics
+
+    :return: dictionary of methods -> {method: {calls, seconds, allocated_blocks}} and slowest_moves -> list of
+             {seconds, move, turn, board} dictionaries, slowest first
+    """
+
+    methods = {name: {'calls': calls, 'seconds': seconds, 'allocated_blocks': blocks}
+               for name, (calls, seconds, blocks) in _stats.items() if calls}
+    slowest = [{'seconds': seconds, 'move': move, 'turn': turn, 'board': _render(position)}
+               for seconds, _, move, turn, position in sorted(_slowest, reverse=True)]
+    return {'methods': methods, 'slowest_moves': slowest}
+
+
+def prometheus(prefix='towerkrieg'):
+    """
+    Returns the collected statistics in the Prometheus text exposition format
+
+    :param prefix: metric name prefix
+    :return:       text
+    """
+
+    methods = snapshot()['methods']
+    lines = []
+    for metric, field, kind, text in [('calls_total', 'calls', 'counter', 'Calls of instrumented methods'),
+                                      ('seconds_total', 'seconds', 'counter', 'Time spent in instrumented methods'),
+                                      ('allocated_blocks', 'allocated_blocks', 'gauge',
+                                       'Net memory blocks allocated by instrumented methods')]:
+        lines.append(f'# HELP {prefix}_{metric} {text}')
+        lines.append(f'# TYPE {prefix}_{metric} {kind}')
+        for name, values in sorted(methods.items()):
+            lines.append(f'{prefix}_{metric}{{method="{name}"}} {values[field]}')
+    if _slowest:
+        lines.append(f'# HELP {prefix}_slowest_move_seconds Slowest sampled moves')
+        lines.append(f'# TYPE {prefix}_slowest_move_seconds gauge')
+        lines.append(f'{prefix}_slowest_move_seconds {max(_slowest)[0]}')
+    return '\n'.join(lines) + '\n'
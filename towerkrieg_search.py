@@ -0,0 +1,292 @@
+import time
+
+import towerkrieg_transposition
+
+
+# Score of a won position. Wins found closer to the root score higher
+WIN = 100000
+
+# Weights of the default evaluation
+MATERIAL_WEIGHT = 10
+RING_WEIGHT = 300
+EXPOSURE_WEIGHT = 15
+EXPOSURE_REACH = 3
+
+
+def opponent(player):
+    return 'o' if player == 'x' else 'x'
+
+
+def evaluate(game):
+    """
+    Default evaluation: material, ring count and ring exposure, from the point of view of the player to move
+    A ring is exposed by every opposing stone within EXPOSURE_REACH squares of its center
+
+    :param game: TowerkriegGame or BitboardTowerkriegGame
+    :return:     score, positive if the player to move is ahead
+    """
+
+    score = 0
+    player = game.get_turn()
+    for side, sign in ((player, 1), (opponent(player), -1)):
+        score += sign * MATERIAL_WEIGHT * game.get_stone_count(side)
+        for row, col in game.get_rings(side):
+            score += sign * (RING_WEIGHT
+                             - EXPOSURE_WEIGHT * game.count_stones_near(opponent(side), row, col, EXPOSURE_REACH))
+    return score
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside the search when the time or node budget runs out
+    """
+    pass
+
+
+class SearchResult():
+    """
+    Outcome of the last completed iteration of a search
+    """
+
+    def __init__(self, move, score, depth, nodes, seconds, pv):
+        """
+        :param move:    best move ((s_row, s_col), (e_row, e_col)), None if the player to move has no move
+        :param score:   score of the best move for the player to move
+        :param depth:   depth of the last completed iteration
+        :param nodes:   nodes visited by the whole search
+        :param seconds: time spent by the whole search
+        :param pv:      principal variation, list of moves starting with the best move
+        """
+
+        self.move = move
+        self.score = score
+        self.depth = depth
+        self.nodes = nodes
+        self.seconds = seconds
+        self.pv = pv
+        self.nps = nodes / seconds if seconds > 0 else 0.0
+
+    def __repr__(self):
+        return (f'SearchResult(move={self.move}, score={self.score}, depth={self.depth}, nodes={self.nodes}, '
+                f'nps={self.nps:.0f}, pv={self.pv})')
+
+
+class AlphaBetaSearch():
+    """
+    Negamax alpha-beta search with iterative deepening
+    Moves are applied in place with push_move / pop_move, so any game backend implementing the
+        TowerkriegGame move API can be searched. BitboardTowerkriegGame is by far the fastest
+    Move ordering: transposition table move, then captures, then killer moves
+    """
+
+    # Engine name of the results kept in a PositionCache: negamax scores on the WIN scale and iteration depths
+    CACHE_ENGINE = 'alphabeta'
+
+    def __init__(self, evaluate=evaluate, max_depth=64, time_limit=None, node_limit=None, table=None, report=None,
+                 cache=None):
+        """
+        :param evaluate:   evaluation function of a game, from the point of view of the player to move
+        :param max_depth:  deepest iteration
+        :param time_limit: seconds per move, None for no limit
+        :param node_limit: nodes per move, None for no limit
+        :param table:      TranspositionTable shared between searches, a private table if None
+        :param report:     callable receiving the SearchResult of every completed iteration
+        :param cache:      towerkrieg_cache.PositionCache of root results shared across searches and processes
+
+        Private data members:
+            _deadline
+            _killers
+            _nodes
+            _stopped
+        """
+
+        self.evaluate = evaluate
+        self.max_depth = max_depth
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.table = table if table is not None else towerkrieg_transposition.TranspositionTable()
+        self.report = report
+        self.cache = cache
+        self._deadline = None
+        self._killers = {}
+        self._nodes = 0
+        self._stopped = False
+
+    def choose_move(self, game):
+        return self.search(game).move
+
+    def stop(self):
+        # Ends a search running in another thread at its next budget check. Searches started before resume is
+        # called stop at once as well, so a stop arriving just before a search starts is not lost
+        self._stopped = True
+        self._deadline = 0.0
+
+    def resume(self):
+        # Lets the next search run its full budget after stop
+        self._stopped = False
+
+    def search(self, game):
+        """
+        Searches the position of a game to increasing depth until the depth, time or node budget runs out
+        The game is left in its original position
+
+        :param game: game to search; must not be finished
+        :return:     SearchResult of the last completed iteration
+        """
+
+        start = time.perf_counter()
+        self._deadline = start + self.time_limit if self.time_limit is not None else None
+        self._killers = {}
+        self._nodes = 0
+
+        if self.cache is not None:
+            entry = self.cache.probe(game, self.CACHE_ENGINE)
+            if entry is not None and entry[1] is not None:
+                value, move, depth, visits = entry
+                if depth >= self.max_depth:
+                    # Cached result is as deep as this search can go
+                    return SearchResult(move, value, depth, 0, time.perf_counter() - start, [move])
+                if self.table.probe(game.get_hash()) is None:
+                    # Cached best move is searched first at the root
+                    self.table.store(game.get_hash(), 0, 0, towerkrieg_transposition.TranspositionTable.EXACT, move)
+
+        result = SearchResult(None, 0, 0, 0, 0.0, [])
+        for depth in range(1, self.max_depth + 1):
+            try:
+                score, pv = self._negamax(game, depth, -WIN - 1, WIN + 1, 0)
+            except SearchTimeout:
+                break
+            elapsed = time.perf_counter() - start
+            result = SearchResult(pv[0] if pv else None, score, depth, self._nodes, elapsed, pv)
+            if self.report is not None:
+                self.report(result)
+            if not pv or abs(score) >= WIN - self.max_depth:
+                # No move or forced win / loss found. Deeper iterations cannot change the outcome
+                break
+            if self._deadline is not None and time.perf_counter() + elapsed > self._deadline:
+                # Next iteration would not complete within the time budget
+                break
+
+        if result.move is None and result.depth == 0:
+            # Budget ran out during the first iteration. Fall back on the first legal move
+            for move in self.order_moves(game, game.all_legal_moves(game.get_turn()), None, 0):
+                if game.push_move(move):
+                    game.pop_move()
+                    result = SearchResult(move, 0, 0, self._nodes, time.perf_counter() - start, [move])
+                    break
+        elif self.cache is not None and result.move is not None:
+            self.cache.store(game, result.score, result.move, result.depth, result.nodes, self.CACHE_ENGINE)
+        return result
+
+    def order_moves(self, game, moves, best, ply):
+        """
+        Sorts moves for the search: best move from the transposition table, captures, killer moves, others
+
+        :param game:  game in the position of the moves
+        :param moves: list of moves
+        :param best:  move stored in the transposition table, if any
+        :param ply:   distance from the root
+        :return:      sorted list of moves
+        """
+
+        killers = self._killers.get(ply, ())
+
+        def rank(move):
+            if move == best:
+                return 0
+            if game.is_capture(move):
+                return 1
+            if move in killers:
+                return 2
+            return 3
+
+        return sorted(moves, key=rank)
+
+    def _check_budget(self):
+        if self.node_limit is not None and self._nodes >= self.node_limit:
+            raise SearchTimeout
+        if self._stopped or self._deadline is not None and time.perf_counter() > self._deadline:
+            raise SearchTimeout
+
+    def _negamax(self, game, depth, alpha, beta, ply):
+        """
+        Alpha-beta search of the current position of a game
+
+        :param game:  game in the position to search
+        :param depth: remaining depth
+        :param alpha: lower bound of the window
+        :param beta:  upper bound of the window
+        :param ply:   distance from the root
+        :return:      score  (score for the player to move)
+                      pv     (principal variation from this position)
+        """
+
+        self._nodes += 1
+        if self._nodes & 255 == 0:
+            self._check_budget()
+
+        status = game.get_status()
+        if status != 'incomplete':
+            winner = 'x' if status == 'black_victory' else 'o'
+            return (WIN - ply if winner == game.get_turn() else -(WIN - ply)), []
+        if depth == 0:
+            return self.evaluate(game), []
+
+        # Probe the transposition table. Win scores are stored relative to the node
+        key = game.get_hash()
+        alpha_orig = alpha
+        best = None
+        entry = self.table.probe(key)
+        if entry is not None:
+            e_depth, e_value, e_flag, best = entry
+            if e_value >= WIN - 1000:
+                e_value -= ply
+            elif e_value <= -WIN + 1000:
+                e_value += ply
+            if e_depth >= depth and ply > 0:
+                if e_flag == towerkrieg_transposition.TranspositionTable.EXACT:
+                    return e_value, [best] if best else []
+                if e_flag == towerkrieg_transposition.TranspositionTable.LOWER:
+                    alpha = max(alpha, e_value)
+                else:
+                    beta = min(beta, e_value)
+                if alpha >= beta:
+                    return e_value, [best] if best else []
+
+        best_score, best_pv, legal = -WIN - 1, [], False
+        for move in self.order_moves(game, game.all_legal_moves(game.get_turn()), best, ply):
+            if not game.push_move(move):
+                # Move disrupts player's sole ring
+                continue
+            legal = True
+            try:
+                score, pv = self._negamax(game, depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                game.pop_move()
+            score = -score
+            if score > best_score:
+                best_score, best_pv = score, [move] + pv
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                if not game.is_capture(move):
+                    self._killers[ply] = (move,) + self._killers.get(ply, ())[:1]
+                break
+
+        if not legal:
+            # Player to move has no move. Scored as a draw
+            return 0, []
+
+        if best_score <= alpha_orig:
+            flag = towerkrieg_transposition.TranspositionTable.UPPER
+        elif best_score >= beta:
+            flag = towerkrieg_transposition.TranspositionTable.LOWER
+        else:
+            flag = towerkrieg_transposition.TranspositionTable.EXACT
+        stored = best_score
+        if stored >= WIN - 1000:
+            stored += ply
+        elif stored <= -WIN + 1000:
+            stored -= ply
+        self.table.store(key, depth, stored, flag, best_pv[0] if best_pv else None)
+        return best_score, best_pv
@@ -0,0 +1,322 @@
+import os
+import struct
+import time
+
+import towerkrieg_bitboard
+import towerkrieg_players
+
+
+# Shard layout: fixed-size header, then fixed-width records of one position each
+# Every square of a board takes 2 bits (0 empty, 1 Black, 2 White): square row * 20 + col sits at bits
+#     2 * (square % 4) of byte square // 4, so a board takes 100 bytes
+# A sidecar index (<shard>.idx) lists the first record, record count and outcome of every game
+MAGIC = b'TKSP'
+VERSION = 1
+HEADER = struct.Struct('<4sHHIHxxQ')
+HEADER_SIZE = 64
+BOARD_BYTES = 100
+POLICY_K = 16
+INDEX = struct.Struct('<QIb3x')
+
+# Record: board, player to move (1 Black, 2 White), outcome for Black (1 win, -1 loss, 0 draw), ply, game,
+#     move played (s_row, s_col, e_row, e_col), POLICY_K policy moves and their weights (scaled to 65535)
+RECORD = struct.Struct(f'<{BOARD_BYTES}sBbHI4s{4 * POLICY_K}s{POLICY_K}H')
+
+
+def _spread_table():
+    # Spreads the 8 bits of a byte over the even bits of a 16-bit integer
+    table = []
+    for byte in range(256):
+        spread = 0
+        for i in range(8):
+            if byte >> i & 1:
+                spread |= 1 << (2 * i)
+        table.append(spread)
+    return table
+
+
+_SPREAD = _spread_table()
+
+
+def _spread(bits):
+    spread = 0
+    for i, byte in enumerate(bits.to_bytes(BOARD_BYTES // 2, 'little')):
+        spread |= _SPREAD[byte] << (16 * i)
+    return spread
+
+
+def pack_board(game):
+    """
+    Packs the game board into 2 bits per square
+
+    :param game: TowerkriegGame or BitboardTowerkriegGame on the standard 20 x 20 board
+    :return:     BOARD_BYTES bytes
+    """
+
+    if game.get_config().size != 20:
+        raise ValueError('self-play records hold 20 x 20 boards')
+
+    if hasattr(game, 'get_bitboards'):
+        black, white = game.get_bitboards()
+        return (_spread(black) | _spread(white) << 1).to_bytes(BOARD_BYTES, 'little')
+
+    codes = {'x': 1, 'o': 2, None: 0}
+    packed = 0
+    for row, squares in enumerate(game.get_gameboard()):
+        for col, square in enumerate(squares):
+            packed |= codes[square] << (2 * (row * 20 + col))
+    return packed.to_bytes(BOARD_BYTES, 'little')
+
+
+class RecordWriter():
+    """
+    Appends self-play games to a shard file and its index
+    """
+
+    def __init__(self, path):
+        """
+        :param path: shard file; created, or appended to if it exists
+
+        Private data members:
+            _count
+            _file
+            _index
+        """
+
+        self.path = path
+        if os.path.exists(path):
+            self._file = open(path, 'r+b')
+            self._count = read_header(path)['records']
+            self._file.seek(HEADER_SIZE + self._count * RECORD.size)
+        else:
+            self._file = open(path, 'w+b')
+            self._count = 0
+            self._write_header()
+            self._file.seek(HEADER_SIZE)
+        self._index = open(path + '.idx', 'ab')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _write_header(self):
+        self._file.seek(0)
+        header = HEADER.pack(MAGIC, VERSION, HEADER_SIZE, RECORD.size, POLICY_K, self._count)
+        self._file.write(header.ljust(HEADER_SIZE, b'\0'))
+
+    def write_game(self, positions, outcome):
+        """
+        Appends the positions of a finished game
+
+        :param positions: list of (packed board, turn, move, policy) per ply, policy being a list of
+                          (move, weight) pairs
+        :param outcome:   1 / -1 if Black won / lost, 0 for a draw
+        """
+
+        # Games are numbered by their position in the index
+        game = self._index.tell() // INDEX.size
+        chunk = bytearray()
+        for ply, (board, turn, move, policy) in enumerate(positions):
+            policy = sorted(policy, key=lambda entry: -entry[1])[:POLICY_K]
+            total = sum(weight for _, weight in policy) or 1
+            moves = b''.join(bytes((m[0][0], m[0][1], m[1][0], m[1][1])) for m, _ in policy)
+            weights = [round(65535 * weight / total) for _, weight in policy]
+            weights += [0] * (POLICY_K - len(weights))
+            chunk += RECORD.pack(board, 1 if turn == 'x' else 2, outcome, ply, game,
+                                 bytes((move[0][0], move[0][1], move[1][0], move[1][1])),
+                                 moves.ljust(4 * POLICY_K, b'\0'), *weights)
+        self._file.write(chunk)
+        self._index.write(INDEX.pack(self._count, len(positions), outcome))
+        self._count += len(positions)
+
+    def close(self):
+        if self._file is not None:
+            self._write_header()
+            self._file.close()
+            self._index.close()
+            self._file = None
+
+
+def read_header(path):
+    """
+    Reads the header of a shard
+
+    :param path: shard file
+    :return:     dictionary of version, header_size, record_size, policy_k and records
+    """
+
+    with open(path, 'rb') as shard:
+        magic, version, header_size, record_size, policy_k, records = HEADER.unpack(shard.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError(f'{path} is not a Towerkrieg self-play shard')
+    return {'version': version, 'header_size': header_size, 'record_size': record_size,
+            'policy_k': policy_k, 'records': records}
+
+
+def record_dtype():
+    """
+    NumPy structured dtype of a record, matching RECORD
+
+    :return: numpy.dtype
+    """
+
+    import numpy as np
+    return np.dtype([('board', 'u1', BOARD_BYTES), ('turn', 'u1'), ('outcome', 'i1'), ('ply', '<u2'),
+                     ('game', '<u4'), ('move', 'u1', 4), ('policy_moves', 'u1', (POLICY_K, 4)),
+                     ('policy_weights', '<u2', POLICY_K)])
+
+
+def open_records(path):
+    """
+    Maps the records of a shard for zero-copy random access
+
+    :param path: shard file
+    :return:     read-only numpy.memmap of record_dtype()
+    """
+
+    import numpy as np
+    header = read_header(path)
+    if header['record_size'] != RECORD.size or header['policy_k'] != POLICY_K:
+        raise ValueError(f'{path} uses an unsupported record layout')
+    return np.memmap(path, dtype=record_dtype(), mode='r', offset=header['header_size'],
+                     shape=(header['records'],))
+
+
+def read_index(path):
+    """
+    Reads the game index of a shard
+
+    :param path: shard file
+    :return:     list of (first record, record count, outcome) per game
+    """
+
+    with open(path + '.idx', 'rb') as index:
+        return list(INDEX.iter_unpack(index.read()))
+
+
+def unpack_boards(boards):
+    """
+    Unpacks 2-bit boards into int8 arrays
+
+    :param boards: (N, BOARD_BYTES) uint8 array, e.g. open_records(path)['board']
+    :return:       (N, 20, 20) int8 array of 1 (Black), -1 (White) and 0 (empty), as in towerkrieg_env
+    """
+
+    import numpy as np
+    codes = (np.asarray(boards)[..., None] >> np.array([0, 2, 4, 6], dtype=np.uint8)) & 3
+    values = np.array([0, 1, -1, 0], dtype=np.int8)[codes]
+    return values.reshape(-1, 20, 20)
+
+
+def play_game(player_b, player_w, max_moves=400):
+    """
+    Plays one self-play game and collects its positions
+
+    :param player_b:  Black player, with choose_move(game) or search(game)
+    :param player_w:  White player
+    :param max_moves: moves after which the game is a draw
+    :return:          positions  (see RecordWriter.write_game)
+                      outcome    (1 / -1 if Black won / lost, 0 for a draw); an illegal move loses the game
+    """
+
+    game = towerkrieg_bitboard.BitboardTowerkriegGame()
+    positions = []
+    while game.get_status() == 'incomplete' and len(positions) < max_moves:
+        player = player_b if game.get_turn() == 'x' else player_w
+        if hasattr(player, 'search'):
+            result = player.search(game)
+            move = result.move
+            # Visit counts of a tree search are the policy target; otherwise the move played
+            policy = list(getattr(result, 'visits', {move: 1}).items())
+        else:
+            move = player.choose_move(game)
+            policy = [(move, 1)]
+        if move is None:
+            break
+        positions.append((pack_board(game), game.get_turn(), move, policy))
+        if not game.make_move(move[0], move[1], 1):
+            # Illegal move forfeits the game, as in towerkrieg_tournament. Its position is not a training sample
+            positions.pop()
+            return positions, -1 if game.get_turn() == 'x' else 1
+
+    status = game.get_status()
+    outcome = 1 if status == 'black_victory' else -1 if status == 'white_victory' else 0
+    return positions, outcome
+
+
+def write_shard(path, games, player_factory, max_moves=400, seed=0):
+    """
+    Plays self-play games and appends them to one shard. Runs in a worker process for parallel generation
+
+    :param path:           shard file
+    :param games:          number of games
+    :param player_factory: picklable callable seed -> player
+    :param max_moves:      moves after which a game is a draw
+    :param seed:           seed of the players
+    :return:               number of positions written
+    """
+
+    written = 0
+    with RecordWriter(path) as writer:
+        for i in range(games):
+            player = player_factory(seed * 1000003 + i)
+            positions, outcome = play_game(player, player, max_moves)
+            writer.write_game(positions, outcome)
+            written += len(positions)
+    return written
+
+
+def generate(directory, games, workers=1, player_factory=towerkrieg_players.RandomPlayer, max_moves=400):
+    """
+    Generates self-play games into one shard per worker process
+
+    :param directory:      output directory
+    :param games:          total number of games
+    :param workers:        number of worker processes
+    :param player_factory: picklable callable seed -> player
+    :param max_moves:      moves after which a game is a draw
+    :return:               list of shard paths
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    paths = [os.path.join(directory, f'shard-{i:04d}.tks') for i in range(workers)]
+    shares = [games // workers + (i < games % workers) for i in range(workers)]
+    if workers == 1:
+        write_shard(paths[0], shares[0], player_factory, max_moves, 0)
+    else:
+        # Imported on demand: concurrent.futures pulls in logging, which would slow every worker's start
+        import concurrent.futures
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(write_shard, path, share, player_factory, max_moves, i)
+                       for i, (path, share) in enumerate(zip(paths, shares))]
+            for future in futures:
+                future.result()
+    return paths
+
+
+def main(argv=None, prog=None):
+    # Imported here: worker processes import the module for its game functions, which need no argparse
+    import argparse
+    parser = argparse.ArgumentParser(prog=prog, description='Generates Towerkrieg self-play training shards')
+    parser.add_argument('directory', help='output directory of the shards')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=1, help='worker processes, one shard each')
+    parser.add_argument('--player', default='random', help='player name or module:attribute factory, as in '
+                                                           'towerkrieg_tournament')
+    parser.add_argument('--max-moves', type=int, default=400, help='moves after which a game is a draw')
+    args = parser.parse_args(argv)
+
+    import towerkrieg_tournament
+    start = time.perf_counter()
+    paths = generate(args.directory, args.games, args.workers, towerkrieg_tournament.load_player(args.player),
+                     args.max_moves)
+    positions = sum(count for path in paths for _, count, _ in read_index(path))
+    print(f'{args.games} games, {positions} positions in {time.perf_counter() - start:.1f} s')
+    for path in paths:
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,494 @@
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import itertools
+import json
+import secrets
+import statistics
+import time
+
+import towerkrieg_bitboard
+import towerkrieg_players
+import towerkrieg_profile
+
+
+# Protocol: one JSON object per line in both directions
+# Requests carry an "op" and an optional "id", echoed in the reply so clients can match replies to requests:
+#     {"op": "seek"}                                    join matchmaking; "start" event once paired
+#     {"op": "move", "game": id, "move": [[r, c], [r, c]]}
+#     {"op": "resign", "game": id}
+#     {"op": "watch", "game": id}                       spectate; "state" reply, then "move" events
+#     {"op": "resume", "token": token}                  reclaim a seat after reconnecting
+#     {"op": "state", "game": id}
+#     {"op": "list"}
+#     {"op": "stats"}
+#     {"op": "metrics"}                                 towerkrieg_profile statistics in Prometheus text format
+# Replies carry "ok" (true / false, with "error") and the echoed "id". Events carry an "event" name instead:
+#     {"event": "start", "game": id, "colour": "x" | "o", "token": token}
+#     {"event": "move", "game": id, "move": [[r, c], [r, c]], "ply": n, "turn": "x" | "o", "status": status}
+# A game is dropped once it is over, after its last event is sent; requests naming it then fail
+# A client that leaves more than WRITE_BUFFER_LIMIT bytes of replies and events unread is disconnected
+DEFAULT_PORT = 7420
+COLOURS = ('x', 'o')
+WRITE_BUFFER_LIMIT = 1 << 20
+
+
+def encode(message):
+    return (json.dumps(message, separators=(',', ':')) + '\n').encode()
+
+
+def parse_move(move):
+    """
+    :param move: move of a request, [[s_row, s_col], [e_row, e_col]]
+    :return:     ((s_row, s_col), (e_row, e_col)); raises ValueError if the move is malformed
+    """
+
+    if (not isinstance(move, list) or len(move) != 2
+            or not all(isinstance(square, list) and len(square) == 2 for square in move)
+            or not all(type(element) is int for square in move for element in square)):
+        raise ValueError('move must be [[row, col], [row, col]]')
+    return tuple(tuple(square) for square in move)
+
+
+def board_rows(game):
+    """
+    :param game: game
+    :return:     list of strings of 'x', 'o' and '.', one per row
+    """
+
+    return [''.join(square or '.' for square in row) for row in game.get_gameboard()]
+
+
+class Match():
+    """
+    One hosted game: the game itself, its two seats and its spectators
+    """
+
+    def __init__(self, game_id, game_class=towerkrieg_bitboard.BitboardTowerkriegGame):
+        """
+        :param game_id:    id of the game
+        :param game_class: game backend
+
+        Private data members:
+            _resigned
+        """
+
+        self.game_id = game_id
+        self.game = game_class()
+        self.moves = []
+        self.tokens = {colour: secrets.token_hex(8) for colour in COLOURS}
+        self.seats = {colour: None for colour in COLOURS}
+        self.spectators = set()
+        self.lock = asyncio.Lock()
+        self._resigned = None
+
+    def get_status(self):
+        return self._resigned or self.game.get_status()
+
+    def resign(self, colour):
+        self._resigned = 'white_victory' if colour == 'x' else 'black_victory'
+
+    async def state(self):
+        # Moves are made in the executor under the lock, so the board is only read between moves
+        async with self.lock:
+            return {'game': self.game_id, 'board': board_rows(self.game), 'turn': self.game.get_turn(),
+                    'status': self.get_status(), 'ply': len(self.moves), 'moves': list(self.moves)}
+
+    def connections(self):
+        return [writer for writer in self.seats.values() if writer is not None] + list(self.spectators)
+
+
+class TowerkriegServer():
+    """
+    Hosts many concurrent games over TCP with a line-delimited JSON protocol (see the protocol notes above)
+    Games run on the event loop; move validation runs in an executor so a slow validation never stalls it
+    """
+
+    # Accepted moves whose latency is kept for the percentiles of get_stats
+    LATENCY_SAMPLES = 4096
+
+    def __init__(self, executor=None, game_class=towerkrieg_bitboard.BitboardTowerkriegGame):
+        """
+        :param executor:   concurrent.futures executor validating moves, a single worker thread if None
+        :param game_class: game backend
+
+        Private data members:
+            _connections
+            _finished
+            _ids
+            _latencies
+            _moves
+            _seeking
+            _server
+        """
+
+        self.executor = executor or concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.game_class = game_class
+        self.games = {}
+        self.tokens = {}
+        self._connections = set()
+        self._ids = itertools.count(1)
+        self._latencies = collections.deque(maxlen=self.LATENCY_SAMPLES)
+        self._moves = 0
+        self._finished = 0
+        self._seeking = None
+        self._server = None
+
+    async def start(self, host='127.0.0.1', port=DEFAULT_PORT):
+        self._server = await asyncio.start_server(self.handle_connection, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._connections):
+                writer.close()
+            await self._server.wait_closed()
+            # Let the connection handlers see their connections closed
+            while self._connections:
+                await asyncio.sleep(0.01)
+        self.executor.shutdown(wait=False)
+
+    async def handle_connection(self, reader, writer):
+        self._connections.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = {}
+                try:
+                    request = json.loads(line)
+                    reply = await self.dispatch(request, writer)
+                except (ValueError, KeyError, TypeError, IndexError) as error:
+                    request = request if isinstance(request, dict) else {}
+                    reply = {'ok': False, 'error': f'bad request: {error}'}
+                if 'id' in request:
+                    reply['id'] = request['id']
+                self.send(writer, reply)
+                # A client that stops reading its replies is not read from either
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._connections.discard(writer)
+            self.disconnect(writer)
+            writer.close()
+
+    def send(self, writer, message):
+        if writer.is_closing():
+            return
+        if writer.transport.get_write_buffer_size() > WRITE_BUFFER_LIMIT:
+            # Events are broadcast without waiting for slow readers, so their backlog is capped instead
+            writer.close()
+            return
+        writer.write(encode(message))
+
+    def disconnect(self, writer):
+        # Seats stay reserved for their token; the game continues once the player resumes
+        if self._seeking is writer:
+            self._seeking = None
+        for match in self.games.values():
+            match.spectators.discard(writer)
+            for colour, seat in match.seats.items():
+                if seat is writer:
+                    match.seats[colour] = None
+
+    async def dispatch(self, request, writer):
+        op = request['op']
+        if op == 'seek':
+            return self.seek(writer)
+        if op == 'move':
+            return await self.move(request['game'], request['move'], writer)
+        if op == 'resign':
+            return self.resign(request['game'], writer)
+        if op == 'watch':
+            match = self.games[request['game']]
+            match.spectators.add(writer)
+            return dict(await match.state(), ok=True)
+        if op == 'resume':
+            return await self.resume(request['token'], writer)
+        if op == 'state':
+            return dict(await self.games[request['game']].state(), ok=True)
+        if op == 'list':
+            return {'ok': True, 'games': [{'game': game_id, 'ply': len(match.moves), 'status': match.get_status()}
+                                          for game_id, match in self.games.items()]}
+        if op == 'stats':
+            return dict(self.get_stats(), ok=True)
+        if op == 'metrics':
+            return {'ok': True, 'enabled': towerkrieg_profile.is_enabled(), 'metrics': towerkrieg_profile.prometheus()}
+        return {'ok': False, 'error': f'unknown op {op}'}
+
+    def seek(self, writer):
+        """
+        Pairs the connection with the longest waiting one; the first of a pair plays Black
+        """
+
+        if self._seeking is None or self._seeking is writer or self._seeking.is_closing():
+            self._seeking = writer
+            return {'ok': True, 'waiting': True}
+        match = self.create_game()
+        for colour, seat in zip(COLOURS, (self._seeking, writer)):
+            match.seats[colour] = seat
+            self.send(seat, {'event': 'start', 'game': match.game_id, 'colour': colour,
+                             'token': match.tokens[colour]})
+        self._seeking = None
+        return {'ok': True, 'waiting': False, 'game': match.game_id}
+
+    def create_game(self):
+        match = Match(next(self._ids), self.game_class)
+        self.games[match.game_id] = match
+        for colour in COLOURS:
+            self.tokens[match.tokens[colour]] = (match.game_id, colour)
+        return match
+
+    def drop_game(self, match):
+        # Finished games are forgotten, so a long-running server holds only the games in progress
+        if self.games.pop(match.game_id, None) is None:
+            return
+        for colour in COLOURS:
+            self.tokens.pop(match.tokens[colour], None)
+        self._finished += 1
+
+    def seat_of(self, match, writer):
+        for colour, seat in match.seats.items():
+            if seat is writer:
+                return colour
+        return None
+
+    async def move(self, game_id, move, writer):
+        received = time.perf_counter()
+        match = self.games[game_id]
+        colour = self.seat_of(match, writer)
+        move = parse_move(move)
+        async with match.lock:
+            if match.get_status() != 'incomplete':
+                return {'ok': False, 'error': 'game is over'}
+            if colour != match.game.get_turn():
+                return {'ok': False, 'error': 'not your turn'}
+            accepted = await asyncio.get_running_loop().run_in_executor(self.executor, match.game.make_move,
+                                                                        move[0], move[1], 1)
+            if not accepted:
+                return {'ok': False, 'error': 'illegal move'}
+            match.moves.append([list(move[0]), list(move[1])])
+            event = {'event': 'move', 'game': game_id, 'move': match.moves[-1], 'ply': len(match.moves),
+                     'turn': match.game.get_turn(), 'status': match.get_status()}
+            for connection in match.connections():
+                self.send(connection, event)
+            if event['status'] != 'incomplete':
+                self.drop_game(match)
+        self._latencies.append(time.perf_counter() - received)
+        self._moves += 1
+        return {'ok': True, 'status': event['status']}
+
+    def resign(self, game_id, writer):
+        match = self.games[game_id]
+        colour = self.seat_of(match, writer)
+        if colour is None or match.get_status() != 'incomplete':
+            return {'ok': False, 'error': 'cannot resign'}
+        match.resign(colour)
+        for connection in match.connections():
+            self.send(connection, {'event': 'resign', 'game': game_id, 'colour': colour,
+                                   'status': match.get_status()})
+        self.drop_game(match)
+        return {'ok': True, 'status': match.get_status()}
+
+    async def resume(self, token, writer):
+        if token not in self.tokens:
+            return {'ok': False, 'error': 'unknown token'}
+        game_id, colour = self.tokens[token]
+        match = self.games[game_id]
+        match.seats[colour] = writer
+        return dict(await match.state(), ok=True, colour=colour)
+
+    def get_stats(self):
+        """
+        Returns server statistics, including the latency of accepted moves from receipt to broadcast
+
+        :return: dictionary of games (hosted so far), active, moves and latency percentiles in milliseconds over
+                 the last LATENCY_SAMPLES moves
+        """
+
+        latencies = sorted(self._latencies)
+        stats = {'games': self._finished + len(self.games),
+                 'active': len(self.games),
+                 'moves': self._moves}
+        if latencies:
+            stats.update(mean_ms=1000 * statistics.fmean(latencies),
+                         p50_ms=1000 * latencies[len(latencies) // 2],
+                         p99_ms=1000 * latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)],
+                         max_ms=1000 * latencies[-1])
+        return stats
+
+
+class TowerkriegClient():
+    """
+    asyncio client of TowerkriegServer
+    Requests return the server's reply; events (start, move, resign) are queued for next_event
+    """
+
+    def __init__(self):
+        """
+        Private data members:
+            _ids
+            _listener
+            _reader
+            _replies
+            _writer
+        """
+
+        self.events = asyncio.Queue()
+        self.latencies = []
+        self._ids = itertools.count(1)
+        self._listener = None
+        self._reader = None
+        self._replies = {}
+        self._writer = None
+
+    async def connect(self, host='127.0.0.1', port=DEFAULT_PORT):
+        self._reader, self._writer = await asyncio.open_connection(host, port)
+        self._listener = asyncio.ensure_future(self._listen())
+        return self
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._listener.cancel()
+            self._writer = None
+
+    async def _listen(self):
+        while True:
+            line = await self._reader.readline()
+            if not line:
+                break
+            message = json.loads(line)
+            if 'event' in message:
+                await self.events.put(message)
+            elif message.get('id') in self._replies:
+                self._replies.pop(message['id']).set_result(message)
+
+    async def request(self, op, **fields):
+        request_id = next(self._ids)
+        reply = asyncio.get_running_loop().create_future()
+        self._replies[request_id] = reply
+        self._writer.write(encode(dict(fields, op=op, id=request_id)))
+        await self._writer.drain()
+        return await reply
+
+    async def next_event(self, event=None):
+        # Returns the next event, skipping events of other names if one is given
+        while True:
+            message = await self.events.get()
+            if event is None or message['event'] == event:
+                return message
+
+    async def seek(self):
+        return await self.request('seek')
+
+    async def move(self, game_id, move):
+        # Round-trip latency of every move is kept in latencies
+        start = time.perf_counter()
+        reply = await self.request('move', game=game_id, move=[list(move[0]), list(move[1])])
+        self.latencies.append(time.perf_counter() - start)
+        return reply
+
+    async def resign(self, game_id):
+        return await self.request('resign', game=game_id)
+
+    async def watch(self, game_id):
+        return await self.request('watch', game=game_id)
+
+    async def resume(self, token):
+        return await self.request('resume', token=token)
+
+    async def state(self, game_id):
+        return await self.request('state', game=game_id)
+
+    async def stats(self):
+        return await self.request('stats')
+
+
+async def play_bot(host, port, seed, max_moves=200):
+    """
+    Connects a random player, seeks a game and plays it, mirroring the game locally to choose moves
+
+    :return: client, with the round-trip latency of its moves
+    """
+
+    client = await TowerkriegClient().connect(host, port)
+    player = towerkrieg_players.RandomPlayer(seed)
+    game = towerkrieg_bitboard.BitboardTowerkriegGame()
+    await client.seek()
+    start = await client.next_event('start')
+    ply = 0
+    while game.get_status() == 'incomplete' and ply < max_moves:
+        if game.get_turn() == start['colour']:
+            move = player.choose_move(game)
+            if move is None or not (await client.move(start['game'], move))['ok']:
+                await client.resign(start['game'])
+                break
+        event = await client.next_event()
+        if event['event'] == 'resign':
+            break
+        game.make_move(tuple(event['move'][0]), tuple(event['move'][1]), 1)
+        ply = event['ply']
+    await client.close()
+    return client
+
+
+async def load_test(games, host='127.0.0.1', port=0, max_moves=200):
+    """
+    Plays random bot games concurrently against an in-process server and measures move latency
+
+    :param games:     number of concurrent games
+    :param host:      server address
+    :param port:      server port, any free port if 0
+    :param max_moves: moves per game
+    :return:          server statistics, with client round-trip percentiles (rtt_*) and moves_per_sec added
+    """
+
+    server = TowerkriegServer()
+    port = await server.start(host, port)
+    start = time.perf_counter()
+    clients = await asyncio.gather(*(play_bot(host, port, seed, max_moves) for seed in range(2 * games)))
+    elapsed = time.perf_counter() - start
+    stats = server.get_stats()
+    await server.close()
+
+    rtts = sorted(latency for client in clients for latency in client.latencies)
+    if rtts:
+        stats.update(rtt_p50_ms=1000 * rtts[len(rtts) // 2],
+                     rtt_p99_ms=1000 * rtts[min(len(rtts) - 1, len(rtts) * 99 // 100)])
+    stats['moves_per_sec'] = stats['moves'] / elapsed
+    return stats
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description='Hosts Towerkrieg games over TCP')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--load-test', type=int, metavar='GAMES',
+                        help='play this many concurrent random games against an in-process server and report latency')
+    args = parser.parse_args(argv)
+
+    if args.load_test:
+        stats = asyncio.run(load_test(args.load_test, args.host, 0))
+        print(json.dumps(stats, indent=1))
+        return
+
+    async def serve():
+        server = TowerkriegServer()
+        port = await server.start(args.host, args.port)
+        print(f'Serving Towerkrieg on {args.host}:{port}')
+        await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
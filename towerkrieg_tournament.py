@@ -0,0 +1,306 @@
+import importlib
+import itertools
+import math
+import random
+import time
+
+import towerkrieg_bitboard
+import towerkrieg_mcts
+import towerkrieg_players
+import towerkrieg_search
+
+
+def alphabeta_player(seed):
+    return towerkrieg_search.AlphaBetaSearch(node_limit=2000)
+
+
+def mcts_player(seed):
+    return towerkrieg_mcts.MCTSPlayer(playouts=200, seed=seed)
+
+
+# Built-in players by name. A player factory is a picklable callable seed -> object with choose_move(game)
+PLAYERS = {'random': towerkrieg_players.RandomPlayer,
+           'greedy': towerkrieg_players.GreedyCapturePlayer,
+           'alphabeta': alphabeta_player,
+           'mcts': mcts_player}
+
+
+def load_player(name):
+    """
+    :param name: name in PLAYERS, or 'module:attribute' naming any player factory
+    :return:     player factory
+    """
+
+    if name in PLAYERS:
+        return PLAYERS[name]
+    module, _, attribute = name.partition(':')
+    if not attribute:
+        raise ValueError(f'unknown player {name}; use one of {sorted(PLAYERS)} or module:attribute')
+    return getattr(importlib.import_module(module), attribute)
+
+
+def play_game(factory_b, factory_w, seed, opening_plies=4, max_moves=300,
+              game_class=towerkrieg_bitboard.BitboardTowerkriegGame):
+    """
+    Plays one game. The opening is a number of random moves drawn from the seed, so both games of a colour-swapped
+    pair start from the same position
+
+    :param factory_b:     player factory of Black
+    :param factory_w:     player factory of White
+    :param seed:          seed of the opening and the players
+    :param opening_plies: random moves played before the players take over
+    :param max_moves:     moves, opening included, after which the game is a draw
+    :param game_class:    game backend
+    :return:              score   (score of Black: 1 win, 0.5 draw, 0 loss)
+                          moves   (number of moves played)
+    """
+
+    game = game_class()
+    opening = towerkrieg_players.RandomPlayer(seed)
+    players = {}
+    moves = 0
+    try:
+        players['x'] = factory_b(seed)
+        players['o'] = factory_w(seed)
+        while game.get_status() == 'incomplete' and moves < max_moves:
+            player = opening if moves < opening_plies else players[game.get_turn()]
+            move = player.choose_move(game)
+            if move is None:
+                # No move available: the game is drawn
+                break
+            if not game.make_move(move[0], move[1], 1):
+                # Illegal move forfeits the game
+                return (0.0 if game.get_turn() == 'x' else 1.0), moves
+            moves += 1
+    finally:
+        # Players holding resources (e.g. the worker pool of an MCTS player) release them however the game ends
+        for player in players.values():
+            if hasattr(player, 'close'):
+                player.close()
+
+    status = game.get_status()
+    return (1.0 if status == 'black_victory' else 0.0 if status == 'white_victory' else 0.5), moves
+
+
+def _play_pairing(task):
+    # Runs in a worker process. Scores are returned from the point of view of the first player of the pairing
+    first, second, factory_a, factory_b, seed, first_is_black, opening_plies, max_moves = task
+    if first_is_black:
+        score, moves = play_game(factory_a, factory_b, seed, opening_plies, max_moves)
+    else:
+        score, moves = play_game(factory_b, factory_a, seed, opening_plies, max_moves)
+        score = 1.0 - score
+    return first, second, score, moves
+
+
+def schedule(names, mode='round-robin', pairs=1, seed=0):
+    """
+    Lists the games of a tournament. Every pairing plays pairs of games on the same random opening with colours swapped
+
+    :param names: player names; in a gauntlet the first player meets every other one
+    :param mode:  'round-robin' or 'gauntlet'
+    :param pairs: colour-swapped game pairs per pairing
+    :param seed:  seed of the openings
+    :return:      list of (first, second, seed, first_is_black)
+    """
+
+    if mode == 'round-robin':
+        pairings = list(itertools.combinations(names, 2))
+    elif mode == 'gauntlet':
+        pairings = [(names[0], name) for name in names[1:]]
+    else:
+        raise ValueError(f'unknown tournament mode {mode}')
+    rng = random.Random(seed)
+    games = []
+    for first, second in pairings:
+        for _ in range(pairs):
+            opening = rng.getrandbits(32)
+            games.append((first, second, opening, True))
+            games.append((first, second, opening, False))
+    return games
+
+
+def elo_difference(score):
+    """
+    :param score: mean score, strictly between 0 and 1
+    :return:      Elo difference corresponding to the score
+    """
+
+    return -400 * math.log10(1 / score - 1)
+
+
+def elo_interval(wins, draws, losses):
+    """
+    Elo difference of a match with its 95% confidence interval, from the trinomial variance of the score
+
+    :return: elo, margin (None, None if no decisive information yet)
+    """
+
+    games = wins + draws + losses
+    if games == 0:
+        return None, None
+    score = (wins + draws / 2) / games
+    if score in (0.0, 1.0):
+        return None, None
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    low, high = max(score - margin, 1e-6), min(score + margin, 1 - 1e-6)
+    return elo_difference(score), (elo_difference(high) - elo_difference(low)) / 2
+
+
+def sprt(wins, draws, losses, elo0=0.0, elo1=10.0, alpha=0.05, beta=0.05):
+    """
+    Sequential probability ratio test of elo1 against elo0, with the normal approximation of the score
+    (log-likelihood ratio of the generalised SPRT)
+
+    :return: llr, lower bound, upper bound, verdict ('H1' accepted, 'H0' accepted or 'continue')
+    """
+
+    lower, upper = math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+    games = wins + draws + losses
+    if games == 0:
+        return 0.0, lower, upper, 'continue'
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    if variance == 0:
+        return 0.0, lower, upper, 'continue'
+    s0, s1 = (1 / (1 + 10 ** (-elo / 400)) for elo in (elo0, elo1))
+    llr = games * (s1 - s0) * (2 * score - s0 - s1) / (2 * variance)
+    verdict = 'H1' if llr >= upper else 'H0' if llr <= lower else 'continue'
+    return llr, lower, upper, verdict
+
+
+def ratings(results, names, iterations=200):
+    """
+    Fits Elo ratings to all results (Bradley-Terry model, draws as half points), the first player anchored at 0
+
+    :param results: dictionary of (first, second) -> [wins, draws, losses] of first
+    :param names:   player names
+    :return:        dictionary of name -> Elo
+    """
+
+    strength = {name: 1.0 for name in names}
+    for _ in range(iterations):
+        for name in names:
+            points, expected = 0.0, 0.0
+            for (first, second), (wins, draws, losses) in results.items():
+                if name not in (first, second):
+                    continue
+                other = second if name == first else first
+                games = wins + draws + losses
+                won = wins + draws / 2 if name == first else losses + draws / 2
+                points += won
+                expected += games / (strength[name] + strength[other])
+            # Prior of one draw against a virtual player of strength 1 keeps undefeated / winless players finite
+            strength[name] = (points + 0.5) / (expected + 1 / (strength[name] + 1))
+    anchor = strength[names[0]]
+    return {name: 400 * math.log10(strength[name] / anchor) for name in names}
+
+
+class Tournament():
+    """
+    Plays a round-robin or gauntlet tournament across a process pool and collects its statistics
+    """
+
+    def __init__(self, names, mode='round-robin', pairs=10, workers=1, opening_plies=4, max_moves=300, seed=0):
+        """
+        :param names:         player names, see load_player
+        :param mode:          'round-robin' or 'gauntlet' (the first player meets every other one)
+        :param pairs:         colour-swapped game pairs per pairing
+        :param workers:       worker processes, games run in this process if 1
+        :param opening_plies: random opening moves of every game pair
+        :param max_moves:     moves after which a game is a draw
+        :param seed:          seed of the openings
+        """
+
+        self.names = list(names)
+        self.factories = {name: load_player(name) for name in self.names}
+        self.mode = mode
+        self.pairs = pairs
+        self.workers = workers
+        self.opening_plies = opening_plies
+        self.max_moves = max_moves
+        self.seed = seed
+        self.results = {}
+        self.games = 0
+        self.moves = 0
+        self.seconds = 0.0
+
+    def run(self, report=None):
+        """
+        Plays all games of the tournament
+
+        :param report: callable receiving the tournament after every finished game
+        :return:       self
+        """
+
+        tasks = [(first, second, self.factories[first], self.factories[second], seed, first_is_black,
+                  self.opening_plies, self.max_moves)
+                 for first, second, seed, first_is_black in schedule(self.names, self.mode, self.pairs, self.seed)]
+        start = time.perf_counter()
+        if self.workers == 1:
+            for task in tasks:
+                self.record(*_play_pairing(task), start, report)
+        else:
+            import concurrent.futures
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) as pool:
+                futures = [pool.submit(_play_pairing, task) for task in tasks]
+                for future in concurrent.futures.as_completed(futures):
+                    self.record(*future.result(), start, report)
+        return self
+
+    def record(self, first, second, score, moves, start, report):
+        counts = self.results.setdefault((first, second), [0, 0, 0])
+        counts[0 if score == 1.0 else 1 if score == 0.5 else 2] += 1
+        self.games += 1
+        self.moves += moves
+        self.seconds = time.perf_counter() - start
+        if report is not None:
+            report(self)
+
+    def get_games_per_second(self):
+        return self.games / self.seconds if self.seconds > 0 else 0.0
+
+    def summary(self, elo0=None, elo1=None):
+        """
+        :param elo0: Elo of the SPRT null hypothesis, no SPRT if None
+        :param elo1: Elo of the SPRT alternative hypothesis
+        :return:     report text
+        """
+
+        lines = [f'{self.games} games, {self.moves} moves in {self.seconds:.1f} s: '
+                 f'{self.get_games_per_second():.2f} games/s']
+        for (first, second), (wins, draws, losses) in sorted(self.results.items()):
+            elo, margin = elo_interval(wins, draws, losses)
+            line = f'{first} vs {second}: +{wins} ={draws} -{losses}'
+            line += f'    Elo {elo:+.0f} +/- {margin:.0f}' if elo is not None else '    Elo n/a'
+            if elo0 is not None:
+                llr, lower, upper, verdict = sprt(wins, draws, losses, elo0, elo1)
+                line += f'    SPRT [{elo0}, {elo1}] LLR {llr:.2f} ({lower:.2f}, {upper:.2f}) {verdict}'
+            lines.append(line)
+        for name, elo in sorted(ratings(self.results, self.names).items(), key=lambda entry: -entry[1]):
+            lines.append(f'{name:>20} {elo:+7.0f}')
+        return '\n'.join(lines)
+
+
+def main(argv=None, prog=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog=prog, description='Plays Towerkrieg engines against each other')
+    parser.add_argument('players', nargs='+', help=f'{sorted(PLAYERS)} or module:attribute player factories')
+    parser.add_argument('--mode', choices=['round-robin', 'gauntlet'], default='round-robin')
+    parser.add_argument('--pairs', type=int, default=10, help='colour-swapped game pairs per pairing')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--openings', type=int, default=4, help='random opening moves per game pair')
+    parser.add_argument('--max-moves', type=int, default=300, help='moves after which a game is a draw')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sprt', type=float, nargs=2, metavar=('ELO0', 'ELO1'))
+    args = parser.parse_args(argv)
+
+    tournament = Tournament(args.players, args.mode, args.pairs, args.workers, args.openings, args.max_moves,
+                            args.seed)
+    tournament.run()
+    print(tournament.summary(*(args.sprt or (None, None))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+class TranspositionTable():
+    """
+    Fixed-size table of search results keyed by the Zobrist hash of a position (see TowerkriegGame.get_hash)
+    Every bucket holds two entries: a depth-preferred entry, replaced only by a search of equal or greater
+        depth, and an always-replace entry that keeps the most recent result pushed out of the first one
+    """
+
+    # Bound types of a stored value
+    EXACT = 0
+    LOWER = 1
+    UPPER = 2
+
+    def __init__(self, size=1 << 16):
+        """
+        Initializes an empty table
+
+        :param size: number of buckets, rounded down to a power of 2
+
+        Private data members:
+            _deep
+            _mask
+            _recent
+        """
+
+        size = 1 << (max(size, 1).bit_length() - 1)
+        self._mask = size - 1
+        self._deep = [None] * size
+        self._recent = [None] * size
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def __len__(self):
+        return sum(entry is not None for entry in self._deep) + sum(entry is not None for entry in self._recent)
+
+    def probe(self, key):
+        """
+        Looks up the stored result of a position
+
+        :param key: Zobrist hash of the position
+        :return:    (depth, value, flag, move) entry, None if the position is not stored
+        """
+
+        index = key & self._mask
+        for entry in (self._deep[index], self._recent[index]):
+            if entry is not None and entry[0] == key:
+                self.hits += 1
+                return entry[1:]
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, value, flag=EXACT, move=None):
+        """
+        Stores the result of a search
+
+        :param key:   Zobrist hash of the position
+        :param depth: remaining search depth of the result
+        :param value: evaluation of the position
+        :param flag:  EXACT, LOWER (fail-high) or UPPER (fail-low) bound
+        :param move:  best move found, if any
+        """
+
+        index = key & self._mask
+        entry = (key, depth, value, flag, move)
+        self.stores += 1
+        deep = self._deep[index]
+        if deep is None or deep[0] == key or depth >= deep[1]:
+            # Depth-preferred entry. The result it replaces moves to the always-replace entry
+            if deep is not None and deep[0] != key:
+                self._recent[index] = deep
+            elif self._recent[index] is not None and self._recent[index][0] == key:
+                self._recent[index] = None
+            self._deep[index] = entry
+        else:
+            self._recent[index] = entry
+
+    def clear(self):
+        self._deep = [None] * len(self._deep)
+        self._recent = [None] * len(self._recent)
+        self.hits = self.misses = self.stores = 0
+
+    def get_stats(self):
+        """
+        Returns the hit / miss counters of the table
+
+        :return: dictionary of hits, misses, stores, hit rate and number of filled entries
+        """
+
+        probes = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'stores': self.stores,
+                'hit_rate': self.hits / probes if probes else 0.0,
+                'entries': len(self)}